@@ -95,6 +95,7 @@ class TmdbMatcher:
 
             try:
                 # 匹配 TMDB
+                request_count = self.tmdb_service.request_count
                 success = self._match_single(resource)
 
                 if success:
@@ -106,8 +107,8 @@ class TmdbMatcher:
                         print(f"    💾 已提交 {batch_count} 条更新")
                         batch_count = 0
 
-                # 请求间隔，避免 API 限流
-                if idx < len(resources):
+                # 请求间隔，避免 API 限流（全部命中缓存时无需等待）
+                if idx < len(resources) and self.tmdb_service.request_count != request_count:
                     time.sleep(self.delay)
 
             except Exception as e:
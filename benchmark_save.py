@@ -0,0 +1,308 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转存流程性能测试
+功能：基于本地夸克模拟服务（quark_mock_server）构造不同规模的分享和任务，执行 do_save，
+     统计耗时、各接口请求数和峰值内存；每个场景先冷启动运行一次，再在缓存就绪、
+     分享无变化时重跑一次
+
+用法：
+    python benchmark_save.py                          # 运行全部场景，每个场景单独一个进程
+    python benchmark_save.py --scenario files_1000    # 只运行指定场景
+    python benchmark_save.py --latency 0.02 --json benchmark.json
+"""
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import quark_cache
+import quark_http
+from quark_mock_server import MockQuarkServer
+
+# 统计耗时的阶段：Quark 方法名
+PHASES = (
+    "update_savepath_fid",
+    "plan_save_task",
+    "execute_save_plan",
+    "do_rename_task",
+)
+
+
+def episode_names(prefix, count, start=1):
+    return [f"{prefix}.S01E{episode:04d}.1080p.mp4" for episode in range(start, start + count)]
+
+
+def task_for(pwd_id, savepath, **kwargs):
+    task = {
+        "taskname": savepath.strip("/"),
+        "shareurl": f"https://pan.quark.cn/s/{pwd_id}",
+        "savepath": savepath,
+        "pattern": "$TV",
+        "replace": "",
+    }
+    task.update(kwargs)
+    return task
+
+
+# ---------- 场景：build(state) -> (任务列表, 两次运行之间对分享的修改或 None) ----------
+
+
+def files_scenario(count):
+    def build(state):
+        state.add_share("bench", episode_names("Show", count))
+        return [task_for("bench", "/bench/files")], None
+
+    return build
+
+
+def nested_scenario(dirs, files_per_dir):
+    """分享内有多个子文件夹，任务按 update_subdir 递归更新；第二次运行前每个子文件夹新增 10 集"""
+
+    def build(state):
+        state.add_share("nested", [])
+        folder_fids = [
+            state.add_share_dir("nested", f"Season{index}", episode_names(f"S{index}", files_per_dir))
+            for index in range(dirs)
+        ]
+        tasks = [task_for("nested", "/bench/nested", update_subdir="Season\\d+")]
+
+        def update():
+            for index, fid in enumerate(folder_fids):
+                state.add_share_files(
+                    "nested", episode_names(f"S{index}", 10, files_per_dir + 1), fid
+                )
+
+        return tasks, update
+
+    return build
+
+
+def tasks_scenario(tasks, shares, files_per_share):
+    """多个任务共用少量分享，每个任务按集数区间匹配，模拟一个分享按季拆分成多个任务"""
+
+    def build(state):
+        for index in range(shares):
+            state.add_share(f"multi{index}", episode_names(f"Show{index}", files_per_share))
+        tasklist = []
+        for index in range(tasks):
+            share_index = index % shares
+            digit = index // shares % 10
+            tasklist.append(
+                task_for(
+                    f"multi{share_index}",
+                    f"/bench/multi{share_index}/part{digit}",
+                    pattern=f".*E\\d{{3}}{digit}.*\\.mp4",
+                )
+            )
+        return tasklist, None
+
+    return build
+
+
+def rename_scenario(count):
+    """转存后按规则重命名全部文件"""
+
+    def build(state):
+        state.add_share("rename", episode_names("Show", count))
+        return [
+            task_for(
+                "rename",
+                "/bench/rename",
+                pattern=".*S01E(\\d+).*\\.(mp4)",
+                replace="E\\1.\\2",
+            )
+        ], None
+
+    return build
+
+
+SCENARIOS = {
+    "files_10": files_scenario(10),
+    "files_100": files_scenario(100),
+    "files_1000": files_scenario(1000),
+    "files_10000": files_scenario(10000),
+    "nested_4x250": nested_scenario(4, 250),
+    "tasks_100": tasks_scenario(100, 10, 200),
+    "tasks_300": tasks_scenario(300, 30, 200),
+    "rename_1000": rename_scenario(1000),
+}
+
+
+def peak_rss_mb():
+    """进程峰值内存（MB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed_phases(account, timings):
+    """给账号的各阶段方法套上计时，累计到 timings"""
+    for name in PHASES:
+        method = getattr(account, name)
+
+        def wrapper(*args, _method=method, _name=name, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                timings[_name] = timings.get(_name, 0) + time.perf_counter() - start
+
+        setattr(account, name, wrapper)
+
+
+def run_once(server, account, tasklist):
+    import quark_auto_save
+
+    timings = {}
+    timed_phases(account, timings)
+    server.reset_stats()
+    quark_auto_save.NOTIFYS.clear()
+    start = time.perf_counter()
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        quark_auto_save.do_save(account, tasklist)
+    wall = time.perf_counter() - start
+    for name in PHASES:
+        # 恢复原方法，下次运行重新计时
+        vars(account).pop(name, None)
+    stats = dict(server.stats)
+    return {
+        "wall_s": round(wall, 3),
+        "requests": sum(count for key, count in stats.items() if key.startswith("/")),
+        "throttled": stats.get("throttled", 0),
+        "errors": stats.get("errors", 0),
+        "endpoints": {key: count for key, count in sorted(stats.items()) if key.startswith("/")},
+        "phases_s": {name: round(timings.get(name, 0), 3) for name in PHASES},
+        "notifys": len(quark_auto_save.NOTIFYS),
+    }
+
+
+def run_scenario(name, args):
+    """在当前进程中运行一个场景"""
+    cache_dir = tempfile.mkdtemp(prefix="quark_bench_")
+    quark_cache.QUARK_CACHE_DIR = cache_dir
+    quark_cache._caches.clear()
+    # 模拟服务不限速时，客户端也不限速，测的是代码本身的开销
+    quark_http._rate_limiter = quark_http.RateLimiter(
+        {"share": args.rate, "file": args.rate, "task": args.rate}
+    )
+
+    server = MockQuarkServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.server_rate,
+        task_polls=args.task_polls,
+    ).start()
+    quark_http.QUARK_BASE_URL = server.url
+    try:
+        import quark_auto_save
+
+        tasklist, update = SCENARIOS[name](server.state)
+        account = quark_auto_save.Quark("__uid=benchmark;", 0)
+        account.init()
+        result = {"scenario": name, "tasks": len(tasklist)}
+        result["cold"] = run_once(server, account, tasklist)
+        if update:
+            update()
+        result["warm"] = run_once(server, account, tasklist)
+        result["peak_rss_mb"] = peak_rss_mb()
+        account.close()
+        return result
+    finally:
+        server.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def run_isolated(name, args):
+    """在子进程中运行场景，使每个场景的峰值内存互不影响"""
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--scenario",
+        name,
+        "--no-isolate",
+        "--json",
+        "-",
+        "--latency",
+        str(args.latency),
+        "--jitter",
+        str(args.jitter),
+        "--error-rate",
+        str(args.error_rate),
+        "--server-rate",
+        str(args.server_rate),
+        "--rate",
+        str(args.rate),
+        "--task-polls",
+        str(args.task_polls),
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)[0]
+
+
+def print_table(results):
+    header = f"{'场景':<14}{'任务':>6}{'冷启动(s)':>12}{'请求数':>8}{'重跑(s)':>10}{'请求数':>8}{'峰值内存(MB)':>14}"
+    print(header)
+    print("-" * 76)
+    for result in results:
+        print(
+            f"{result['scenario']:<16}{result['tasks']:>6}"
+            f"{result['cold']['wall_s']:>12}{result['cold']['requests']:>10}"
+            f"{result['warm']['wall_s']:>10}{result['warm']['requests']:>10}"
+            f"{str(result['peak_rss_mb']):>14}"
+        )
+    print()
+    for result in results:
+        print(f"[{result['scenario']}]")
+        for run in ("cold", "warm"):
+            phases = ", ".join(f"{key}={value}" for key, value in result[run]["phases_s"].items())
+            print(f"  {run}: {phases}")
+            endpoints = ", ".join(f"{key.rsplit('/', 2)[-2]}/{key.rsplit('/', 1)[-1]}={value}" for key, value in result[run]["endpoints"].items())
+            print(f"        {endpoints}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="转存流程性能测试（基于本地夸克模拟服务）")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="要运行的场景，可多次指定，默认全部",
+    )
+    parser.add_argument("--latency", type=float, default=0.005, help="模拟服务每个请求的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="模拟服务额外的随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务随机返回 502 的比例")
+    parser.add_argument("--server-rate", type=float, default=0, help="模拟服务每秒允许的请求数，0 表示不限流")
+    parser.add_argument("--rate", type=float, default=0, help="客户端每类接口每秒请求数，0 表示不限速")
+    parser.add_argument("--task-polls", type=int, default=1, help="任务需要被查询几次才完成")
+    parser.add_argument("--json", help="把结果写入 json 文件，- 表示输出到 stdout")
+    parser.add_argument("--no-isolate", action="store_true", help="所有场景在同一进程中运行")
+    args = parser.parse_args()
+
+    names = args.scenario or list(SCENARIOS)
+    if args.no_isolate or len(names) == 1:
+        results = [run_scenario(name, args) for name in names]
+    else:
+        results = [run_isolated(name, args) for name in names]
+
+    if args.json == "-":
+        print(json.dumps(results, ensure_ascii=False))
+    else:
+        print_table(results)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
@@ -1,5 +1,5 @@
 -- 数据库初始化脚本
--- 创建 cloud_resource 和 tmdb 表
+-- 创建 cloud_resource、tmdb 和 resource_check 表
 
 -- 如果数据库不存在则创建
 CREATE DATABASE IF NOT EXISTS pan_library DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
@@ -49,10 +49,28 @@ CREATE TABLE IF NOT EXISTS tmdb (
     INDEX idx_title (title)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='TMDB剧集信息表（含年份）';
 
+-- 创建资源链接检查记录表
+CREATE TABLE IF NOT EXISTS resource_check (
+    id INT AUTO_INCREMENT COMMENT '主键ID',
+    resource_id INT NOT NULL COMMENT '网盘资源ID',
+    last_check_time DATETIME NULL COMMENT '上次检查时间',
+    last_result TINYINT NULL COMMENT '上次检查结果（0：失效，1：有效，2：出错）',
+    check_count INT NOT NULL DEFAULT 0 COMMENT '检查次数',
+    fail_count INT NOT NULL DEFAULT 0 COMMENT '失效或出错次数',
+    flip_count INT NOT NULL DEFAULT 0 COMMENT '结果与上次不同的次数',
+    history VARCHAR(32) NOT NULL DEFAULT '' COMMENT '最近的检查结果，按时间顺序，每位一次',
+    create_time DATETIME DEFAULT CURRENT_TIMESTAMP NULL COMMENT '记录创建时间',
+    update_time DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP NULL COMMENT '记录修改时间',
+    PRIMARY KEY (id),
+    CONSTRAINT uk_resource_id UNIQUE (resource_id),
+    INDEX idx_last_check_time (last_check_time)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='资源链接检查记录表';
+
 -- 显示表结构
 SHOW TABLES;
 DESCRIBE cloud_resource;
 DESCRIBE tmdb;
+DESCRIBE resource_check;
 
 -- 提示信息
 SELECT '✅ 数据库表创建完成！' AS message;
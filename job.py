@@ -5,97 +5,269 @@
 功能：定期检查云盘资源链接的有效性
 """
 import os
+import math
 import time
+import heapq
 import random
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from db import db_session
 from model.cloud_resource import CloudResource
+from model.resource_check import ResourceCheck, RESULT_ERROR, RESULT_INVALID, RESULT_VALID
 from resource_manager import ResourceManager
 from drama_classifier import get_classifier
 from resource_searcher import get_searcher
 from extensions import scheduler
+from quark_cache import get_cache
+from quark_http import bind_context
+from quark_metrics import report_metrics
 import notify
 
+# 链接检查配置（可通过环境变量覆盖）
+LINK_CHECK_WORKERS = int(os.environ.get("LINK_CHECK_WORKERS", "4"))  # 并发检查的链接数
+LINK_CHECK_CHUNK = int(os.environ.get("LINK_CHECK_CHUNK", "200"))  # 每批从数据库读取的资源数
+# 分片：多个进程各自检查 id % LINK_CHECK_SHARDS == LINK_CHECK_SHARD 的资源
+LINK_CHECK_SHARDS = int(os.environ.get("LINK_CHECK_SHARDS", "1"))
+LINK_CHECK_SHARD = int(os.environ.get("LINK_CHECK_SHARD", "0"))
+# 检查进度的保存期限（秒），超过后重新开始一轮
+LINK_CHECK_CHECKPOINT_TTL = int(os.environ.get("LINK_CHECK_CHECKPOINT_TTL", str(7 * 24 * 3600)))
+# 按优先级检查：每次检查的链接数，距上次检查的天数上限（从未检查的按此计），结果不稳定的加权
+LINK_CHECK_BUDGET = int(os.environ.get("LINK_CHECK_BUDGET", "500"))
+LINK_CHECK_STALE_DAYS = float(os.environ.get("LINK_CHECK_STALE_DAYS", "30"))
+LINK_CHECK_FLAKY_WEIGHT = float(os.environ.get("LINK_CHECK_FLAKY_WEIGHT", "2"))
+# 检查结果批量写入数据库的间隔（秒）和缓存的最大结果数，达到任一条件即写入
+LINK_CHECK_FLUSH_INTERVAL = float(os.environ.get("LINK_CHECK_FLUSH_INTERVAL", "30"))
+LINK_CHECK_FLUSH_SIZE = int(os.environ.get("LINK_CHECK_FLUSH_SIZE", "1000"))
+
 
 # ============================================================================
 # 定时任务 1: 资源链接有效性检查
 # ============================================================================
 
+def iter_resource_chunks(last_id, chunk_size, shards=1, shard=0):
+    """
+    按 id 顺序分批读取待检查的资源，每批只取 id、剧名和链接
+
+    :param last_id: 从大于该 id 的资源开始
+    :return: 生成器，每次返回一批 [(id, drama_name, link)]
+    """
+    while True:
+        query = db_session.query(
+            CloudResource.id, CloudResource.drama_name, CloudResource.link
+        ).filter(
+            CloudResource.is_expired == 0,
+            CloudResource.link.isnot(None),
+            CloudResource.id > last_id,
+        )
+        if shards > 1:
+            query = query.filter(CloudResource.id % shards == shard)
+        chunk = query.order_by(CloudResource.id).limit(chunk_size).all()
+        # 读取完即结束事务，避免长时间持有连接
+        db_session.commit()
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def check_resource_chunk(executor, manager, chunk):
+    """
+    并发检查一批资源
+
+    线程池中只探测链接（probe_share_link 不访问数据库），结果由 CheckResultBuffer 批量写入
+
+    :return: 按原顺序 [(资源, 结果 RESULT_*, 异常或 None)]
+    """
+    futures = [
+        executor.submit(bind_context(manager.probe_share_link), resource.link)
+        for resource in chunk
+    ]
+    results = []
+    for resource, future in zip(chunk, futures):
+        try:
+            results.append((resource, RESULT_VALID if future.result() else RESULT_INVALID, None))
+        except Exception as e:
+            results.append((resource, RESULT_ERROR, e))
+    return results
+
+
+def tally_check_results(results, progress, checked_count):
+    """输出每个资源的检查结果并累计到 progress，返回累计检查数"""
+    for resource, result, error in results:
+        checked_count += 1
+        if result == RESULT_VALID:
+            progress["valid"] += 1
+            logging.info(f"[{checked_count}] ✅ {resource.drama_name}")
+        elif result == RESULT_INVALID:
+            progress["invalid"] += 1
+            logging.info(f"[{checked_count}] ❌ 链接已失效: {resource.drama_name} {resource.link}")
+        else:
+            progress["error"] += 1
+            logging.error(f"[{checked_count}] ⚠️ 检查资源失败: {resource.drama_name} {str(error)}")
+    return checked_count
+
+
+def record_check_results(results):
+    """把一批检查结果写入检查记录表（供按优先级检查使用），写入失败不影响检查"""
+    check_time = datetime.now()
+    try:
+        records = {
+            record.resource_id: record
+            for record in db_session.query(ResourceCheck).filter(
+                ResourceCheck.resource_id.in_([resource.id for resource, _, _ in results])
+            )
+        }
+        for resource, result, _ in results:
+            record = records.get(resource.id)
+            if record is None:
+                record = ResourceCheck(
+                    resource_id=resource.id, check_count=0, fail_count=0, flip_count=0, history=""
+                )
+                records[resource.id] = record
+                db_session.add(record)
+            record.record(result, check_time)
+        db_session.commit()
+    except Exception as e:
+        db_session.rollback()
+        logging.error(f"⚠️ 保存检查记录失败: {str(e)}")
+
+
+class CheckResultBuffer:
+    """
+    检查结果缓冲区
+
+    检查结果先缓存在内存中，缓存达到 size 个或距上次写入超过 interval 秒时批量写入：
+    失效的资源用一条 UPDATE ... WHERE id IN (...) 标记，检查记录一并写入，之后再调用
+    on_flush（保存检查进度）。进程崩溃时最多丢失一批未写入的结果，这些资源的检查进度
+    也未保存，重新执行时会再次检查。
+    """
+
+    def __init__(self, manager, on_flush=None, interval=None, size=None):
+        self.manager = manager
+        self.on_flush = on_flush
+        self.interval = LINK_CHECK_FLUSH_INTERVAL if interval is None else interval
+        self.size = size or LINK_CHECK_FLUSH_SIZE
+        self.results = []
+        self.last_flush = time.monotonic()
+
+    def add(self, results):
+        self.results += results
+        if len(self.results) >= self.size or time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        results, self.results = self.results, []
+        if results:
+            expired_count = self.manager.expire_resources(
+                [resource.id for resource, result, _ in results if result == RESULT_INVALID]
+            )
+            record_check_results(results)
+            logging.info(f"💾 已写入 {len(results)} 个检查结果（标记失效 {expired_count} 个）")
+        self.last_flush = time.monotonic()
+        if self.on_flush:
+            self.on_flush()
+
+
+def priority_score(row, now):
+    """
+    资源的检查优先级
+
+    得分 = 距上次检查的天数（从未检查的按 LINK_CHECK_STALE_DAYS 计，且不超过该值）
+          × (1 + 热门程度) × (1 + LINK_CHECK_FLAKY_WEIGHT × 结果不稳定程度)
+    热门程度 = ln(1 + 浏览次数) + 2 × ln(1 + 分享次数) + ln(1 + 热度)
+    """
+    if row.last_check_time is None:
+        stale_days = LINK_CHECK_STALE_DAYS
+    else:
+        stale_days = min((now - row.last_check_time).total_seconds() / 86400, LINK_CHECK_STALE_DAYS)
+    popularity = (
+        math.log1p(max(row.view_count or 0, 0))
+        + 2 * math.log1p(max(row.share_count or 0, 0))
+        + math.log1p(max(row.hot or 0, 0))
+    )
+    flakiness = ResourceCheck.calc_flakiness(row.check_count, row.flip_count)
+    return max(stale_days, 0) * (1 + popularity) * (1 + LINK_CHECK_FLAKY_WEIGHT * flakiness)
+
+
 # @scheduler.task('cron', id='check_resources_links', hour=2, minute=0)
-def check_all_resources_links():
+def check_all_resources_links(shards=None, shard=None, workers=None, chunk_size=None):
     """
     定时任务：检查所有未失效资源的链接有效性
 
     功能：
-    - 遍历所有未失效的资源
-    - 调用 check_share_link 检测链接是否失效
-    - 每个链接检测后随机间隔 1-3 秒
-    - 每检测 10 次后间隔 10 秒
+    - 按 id 顺序分批读取未失效的资源，不一次性加载全部
+    - 线程池并发探测链接（probe_share_link），请求速率由夸克请求的全局限速器控制（QUARK_RATE_SHARE）
+    - 检查结果按 LINK_CHECK_FLUSH_INTERVAL / LINK_CHECK_FLUSH_SIZE 批量写入，失效资源用一条 UPDATE 标记
+    - 每次写入后保存进度，中断后再次执行从上次的位置继续
+    - 支持按 id % shards 分片，多个进程分别检查一部分资源
+
+    :param shards: 分片总数，默认 LINK_CHECK_SHARDS
+    :param shard: 本进程负责的分片序号，默认 LINK_CHECK_SHARD
+    :param workers: 并发检查数，默认 LINK_CHECK_WORKERS
+    :param chunk_size: 每批读取的资源数，默认 LINK_CHECK_CHUNK
     """
+    shards = shards or LINK_CHECK_SHARDS
+    shard = LINK_CHECK_SHARD if shard is None else shard
+    workers = workers or LINK_CHECK_WORKERS
+    chunk_size = chunk_size or LINK_CHECK_CHUNK
     try:
         logging.info("=" * 60)
         logging.info(f"🔍 开始检查资源链接有效性 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        if shards > 1:
+            logging.info(f"分片: {shard}/{shards}")
         logging.info("=" * 60)
 
         # 创建资源管理器（内部会自动读取cookie）
         manager = ResourceManager()
 
-        # 查询所有未失效的资源
-        resources = db_session.query(CloudResource).filter(
-            CloudResource.is_expired == 0,
-            CloudResource.link.isnot(None)
-        ).all()
-
-        if not resources:
+        # 读取上次中断时的进度；每个分片单独一个文件，多个分片进程保存时互不覆盖
+        checkpoints = get_cache(f"link_check_{shard}_{shards}", LINK_CHECK_CHECKPOINT_TTL)
+        checkpoint_key = "progress"
+        progress = checkpoints.get(checkpoint_key) or {
+            "last_id": 0,
+            "valid": 0,
+            "invalid": 0,
+            "error": 0,
+        }
+        if progress["last_id"]:
+            logging.info(f"⏩ 从上次中断的位置继续（id > {progress['last_id']}）")
+
+        def save_progress():
+            # 检查结果写入数据库后才保存进度，崩溃时未写入的资源会重新检查
+            checkpoints.set(checkpoint_key, dict(progress))
+            checkpoints.save()
+            # 保存获取的 stoken，下次检查时复用
+            manager.quark.save_cache()
+
+        checked_count = progress["valid"] + progress["invalid"] + progress["error"]
+        buffer = CheckResultBuffer(manager, save_progress)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for chunk in iter_resource_chunks(progress["last_id"], chunk_size, shards, shard):
+                results = check_resource_chunk(executor, manager, chunk)
+                checked_count = tally_check_results(results, progress, checked_count)
+                # 整批完成后才推进进度
+                progress["last_id"] = chunk[-1].id
+                buffer.add(results)
+        finally:
+            # 中断时不再执行已提交但未开始的检查，已完成的结果照常写入
+            executor.shutdown(cancel_futures=True)
+            buffer.flush()
+
+        # 本轮检查完成，下次从头开始
+        checkpoints.delete(checkpoint_key)
+        checkpoints.save()
+
+        total_count = checked_count
+        valid_count = progress["valid"]
+        invalid_count = progress["invalid"]
+        error_count = progress["error"]
+        if not total_count:
             logging.info("ℹ️  没有需要检查的资源")
             return
 
-        total_count = len(resources)
-        valid_count = 0
-        invalid_count = 0
-        error_count = 0
-
-        logging.info(f"📊 共找到 {total_count} 个未失效资源需要检查")
-        logging.info("")
-
-        for index, resource in enumerate(resources, start=1):
-            try:
-                logging.info(f"[{index}/{total_count}] 检查资源: {resource.drama_name}")
-                logging.info(f"  └─ 链接: {resource.link}")
-
-                # 检查链接有效性
-                is_valid = manager.check_share_link(resource.link)
-
-                if is_valid:
-                    valid_count += 1
-                    logging.info(f"  ✅ 链接有效")
-                else:
-                    invalid_count += 1
-                    logging.info(f"  ❌ 链接已失效")
-
-                # 每个链接检测后随机间隔 1-3 秒
-                if index < total_count:  # 最后一个不需要等待
-                    wait_time = random.uniform(1, 3)
-                    logging.info(f"  ⏱️  等待 {wait_time:.1f} 秒...")
-                    time.sleep(wait_time)
-
-                # 每检测 10 次后额外间隔 10 秒
-                if index % 10 == 0 and index < total_count:
-                    logging.info(f"  ⏸️  已检测 {index} 个资源，休息 10 秒...")
-                    time.sleep(10)
-
-                logging.info("")
-
-            except Exception as e:
-                error_count += 1
-                logging.error(f"  ❌ 检查资源失败: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                logging.info("")
-                continue
-
         # 输出统计信息
         logging.info("=" * 60)
         logging.info("📈 检查完成 - 统计结果")
@@ -128,6 +300,110 @@ def check_all_resources_links():
         import traceback
         traceback.print_exc()
     finally:
+        # 输出并清空本次检查的请求统计，Web 进程中不随每次检查累积
+        report_metrics()
+        # 清理数据库会话
+        db_session.remove()
+
+
+# @scheduler.task('cron', id='check_priority_resources_links', hour='*/4', minute=30)
+def check_priority_resources_links(budget=None, shards=None, shard=None, workers=None, chunk_size=None):
+    """
+    定时任务：按优先级检查资源链接
+
+    功能：
+    - 按 priority_score 为未失效的资源打分（久未检查、热门、结果不稳定的优先）
+    - 每次只检查得分最高的 budget 个，把有限的请求花在用户常用的链接上
+    - 检查结果写入 resource_check 表，作为下次打分的依据
+
+    :param budget: 本次检查的链接数，默认 LINK_CHECK_BUDGET（每个链接约 2 个夸克请求）
+    :param shards: 分片总数，默认 LINK_CHECK_SHARDS
+    :param shard: 本进程负责的分片序号，默认 LINK_CHECK_SHARD
+    :param workers: 并发检查数，默认 LINK_CHECK_WORKERS
+    :param chunk_size: 每批检查并保存结果的资源数，默认 LINK_CHECK_CHUNK
+    """
+    budget = LINK_CHECK_BUDGET if budget is None else budget
+    shards = shards or LINK_CHECK_SHARDS
+    shard = LINK_CHECK_SHARD if shard is None else shard
+    workers = workers or LINK_CHECK_WORKERS
+    chunk_size = chunk_size or LINK_CHECK_CHUNK
+    try:
+        logging.info("=" * 60)
+        logging.info(f"🎯 开始按优先级检查资源链接（本次 {budget} 个）- {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        logging.info("=" * 60)
+
+        # 打分所需的字段，未检查过的资源没有检查记录
+        query = db_session.query(
+            CloudResource.id,
+            CloudResource.drama_name,
+            CloudResource.link,
+            CloudResource.view_count,
+            CloudResource.share_count,
+            CloudResource.hot,
+            ResourceCheck.last_check_time,
+            ResourceCheck.check_count,
+            ResourceCheck.flip_count,
+        ).outerjoin(
+            ResourceCheck, ResourceCheck.resource_id == CloudResource.id
+        ).filter(
+            CloudResource.is_expired == 0,
+            CloudResource.link.isnot(None),
+        )
+        if shards > 1:
+            query = query.filter(CloudResource.id % shards == shard)
+        now = datetime.now()
+        selected = heapq.nlargest(
+            budget, query.yield_per(1000), key=lambda row: priority_score(row, now)
+        )
+        db_session.commit()
+        if not selected:
+            logging.info("ℹ️  没有需要检查的资源")
+            return
+
+        manager = ResourceManager()
+        progress = {"valid": 0, "invalid": 0, "error": 0}
+        checked_count = 0
+        invalid_names = []
+        buffer = CheckResultBuffer(manager, manager.quark.save_cache)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for start in range(0, len(selected), chunk_size):
+                results = check_resource_chunk(executor, manager, selected[start:start + chunk_size])
+                checked_count = tally_check_results(results, progress, checked_count)
+                invalid_names += [
+                    resource.drama_name for resource, result, _ in results if result == RESULT_INVALID
+                ]
+                buffer.add(results)
+        finally:
+            executor.shutdown(cancel_futures=True)
+            buffer.flush()
+
+        logging.info("=" * 60)
+        logging.info(
+            f"📈 检查完成 - 共 {checked_count} 个，✅ 有效 {progress['valid']}，"
+            f"❌ 失效 {progress['invalid']}，⚠️ 错误 {progress['error']}"
+        )
+        logging.info("=" * 60)
+
+        # 发现失效链接时通知
+        if invalid_names:
+            try:
+                content = "\n".join(
+                    [f"本次检查 {checked_count} 个，发现 {len(invalid_names)} 个失效链接："]
+                    + [f"{i}. {name}" for i, name in enumerate(invalid_names, 1)]
+                    + ["", f"完成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"]
+                )
+                notify.send("资源链接优先检查发现失效链接", content)
+            except Exception as e:
+                logging.error(f"❌ 发送通知失败: {str(e)}")
+
+    except Exception as e:
+        logging.error(f"❌ 定时任务执行失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        # 输出并清空本次检查的请求统计，Web 进程中不随每次检查累积
+        report_metrics()
         # 清理数据库会话
         db_session.remove()
 
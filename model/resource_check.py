@@ -0,0 +1,67 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from db import db
+
+# 检查结果
+RESULT_INVALID = 0
+RESULT_VALID = 1
+RESULT_ERROR = 2
+
+
+class ResourceCheck(db.Model):
+    '''
+    资源链接检查记录表（每个资源一条，用于按优先级安排检查）
+    '''
+    __tablename__ = 'resource_check'
+
+    # 保留的最近检查结果条数
+    HISTORY_SIZE = 20
+
+    id = db.Column(db.Integer, primary_key=True, comment='主键ID')
+    resource_id = db.Column(db.Integer, nullable=False, unique=True, comment='网盘资源ID')
+    last_check_time = db.Column(db.DateTime, comment='上次检查时间')
+    last_result = db.Column(db.Integer, comment='上次检查结果（0：失效，1：有效，2：出错）')
+    check_count = db.Column(db.Integer, nullable=False, default=0, comment='检查次数')
+    fail_count = db.Column(db.Integer, nullable=False, default=0, comment='失效或出错次数')
+    flip_count = db.Column(db.Integer, nullable=False, default=0, comment='结果与上次不同的次数')
+    history = db.Column(db.String(32), nullable=False, default='', comment='最近的检查结果，按时间顺序，每位一次')
+    create_time = db.Column(db.DateTime, default=datetime.now, comment='记录创建时间')
+    update_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, comment='记录修改时间')
+
+    def record(self, result, check_time=None):
+        '''记录一次检查结果'''
+        if self.last_result is not None and self.last_result != result:
+            self.flip_count = (self.flip_count or 0) + 1
+        self.check_count = (self.check_count or 0) + 1
+        if result != RESULT_VALID:
+            self.fail_count = (self.fail_count or 0) + 1
+        self.last_result = result
+        self.last_check_time = check_time or datetime.now()
+        self.history = ((self.history or '') + str(result))[-self.HISTORY_SIZE:]
+
+    @staticmethod
+    def calc_flakiness(check_count, flip_count):
+        '''结果不稳定程度（0~1）：相邻两次检查结果不同的比例'''
+        if not check_count or check_count < 2:
+            return 0.0
+        return (flip_count or 0) / (check_count - 1)
+
+    @property
+    def flakiness(self):
+        return self.calc_flakiness(self.check_count, self.flip_count)
+
+    def to_dict(self):
+        '''转换为字典'''
+        return {
+            'id': self.id,
+            'resource_id': self.resource_id,
+            'last_check_time': self.last_check_time.strftime('%Y-%m-%d %H:%M:%S') if self.last_check_time else None,
+            'last_result': self.last_result,
+            'check_count': self.check_count,
+            'fail_count': self.fail_count,
+            'flip_count': self.flip_count,
+            'history': self.history,
+            'create_time': self.create_time.strftime('%Y-%m-%d %H:%M:%S') if self.create_time else None,
+            'update_time': self.update_time.strftime('%Y-%m-%d %H:%M:%S') if self.update_time else None,
+        }
@@ -0,0 +1,813 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+夸克网盘异步客户端
+功能：基于 httpx.AsyncClient 的 Quark 异步实现，支持多个追更任务并发执行
+"""
+import asyncio
+import os
+import random
+import re
+from datetime import datetime
+from functools import partial
+
+import httpx
+
+from quark_auto_save import (
+    CONFIG_DATA,
+    FID_CACHE_TTL,
+    SHARE_SNAPSHOT,
+    SNAPSHOT_PROBE_SIZE,
+    SNAPSHOT_TTL,
+    STOKEN_CACHE_TTL,
+    RENAME_WORKERS,
+    DirIndex,
+    Quark,
+    Emby,
+    RenamePlan,
+    SavePlan,
+    TaskPlan,
+    add_notify,
+    check_date,
+    is_rename_dry_run,
+    load_task_regex,
+    match_share_files,
+    plan_dir_renames,
+    print_task_info,
+    refresh_emby,
+    share_signature,
+    snapshot_key,
+)
+from quark_cache import get_cache
+from quark_http import (
+    QUARK_POOL_SIZE,
+    QUARK_CONNECT_TIMEOUT,
+    QUARK_READ_TIMEOUT,
+    QUARK_RETRIES,
+    QuarkRequestError,
+    RequestStats,
+    async_fetch_pages,
+    endpoint_key,
+    get_circuit_breaker,
+    get_rate_limiter,
+    is_idempotent,
+    is_throttled,
+    resolve_url,
+    retry_delay,
+)
+from quark_metrics import task_scope
+from quark_poller import AsyncTaskPoller
+
+# 默认同时执行的任务数（可通过配置 concurrency 或环境变量覆盖）
+QUARK_CONCURRENCY = int(os.environ.get("QUARK_CONCURRENCY", "5"))
+
+
+class AsyncQuark:
+    """
+    异步版 Quark 客户端
+
+    方法与 Quark 保持一致（get_stoken、get_detail、ls_dir、get_fids、save_file、
+    query_task、share_dir 等），区别在于网络请求方法均为协程。
+    """
+
+    # 与网络无关的方法直接复用同步版实现
+    match_st_form_cookie = Quark.match_st_form_cookie
+    common_headers = Quark.common_headers
+    get_id_from_url = Quark.get_id_from_url
+    match_account_key = Quark.match_account_key
+    cache_savepath_fid = Quark.cache_savepath_fid
+    get_cached_savepath_fid = Quark.get_cached_savepath_fid
+    invalidate_savepath_fid = Quark.invalidate_savepath_fid
+    rename_savepath_fid = Quark.rename_savepath_fid
+    save_cache = Quark.save_cache
+    get_cached_stoken = Quark.get_cached_stoken
+    cache_stoken = Quark.cache_stoken
+    invalidate_stoken = Quark.invalidate_stoken
+    commit_snapshot = Quark.commit_snapshot
+    plan_dir_files = Quark.plan_dir_files
+    report_save_task = Quark.report_save_task
+
+    def __init__(self, cookie, index=None):
+        self.cookie = cookie.strip()
+        self.index = index + 1
+        self.is_active = False
+        self.nickname = ""
+        self.st = self.match_st_form_cookie(cookie)
+        self.savepath_fid = {"/": "0"}
+        # 账号标识，用于区分持久化缓存
+        self.account_key = self.match_account_key(self.cookie)
+        # 持久化的目录fid缓存，与同步版共用
+        self.fid_cache = get_cache("savepath_fid", FID_CACHE_TTL)
+        # 每个任务上次完整比对时的分享签名
+        self.share_snapshot = get_cache("share_snapshot", SNAPSHOT_TTL)
+        # 分享的 stoken 或失效信息，按 pwd_id 缓存
+        self.stoken_cache = get_cache("share_stoken", STOKEN_CACHE_TTL)
+        # 本次运行从缓存取出的 stoken 及其重新获取结果，同 Quark
+        self.cached_stokens = set()
+        self.stoken_renewals = {}
+        self.stoken_lock = asyncio.Lock()
+        # 账号内共享的异步连接池
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(QUARK_READ_TIMEOUT, connect=QUARK_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=QUARK_POOL_SIZE),
+        )
+        # 进程内共享的限速器
+        self.limiter = get_rate_limiter()
+        # 账号内共享的任务轮询器
+        self.task_poller = AsyncTaskPoller(self._task_page)
+
+    # 与 QuarkHttp.request_json 相同的重试与熔断策略
+    async def _request(self, method, url, **kwargs):
+        url = resolve_url(url)
+        breaker = get_circuit_breaker(url)
+        idempotent = is_idempotent(method, url)
+        with RequestStats(method, url, self.account_key) as stats:
+            attempt = 0
+            while True:
+                stats.before_request(breaker, attempt)
+                data = None
+                try:
+                    await self.limiter.async_acquire(url)
+                    response = await self.client.request(method, url, **kwargs)
+                    stats.response(response.status_code, response.content)
+                    if response.status_code >= 500:
+                        raise QuarkRequestError(f"HTTP {response.status_code}")
+                    try:
+                        data = response.json()
+                    except ValueError:
+                        raise QuarkRequestError(f"HTTP {response.status_code} 响应不是 json")
+                    stats.data(data)
+                    self.limiter.feedback(url, response.status_code, data)
+                    if not is_throttled(response.status_code, data):
+                        breaker.succeeded()
+                        return data
+                    error, retryable = QuarkRequestError(data.get("message") or "请求过于频繁"), idempotent
+                except QuarkRequestError as e:
+                    breaker.failed()
+                    error, retryable = e, idempotent
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    breaker.failed()
+                    error, retryable = e, True
+                except httpx.TransportError as e:
+                    breaker.failed()
+                    error, retryable = e, idempotent
+                if not retryable or attempt >= QUARK_RETRIES:
+                    if data is not None:
+                        return data
+                    raise QuarkRequestError(f"{method} {endpoint_key(url)} 请求失败：{error}") from error
+                delay = retry_delay(attempt)
+                print(f"⚠️ {endpoint_key(url)} 请求失败（{error}），{delay:.1f} 秒后第{attempt + 1}次重试")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def init(self):
+        account_info = await self.get_account_info()
+        if account_info:
+            self.is_active = True
+            self.nickname = account_info["nickname"]
+            return account_info
+        else:
+            return False
+
+    async def get_account_info(self):
+        url = "https://pan.quark.cn/account/info"
+        querystring = {"fr": "pc", "platform": "pc"}
+        headers = {
+            "cookie": self.cookie,
+            "content-type": "application/json",
+        }
+        response = await self._request(
+            "GET", url, headers=headers, params=querystring
+        )
+        if response.get("data"):
+            return response["data"]
+        else:
+            return False
+
+    # 可验证资源是否失效
+    async def get_stoken(self, pwd_id):
+        if cached := self.get_cached_stoken(pwd_id):
+            if cached[0]:
+                self.cached_stokens.add((pwd_id, cached[1]))
+            return cached
+        return await self.fetch_stoken(pwd_id)
+
+    async def fetch_stoken(self, pwd_id):
+        url = "https://drive-h.quark.cn/1/clouddrive/share/sharepage/token"
+        querystring = {"pr": "ucpro", "fr": "h5"}
+        payload = {"pwd_id": pwd_id, "passcode": "", "support_visit_limit_private_share": True}
+        headers = self.common_headers()
+        response = await self._request(
+            "POST", url, json=payload, headers=headers, params=querystring
+        )
+        return self.cache_stoken(pwd_id, response)
+
+    # 缓存的 stoken 报错时重新获取，同一 stoken 只获取一次，返回新的 stoken（无需更新时为 None）
+    async def renew_stoken(self, pwd_id, stoken):
+        key = (pwd_id, stoken)
+        async with self.stoken_lock:
+            if key not in self.stoken_renewals:
+                self.stoken_renewals[key] = None
+                if key in self.cached_stokens:
+                    self.stoken_cache.delete(pwd_id)
+                    is_sharing, new_stoken = await self.fetch_stoken(pwd_id)
+                    if is_sharing and new_stoken != stoken:
+                        print(f"分享 {pwd_id} 缓存的stoken已失效，重新获取")
+                        self.stoken_renewals[key] = new_stoken
+            return self.stoken_renewals[key]
+
+    # 带 stoken 的分享接口：缓存的 stoken 失效时用新 stoken 重试一次，仍报错则清除缓存
+    async def _share_request(self, pwd_id, stoken, send):
+        stoken = self.stoken_renewals.get((pwd_id, stoken)) or stoken
+        response = await send(stoken)
+        status = response.get("status") or 0
+        if response.get("code") != 0 and status != 429 and status < 500:
+            if new_stoken := await self.renew_stoken(pwd_id, stoken):
+                response = await send(new_stoken)
+        self.invalidate_stoken(pwd_id, response)
+        return response
+
+    async def _detail_page(
+            self,
+            pwd_id,
+            stoken,
+            pdir_fid,
+            page,
+            size=50,
+            sort="file_type:asc,updated_at:desc",
+    ):
+        url = "https://drive-h.quark.cn/1/clouddrive/share/sharepage/detail"
+        querystring = {
+            "pr": "ucpro",
+            "fr": "pc",
+            "uc_param_str": "",
+            "pwd_id": pwd_id,
+            "stoken": stoken,
+            "pdir_fid": pdir_fid,
+            "force": "0",
+            "_page": page,
+            "_size": str(size),
+            "_fetch_banner": "0",
+            "_fetch_share": "0",
+            "_fetch_total": "1",
+            "_sort": sort,
+        }
+        headers = self.common_headers()
+        return await self._share_request(
+            pwd_id,
+            stoken,
+            lambda stoken: self._request(
+                "GET", url, headers=headers, params={**querystring, "stoken": stoken}
+            ),
+        )
+
+    async def get_detail(self, pwd_id, stoken, pdir_fid):
+        return await async_fetch_pages(partial(self._detail_page, pwd_id, stoken, pdir_fid))
+
+    # 探测分享首页（按更新时间倒序，只取少量条目），返回分享签名
+    async def probe_share(self, pwd_id, stoken, pdir_fid):
+        response = await self._detail_page(
+            pwd_id, stoken, pdir_fid, 1, SNAPSHOT_PROBE_SIZE, "updated_at:desc"
+        )
+        signature = share_signature(response)
+        # 仅有一个文件夹时，更新多发生在文件夹内，一并探测
+        if signature and signature["total"] == 1 and response["data"]["list"][0]["dir"]:
+            inner = await self._detail_page(
+                pwd_id,
+                stoken,
+                response["data"]["list"][0]["fid"],
+                1,
+                SNAPSHOT_PROBE_SIZE,
+                "updated_at:desc",
+            )
+            signature["inner"] = share_signature(inner)
+        return signature
+
+    async def get_fids(self, file_paths):
+        fids = []
+        while True:
+            url = "https://drive-m.quark.cn/1/clouddrive/file/info/path_list"
+            querystring = {"pr": "ucpro", "fr": "pc"}
+            payload = {"file_path": file_paths[:50], "namespace": "0"}
+            headers = self.common_headers()
+            response = await self._request(
+                "POST", url, json=payload, headers=headers, params=querystring
+            )
+            if response["code"] == 0:
+                fids += response["data"]
+                file_paths = file_paths[50:]
+            else:
+                print(f"获取目录ID：失败, {response['message']}")
+                break
+            if len(file_paths) == 0:
+                break
+        return fids
+
+    async def _dir_page(self, pdir_fid, page):
+        url = "https://drive-m.quark.cn/1/clouddrive/file/sort"
+        querystring = {
+            "pr": "ucpro",
+            "fr": "pc",
+            "uc_param_str": "",
+            "pdir_fid": pdir_fid,
+            "_page": page,
+            "_size": "50",
+            "_fetch_total": "1",
+            "_fetch_sub_dirs": "0",
+            "_sort": "file_type:asc,updated_at:desc",
+        }
+        headers = self.common_headers()
+        return await self._request(
+            "GET", url, headers=headers, params=querystring
+        )
+
+    async def ls_dir(self, pdir_fid):
+        return await async_fetch_pages(partial(self._dir_page, pdir_fid))
+
+    async def save_file(self, fid_list, fid_token_list, to_pdir_fid, pwd_id, stoken):
+        url = "https://drive-m.quark.cn/1/clouddrive/share/sharepage/save"
+        querystring = {
+            "pr": "ucpro",
+            "fr": "h5" if self.st else "pc",
+            "uc_param_str": "",
+            "app": "clouddrive",
+            "__dt": int(random.uniform(1, 5) * 60 * 1000),
+            "__t": datetime.now().timestamp(),
+        }
+        payload = {
+            "fid_list": fid_list,
+            "fid_token_list": fid_token_list,
+            "to_pdir_fid": to_pdir_fid,
+            "pwd_id": pwd_id,
+            "stoken": stoken,
+            "pdir_fid": "0",
+            "scene": "link",
+        }
+        headers = self.common_headers()
+        return await self._share_request(
+            pwd_id,
+            stoken,
+            lambda stoken: self._request(
+                "POST", url, json={**payload, "stoken": stoken}, headers=headers, params=querystring
+            ),
+        )
+
+    async def mkdir(self, dir_path):
+        url = "https://drive-m.quark.cn/1/clouddrive/file"
+        querystring = {"pr": "ucpro", "fr": "pc", "uc_param_str": ""}
+        payload = {
+            "pdir_fid": "0",
+            "file_name": "",
+            "dir_path": dir_path,
+            "dir_init_lock": False,
+        }
+        headers = self.common_headers()
+        return await self._request(
+            "POST", url, json=payload, headers=headers, params=querystring
+        )
+
+    async def rename(self, fid, file_name):
+        url = "https://drive-m.quark.cn/1/clouddrive/file/rename"
+        querystring = {"pr": "ucpro", "fr": "pc", "uc_param_str": ""}
+        payload = {"fid": fid, "file_name": file_name}
+        headers = self.common_headers()
+        return await self._request(
+            "POST", url, json=payload, headers=headers, params=querystring
+        )
+
+    # 查询一次任务状态
+    async def _task_page(self, task_id, retry_index):
+        url = "https://drive-m.quark.cn/1/clouddrive/task"
+        querystring = {
+            "pr": "ucpro",
+            "fr": "pc",
+            "uc_param_str": "",
+            "task_id": task_id,
+            "retry_index": retry_index,
+            "__dt": int(random.uniform(1, 5) * 60 * 1000),
+            "__t": datetime.now().timestamp(),
+        }
+        headers = self.common_headers()
+        return await self._request(
+            "GET", url, headers=headers, params=querystring
+        )
+
+    # 等待任务结束，并发任务共用一个轮询循环
+    async def query_task(self, task_id):
+        return await self.task_poller.wait(task_id)
+
+    async def share_password(self, share_id):
+        url = "https://drive-m.quark.cn/1/clouddrive/share/password"
+        querystring = {"pr": "ucpro", "fr": "pc", "uc_param_str": ""}
+        payload = {"share_id": share_id}
+        headers = self.common_headers()
+        response = await self._request(
+            "POST", url, json=payload, headers=headers, params=querystring
+        )
+        if response["code"] == 0:
+            print(f"获取分享密码：{response['data']}")
+        else:
+            print(f"获取分享内容：{response['message']}")
+            return False
+        return response["data"]
+
+    async def share_dir(self, fid_list, title):
+        url = "https://drive-pc.quark.cn/1/clouddrive/share"
+        querystring = {"uc_param_str": "", "fr": "pc", "pr": "ucpro"}
+        payload = {
+            "fid_list": fid_list,
+            "title": title,
+            "url_type": 1,
+            "expired_type": 1
+        }
+        headers = self.common_headers()
+        response = await self._request(
+            "POST", url, json=payload, headers=headers, params=querystring
+        )
+        share_task = await self.query_task(response["data"]["task_id"])
+        if share_task["code"] != 0:
+            print(f"创建分享失败：{share_task['message']}")
+            return False
+        return await self.share_password(share_task["data"]["share_id"])
+
+    async def resolve_savepath_fid(self, savepath):
+        if fid := self.get_cached_savepath_fid(savepath):
+            return fid
+        if get_fids := await self.get_fids([savepath]):
+            self.cache_savepath_fid(savepath, get_fids[0]["fid"])
+            return get_fids[0]["fid"]
+        return None
+
+    # 新建目录并缓存fid，失败返回None
+    async def mkdir_savepath(self, savepath):
+        mkdir_return = await self.mkdir(savepath)
+        if mkdir_return.get("code") == 0:
+            print(f"创建文件夹：{savepath}")
+            self.cache_savepath_fid(savepath, mkdir_return["data"]["fid"])
+            return mkdir_return["data"]["fid"]
+        print(f"创建文件夹：{savepath} 失败, {mkdir_return.get('message')}")
+        return None
+
+    # 列出目标目录，缓存的fid不可用时重新获取fid后再试一次，目录已被删除时重新创建
+    async def ls_savepath(self, savepath):
+        to_pdir_fid = await self.resolve_savepath_fid(savepath)
+        if not to_pdir_fid:
+            return None, []
+        dir_file_list = await self.ls_savepath_dir(to_pdir_fid)
+        if dir_file_list is None:
+            print(f"目录 {savepath} 的缓存fid已失效，重新获取")
+            self.invalidate_savepath_fid(savepath)
+            to_pdir_fid = await self.resolve_savepath_fid(savepath) or await self.mkdir_savepath(savepath)
+            if not to_pdir_fid:
+                return None, []
+            dir_file_list = await self.ls_savepath_dir(to_pdir_fid)
+            if dir_file_list is None:
+                return None, []
+        return to_pdir_fid, dir_file_list
+
+    # 列出目录，首页 code != 0（目录已被删除、fid 不属于当前账号等）时返回 None
+    async def ls_savepath_dir(self, pdir_fid):
+        first = await self._dir_page(pdir_fid, 1)
+        if first.get("code") != 0:
+            return None
+
+        async def fetch_page(page):
+            return first if page == 1 else await self._dir_page(pdir_fid, page)
+
+        return await async_fetch_pages(fetch_page)
+
+    async def update_savepath_fid(self, tasklist):
+        dir_paths = [
+            re.sub(r"/{2,}", "/", f"/{item['savepath']}")
+            for item in tasklist
+            if not item.get("enddate")
+               or (
+                       datetime.now().date()
+                       <= datetime.strptime(item["enddate"], "%Y-%m-%d").date()
+               )
+        ]
+        # 只解析持久化缓存中没有的目录
+        dir_paths = [
+            dir_path
+            for dir_path in set(dir_paths)
+            if not self.get_cached_savepath_fid(dir_path)
+        ]
+        if not dir_paths:
+            return False
+        dir_paths_exist_arr = await self.get_fids(dir_paths)
+        dir_paths_exist = [item["file_path"] for item in dir_paths_exist_arr]
+        # 比较创建不存在的
+        dir_paths_unexist = list(set(dir_paths) - set(dir_paths_exist) - set(["/"]))
+        mkdir_returns = await asyncio.gather(
+            *(self.mkdir(dir_path) for dir_path in dir_paths_unexist)
+        )
+        for dir_path, mkdir_return in zip(dir_paths_unexist, mkdir_returns):
+            if mkdir_return["code"] == 0:
+                dir_paths_exist_arr.append(
+                    {"file_path": dir_path, "fid": mkdir_return["data"]["fid"]}
+                )
+                print(f"创建文件夹：{dir_path}")
+            else:
+                print(f"创建文件夹：{dir_path} 失败, {mkdir_return['message']}")
+        # 储存目标目录的fid
+        for dir_path in dir_paths_exist_arr:
+            self.cache_savepath_fid(dir_path["file_path"], dir_path["fid"])
+        self.fid_cache.save()
+
+    # 同一计划内相同的请求只发一次，并发的任务等待同一个结果
+    def plan_once(self, cache, key, make):
+        if key not in cache:
+            cache[key] = asyncio.ensure_future(make())
+        return cache[key]
+
+    # 获取stoken，同时可验证资源是否失效；同一分享只请求一次
+    async def plan_stoken(self, plan, pwd_id):
+        return await self.plan_once(plan.stokens, pwd_id, lambda: self.get_stoken(pwd_id))
+
+    async def plan_signature(self, plan, pwd_id, stoken, pdir_fid):
+        return await self.plan_once(
+            plan.signatures, (pwd_id, pdir_fid), lambda: self.probe_share(pwd_id, stoken, pdir_fid)
+        )
+
+    async def plan_detail(self, plan, pwd_id, stoken, pdir_fid):
+        return await self.plan_once(
+            plan.listings, (pwd_id, pdir_fid), lambda: self.get_detail(pwd_id, stoken, pdir_fid)
+        )
+
+    # 同一目标目录只列出一次，各任务共用同一个 DirIndex，计划转存的文件名对之后的任务可见
+    async def plan_dir_index(self, plan, savepath):
+        async def dir_index():
+            to_pdir_fid, dir_file_list = await self.ls_savepath(savepath)
+            return to_pdir_fid, DirIndex(dir_file_list)
+
+        return await self.plan_once(plan.dir_indexes, savepath, dir_index)
+
+    # 计划阶段：比对分享与目标目录，记录需转存的文件，不发起转存；参数与返回值同 Quark.plan_save_task
+    async def plan_save_task(self, plan, task):
+        # 判断资源失效记录
+        if task.get("shareurl_ban"):
+            print(f"《{task['taskname']}》：{task['shareurl_ban']}")
+            return None
+
+        # 链接转换所需参数
+        pwd_id, pdir_fid = self.get_id_from_url(task["shareurl"])
+
+        # 获取stoken，同时可验证资源是否失效
+        is_sharing, stoken = await self.plan_stoken(plan, pwd_id)
+        if not is_sharing:
+            add_notify(f"❌《{task['taskname']}》：{stoken}\n")
+            task["shareurl_ban"] = stoken
+            return None
+
+        # 探测分享首页，与上次快照一致则跳过完整比对
+        key = snapshot_key(self.account_key, task)
+        signature = (
+            await self.plan_signature(plan, pwd_id, stoken, pdir_fid) if SHARE_SNAPSHOT else None
+        )
+        if signature and signature == self.share_snapshot.get(key):
+            print(f"《{task['taskname']}》任务结束：分享无变化，跳过比对")
+            return None
+        # 快照在汇总阶段确认全部层级转存成功后再记录
+        task_plan = TaskPlan(task, pdir_fid, key, signature)
+        try:
+            await self.plan_dir_save(plan, task_plan, pwd_id, stoken, pdir_fid)
+        except Exception:
+            self.share_snapshot.delete(key)
+            raise
+        plan.tasks.append(task_plan)
+        return task_plan
+
+    # 获取一个文件夹的分享文件列表，分享根目录仅有一个文件夹时读取其中的列表
+    async def plan_share_listing(self, plan, pwd_id, stoken, pdir_fid, is_root):
+        share_file_list = await self.plan_detail(plan, pwd_id, stoken, pdir_fid)
+        if is_root and len(share_file_list) == 1 and share_file_list[0]["dir"]:
+            print("🧠 该分享是一个文件夹，读取文件夹内列表")
+            share_file_list = await self.plan_detail(plan, pwd_id, stoken, share_file_list[0]["fid"])
+        return share_file_list
+
+    # 按层遍历需递归检查的子文件夹：同一层并发获取列表，再依次比对（比对过程中不切换协程）
+    async def plan_dir_save(self, plan, task_plan, pwd_id, stoken, pdir_fid):
+        task = task_plan.task
+        # 当前层：[(分享文件夹fid, 子目录路径, 子文件夹链 ((fid, 文件夹名), ...))]
+        level = [(pdir_fid, "", ())]
+        while level:
+            savepaths = [
+                re.sub(r"/{2,}", "/", f"/{task['savepath']}{subdir_path}")
+                for _, subdir_path, _ in level
+            ]
+            share_lists = asyncio.gather(
+                *(
+                    self.plan_share_listing(plan, pwd_id, stoken, fid, subdir_path == "")
+                    for fid, subdir_path, _ in level
+                )
+            )
+            dir_indexes = asyncio.gather(
+                *(self.plan_dir_index(plan, savepath) for savepath in savepaths)
+            )
+            share_lists, dir_indexes = await asyncio.gather(share_lists, dir_indexes)
+            next_level = []
+            for (_, subdir_path, dir_chain), savepath, share_file_list, (to_pdir_fid, dir_index) in zip(
+                    level, savepaths, share_lists, dir_indexes
+            ):
+                if not share_file_list:
+                    if subdir_path == "":
+                        task["shareurl_ban"] = "分享为空，文件已被分享者删除"
+                        add_notify(f"《{task['taskname']}》：{task['shareurl_ban']}")
+                    continue
+                if not to_pdir_fid:
+                    print(f"❌ 目录 {savepath} fid获取失败，跳过转存")
+                    task_plan.skipped = True
+                    continue
+                next_level += self.plan_dir_files(
+                    plan, task_plan, share_file_list, savepath, to_pdir_fid, dir_index,
+                    pwd_id, stoken, subdir_path, dir_chain,
+                )
+            level = next_level
+
+    # 执行阶段：全部批次并发转存并等待转存任务结束
+    async def execute_save_plan(self, plan):
+        async def save_batch(batch):
+            try:
+                await self.save_batch(batch)
+            except Exception as e:
+                batch.err_msg = str(e)
+                self.invalidate_savepath_fid(batch.savepath)
+
+        await asyncio.gather(
+            *(save_batch(batch) for batch in plan.batches.values() if batch.items)
+        )
+
+    # 转存一个批次并等待转存任务结束，失败原因记录在批次上
+    async def save_batch(self, batch):
+        items = list(batch.items.values())
+        save_file_return = await self.save_file(
+            [item["fid"] for item in items],
+            [item["share_fid_token"] for item in items],
+            batch.to_pdir_fid,
+            batch.pwd_id,
+            batch.stoken,
+        )
+        if save_file_return["code"] == 0:
+            task_id = save_file_return["data"]["task_id"]
+            query_task_return = await self.query_task(task_id)
+            if query_task_return["code"] != 0:
+                batch.err_msg = query_task_return["message"]
+        else:
+            batch.err_msg = save_file_return["message"]
+        if batch.err_msg:
+            # 目标目录可能已被删除，清除缓存的fid
+            self.invalidate_savepath_fid(batch.savepath)
+
+    async def do_rename_task(self, task, dry_run=False, listings=None):
+        """参数与返回值同 Quark.do_rename_task"""
+        rename_plan = await self.plan_rename_task(task, listings)
+        for savepath, file_name, save_name in rename_plan.conflicts:
+            print(f"⚠️ 重命名：{file_name} → {save_name} 跳过，{savepath} 中已有同名文件")
+        if dry_run:
+            for savepath, _, file_name, save_name in rename_plan.renames:
+                print(f"[预演] 重命名：{savepath} {file_name} → {save_name}")
+            return False
+        return await self.execute_rename_plan(rename_plan) > 0
+
+    # 按层并发列出保存目录及全部子文件夹，计算重命名计划
+    async def plan_rename_task(self, task, listings=None):
+        rename_plan = RenamePlan()
+        if not task["pattern"] or not task["replace"]:
+            return rename_plan
+        level = [re.sub(r"/{2,}", "/", f"/{task['savepath']}")]
+        while level:
+            if listings is None:
+                dir_lists = [
+                    dir_file_list
+                    for _, dir_file_list in await asyncio.gather(
+                        *(self.ls_savepath(savepath) for savepath in level)
+                    )
+                ]
+            else:
+                dir_lists = [listings.get(savepath, []) for savepath in level]
+            next_level = []
+            for savepath, dir_file_list in zip(level, dir_lists):
+                plan_dir_renames(rename_plan, task, savepath, dir_file_list)
+                for dir_file in dir_file_list:
+                    if not dir_file["dir"]:
+                        continue
+                    subdir = re.sub(r"/{2,}", "/", f"{savepath}/{dir_file['file_name']}")
+                    if listings is None:
+                        # 子文件夹的fid已在本层列表中，直接缓存
+                        self.cache_savepath_fid(subdir, dir_file["fid"])
+                    next_level.append(subdir)
+            level = next_level
+        return rename_plan
+
+    # 并发执行重命名计划（并发数 RENAME_WORKERS），按完成顺序打印进度，返回成功的数量
+    async def execute_rename_plan(self, rename_plan):
+        total = len(rename_plan.renames)
+        semaphore = asyncio.Semaphore(RENAME_WORKERS)
+        done = 0
+
+        async def rename(savepath, fid, file_name, save_name):
+            nonlocal done
+            async with semaphore:
+                try:
+                    rename_return = await self.rename(fid, save_name)
+                except Exception as e:
+                    rename_return = {"code": -1, "message": str(e)}
+            done += 1
+            if rename_return["code"] == 0:
+                print(f"[{done}/{total}] 重命名：{file_name} → {save_name}")
+                self.rename_savepath_fid(savepath, fid, file_name, save_name)
+                return True
+            print(
+                f"[{done}/{total}] 重命名：{file_name} → {save_name} 失败，{rename_return['message']}"
+            )
+            return False
+
+        results = await asyncio.gather(
+            *(
+                rename(savepath, fid, file_name, save_name)
+                for savepath, fid, file_name, save_name in rename_plan.renames
+            )
+        )
+        return sum(results)
+
+
+async def do_save_async(account, tasklist=[], concurrency=None):
+    """
+    并发执行追更任务
+
+    :param account: 已通过 init() 验证的 AsyncQuark 实例
+    :param tasklist: 任务列表
+    :param concurrency: 同时执行的任务数，默认读取配置 concurrency 或 QUARK_CONCURRENCY
+    """
+    concurrency = concurrency or CONFIG_DATA.get("concurrency") or QUARK_CONCURRENCY
+    emby = await asyncio.to_thread(
+        Emby,
+        CONFIG_DATA.get("emby", {}).get("url", ""),
+        CONFIG_DATA.get("emby", {}).get("apikey", ""),
+    )
+    print(f"转存账号: {account.nickname}（并发数: {concurrency}）")
+    # 预编译任务正则，无效的任务直接跳过
+    invalid_index = load_task_regex(tasklist)
+    # 获取全部保存目录fid
+    await account.update_savepath_fid(tasklist)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    # 计划阶段：各任务并发比对，共用同一计划，同一分享、同一目标目录只获取一次
+    plan = SavePlan()
+
+    async def plan_task(index, task):
+        async with semaphore:
+            print_task_info(index, task)
+            # 单个任务出错（接口异常、熔断等）不影响其他任务
+            try:
+                with task_scope(task["taskname"]):
+                    return task, await account.plan_save_task(plan, task)
+            except Exception as e:
+                add_notify(f"❌《{task['taskname']}》执行失败：{e}\n")
+                return None
+
+    task_plans = await asyncio.gather(
+        *(
+            plan_task(index, task)
+            for index, task in enumerate(tasklist)
+            if check_date(task) and index not in invalid_index
+        )
+    )
+    # 执行阶段：同一分享、同一目标目录的文件合并转存
+    await account.execute_save_plan(plan)
+
+    # 汇总结果，重命名并刷新媒体库
+    async def finish_task(task, task_plan):
+        async with semaphore:
+            try:
+                with task_scope(task["taskname"]):
+                    is_new = account.report_save_task(task, task_plan)
+                    is_rename = await account.do_rename_task(task, dry_run=is_rename_dry_run())
+            except Exception as e:
+                add_notify(f"❌《{task['taskname']}》执行失败：{e}\n")
+                return
+            await asyncio.to_thread(refresh_emby, emby, task, is_new or is_rename)
+
+    print()
+    await asyncio.gather(*(finish_task(*item) for item in task_plans if item))
+    # 保存本次运行新增或失效的缓存
+    account.save_cache()
+
+
+def run_save_async(cookie, tasklist=[], concurrency=None, index=0):
+    """同步入口：创建 AsyncQuark 并并发执行全部任务"""
+
+    async def main():
+        account = AsyncQuark(cookie, index)
+        try:
+            if not await account.init():
+                add_notify(f"👤 第{account.index}个账号登录失败，cookie无效❌")
+                return
+            await do_save_async(account, tasklist, concurrency)
+        finally:
+            await account.close()
+
+    asyncio.run(main())
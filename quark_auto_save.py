@@ -7,32 +7,96 @@
 new Env('夸克自动追更');
 0 8,18,20 * * * quark_auto_save.py
 """
+import io
 import os
 import re
 import sys
 import json
-import time
+import hashlib
+import contextvars
 import random
+import threading
+import traceback
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache, partial
+from itertools import chain, islice
 
 # 兼容青龙
 # from openpyxl import load_workbook
 
-# try:
-#     from treelib import Tree
-# except:
-#     print("正在尝试自动安装依赖...")
-#     os.system("pip3 install treelib &> /dev/null")
-#     from treelib import Tree
+from treelib import Tree
 from flask import jsonify
 
 from db import db_session
+from quark_cache import get_cache
+from quark_http import (
+    QUARK_PAGE_FANOUT,
+    QuarkHttp,
+    QuarkRequestError,
+    bind_context,
+    fetch_pages,
+    iter_pages,
+)
+from quark_metrics import report_metrics, task_scope
+from quark_poller import TaskPoller
 
 CONFIG_DATA = {}
 NOTIFYS = []
 GH_PROXY = os.environ.get("GH_PROXY", "https://ghproxy.net/")
 
+# 并行执行的账号数
+ACCOUNT_WORKERS = int(os.environ.get("QUARK_ACCOUNT_WORKERS", "4"))
+
+# 转存任务使用异步客户端（quark_async）并发执行，也可在配置文件中设置 "async": true
+QUARK_ASYNC = os.environ.get("QUARK_ASYNC", "false").lower() == "true"
+
+# 任务正则编译缓存的最大条数
+REGEX_CACHE_SIZE = int(os.environ.get("QUARK_REGEX_CACHE_SIZE", "256"))
+
+# 同一层子文件夹并发检查的数量
+SUBDIR_WORKERS = int(os.environ.get("QUARK_SUBDIR_WORKERS", "4"))
+
+# 同时执行的重命名请求数
+RENAME_WORKERS = int(os.environ.get("QUARK_RENAME_WORKERS", "4"))
+# 重命名只预演：打印重命名计划而不执行，也可在配置文件中设置 "rename_dry_run": true
+QUARK_RENAME_DRY_RUN = os.environ.get("QUARK_RENAME_DRY_RUN", "false").lower() == "true"
+
+# 清理回收站时每页读取的条数、每次彻底删除的记录数
+RECYCLE_PAGE_SIZE = int(os.environ.get("QUARK_RECYCLE_PAGE_SIZE", "50"))
+RECYCLE_BATCH_SIZE = int(os.environ.get("QUARK_RECYCLE_BATCH_SIZE", "100"))
+
+# 持久化目录fid缓存的有效期（秒），缓存的fid不可用时也会重新获取
+FID_CACHE_TTL = int(os.environ.get("QUARK_FID_CACHE_TTL", str(7 * 24 * 3600)))
+
+# stoken 缓存有效期（秒），分享失效信息的缓存有效期（秒），是否写入磁盘
+STOKEN_CACHE_TTL = int(os.environ.get("QUARK_STOKEN_TTL", "7200"))
+STOKEN_BAN_TTL = int(os.environ.get("QUARK_STOKEN_BAN_TTL", "600"))
+STOKEN_PERSIST = os.environ.get("QUARK_STOKEN_PERSIST", "true").lower() != "false"
+
+# 分享已不存在的错误码，以及分享失效、取消、违规等提示中的关键词
+SHARE_GONE_CODES = {41006}
+# 只匹配针对分享本身的提示，token、stoken、登录失效等临时错误不能匹配
+SHARE_GONE_WORDS = (
+    "分享不存在",
+    "分享已失效",
+    "分享地址已失效",
+    "分享已过期",
+    "取消了分享",
+    "已被分享者删除",
+    "分享的文件已被删除",
+    "涉及违规",
+    "分享者用户封禁",
+)
+
+# 分享快照：分享首页未变化时跳过完整比对
+SHARE_SNAPSHOT = os.environ.get("QUARK_SHARE_SNAPSHOT", "true").lower() != "false"
+# 探测首页时获取的条数
+SNAPSHOT_PROBE_SIZE = int(os.environ.get("QUARK_SNAPSHOT_PROBE_SIZE", "5"))
+# 快照有效期（秒），过期后强制完整比对一次
+SNAPSHOT_TTL = int(os.environ.get("QUARK_SNAPSHOT_TTL", str(24 * 3600)))
+
 MAGIC_REGEX = {
     "$TV": {
         "pattern": ".*?(S\\d{1,2}E)?P?(\\d{1,3}).*?\\.(mp4|mkv)",
@@ -44,13 +108,294 @@ MAGIC_REGEX = {
 # 魔法正则匹配
 def magic_regex_func(pattern, replace):
     keyword = pattern
-    if keyword in CONFIG_DATA["magic_regex"]:
-        pattern = CONFIG_DATA["magic_regex"][keyword]["pattern"]
+    magic_regex = CONFIG_DATA.get("magic_regex", MAGIC_REGEX)
+    if keyword in magic_regex:
+        pattern = magic_regex[keyword]["pattern"]
         if replace == "":
-            replace = CONFIG_DATA["magic_regex"][keyword]["replace"]
+            replace = magic_regex[keyword]["replace"]
     return pattern, replace
 
 
+# 任务正则：魔法正则展开后预编译，每次运行只编译一次
+class TaskRegex:
+    def __init__(self, pattern, replace, update_subdir=""):
+        pattern, self.replace = magic_regex_func(pattern, replace)
+        self.pattern = re.compile(pattern)
+        self.subdir_pattern = re.compile(update_subdir) if update_subdir else None
+
+
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def get_task_regex(pattern, replace, update_subdir=""):
+    return TaskRegex(pattern, replace, update_subdir)
+
+
+# 预编译全部任务正则，返回正则无效的任务序号
+def load_task_regex(tasklist):
+    # 魔法正则配置可能变化，每次运行重新编译
+    get_task_regex.cache_clear()
+    invalid_index = set()
+    for index, task in enumerate(tasklist):
+        try:
+            get_task_regex(task["pattern"], task["replace"], task.get("update_subdir") or "")
+        except re.error as e:
+            invalid_index.add(index)
+            add_notify(f"❌《{task['taskname']}》正则表达式无效，跳过任务：{e}\n")
+    return invalid_index
+
+
+# 目标目录文件名索引，一次建立后按哈希判断文件是否已存在
+class DirIndex:
+    def __init__(self, dir_file_list=()):
+        # 完整文件名
+        self.names = set()
+        # 去掉后缀的文件名，用于忽略后缀比较
+        self.stems = set()
+        # {文件夹名: fid}，递归检查子文件夹时无需再查询fid
+        self.dirs = {}
+        for dir_file in dir_file_list:
+            self.add(dir_file["file_name"])
+            if dir_file.get("dir"):
+                self.dirs[dir_file["file_name"]] = dir_file["fid"]
+
+    def add(self, file_name):
+        self.names.add(file_name)
+        self.stems.add(os.path.splitext(file_name)[0])
+
+    def __contains__(self, file_name):
+        return file_name in self.names
+
+    def exists(self, *file_names, ignore_extension=False):
+        if ignore_extension:
+            return any(os.path.splitext(name)[0] in self.stems for name in file_names)
+        return any(name in self.names for name in file_names)
+
+
+# 匹配分享文件，返回需转存的文件清单和已存在需递归检查的子文件夹
+def match_share_files(task, share_file_list, dir_index):
+    regex = get_task_regex(task["pattern"], task["replace"], task.get("update_subdir") or "")
+    need_save_list = []
+    subdir_list = []
+    for share_file in share_file_list:
+        if share_file["dir"] and regex.subdir_pattern:
+            pattern, replace = regex.subdir_pattern, ""
+        else:
+            pattern, replace = regex.pattern, regex.replace
+        # 正则文件名匹配
+        if pattern.search(share_file["file_name"]):
+            # 替换后的文件名
+            save_name = (
+                pattern.sub(replace, share_file["file_name"])
+                if replace != ""
+                else share_file["file_name"]
+            )
+            # 判断目标目录文件是否存在（忽略后缀时比较去后缀的文件名）
+            file_exists = dir_index.exists(
+                share_file["file_name"],
+                save_name,
+                ignore_extension=task.get("ignore_extension") and not share_file["dir"],
+            )
+            if not file_exists:
+                # 分享列表可能被多个任务共用，不修改原条目
+                need_save_list.append({**share_file, "save_name": save_name})
+            elif share_file["dir"]:
+                # 存在并是一个文件夹
+                if regex.subdir_pattern:
+                    if regex.subdir_pattern.search(share_file["file_name"]):
+                        subdir_list.append(share_file)
+    return need_save_list, subdir_list
+
+
+# 转存批次：同一分享转存到同一目标目录的文件，合并为一次 save_file
+class SaveBatch:
+    def __init__(self, pwd_id, stoken, to_pdir_fid, savepath):
+        self.pwd_id = pwd_id
+        self.stoken = stoken
+        self.to_pdir_fid = to_pdir_fid
+        self.savepath = savepath
+        # {fid: 分享文件}，多个任务匹配到同一文件时只转存一次
+        self.items = {}
+        self.err_msg = None
+
+    def add(self, share_file):
+        self.items.setdefault(share_file["fid"], share_file)
+
+
+# 单个任务的转存计划
+class TaskPlan:
+    def __init__(self, task, pdir_fid, snapshot_key=None, signature=None):
+        self.task = task
+        self.pdir_fid = pdir_fid
+        self.snapshot_key = snapshot_key
+        # 分享首页快照，全部层级比对并转存成功后才记录
+        self.signature = signature
+        # 有目标目录获取失败而跳过的层级
+        self.skipped = False
+        # [(转存批次, 所在子文件夹链 ((fid, 文件夹名), ...), 分享文件)]
+        self.entries = []
+
+    def add(self, batch, dir_chain, share_file):
+        batch.add(share_file)
+        self.entries.append((batch, dir_chain, share_file))
+
+    @property
+    def errors(self):
+        return list(dict.fromkeys(batch.err_msg for batch, _, _ in self.entries if batch.err_msg))
+
+    def build_tree(self):
+        """根据转存成功的批次建立目录树"""
+        tree = Tree()
+        tree.create_node(self.task["savepath"], self.pdir_fid)
+        for batch, dir_chain, item in self.entries:
+            if batch.err_msg:
+                continue
+            parent = self.pdir_fid
+            for fid, file_name in dir_chain:
+                if not tree.contains(fid):
+                    tree.create_node("📁" + file_name, fid, parent=parent)
+                parent = fid
+            icon = (
+                "📁"
+                if item["dir"] == True
+                else "🎞️" if item["obj_category"] == "video" else ""
+            )
+            tree.create_node(f"{icon}{item['save_name']}", item["fid"], parent=parent)
+        return tree
+
+
+# 一次运行的转存计划：同一分享的 stoken、文件列表只获取一次，转存请求按目标目录合并
+# （异步版 stokens、signatures、listings、dir_indexes 中保存的是对应结果的 Future）
+class SavePlan:
+    def __init__(self):
+        self.tasks = []
+        # {(pwd_id, to_pdir_fid): SaveBatch}
+        self.batches = {}
+        # {pwd_id: (is_sharing, stoken)}
+        self.stokens = {}
+        # {(pwd_id, pdir_fid): 分享签名}
+        self.signatures = {}
+        # {(pwd_id, pdir_fid): 分享文件列表}
+        self.listings = {}
+        # {pwd_id: 使用该分享的任务数}，只有一个任务使用的分享逐页流式比对，不缓存完整列表
+        self.share_tasks = {}
+        # {savepath: (to_pdir_fid, DirIndex)}
+        self.dir_indexes = {}
+        # {savepath: 计划转存的文件名}，这些文件尚未存在，无需递归检查
+        self.planned_names = {}
+
+    def get_batch(self, pwd_id, stoken, to_pdir_fid, savepath):
+        key = (pwd_id, to_pdir_fid)
+        if key not in self.batches:
+            self.batches[key] = SaveBatch(pwd_id, stoken, to_pdir_fid, savepath)
+        return self.batches[key]
+
+
+# 重命名计划：先计算整个目录树需要重命名的文件并排除重名，再统一执行
+class RenamePlan:
+    def __init__(self):
+        # [(目录路径, fid, 原文件名, 新文件名)]
+        self.renames = []
+        # [(目录路径, 原文件名, 新文件名)]，新文件名与已有文件或其他文件的新文件名重复
+        self.conflicts = []
+
+
+# 计算一个目录中需要重命名的文件，新文件名按目录内的文件名索引判断是否重名
+def plan_dir_renames(rename_plan, task, savepath, dir_file_list):
+    regex = get_task_regex(task["pattern"], task["replace"], task.get("update_subdir") or "")
+    dir_index = DirIndex(dir_file_list)
+    for dir_file in dir_file_list:
+        if not regex.pattern.search(dir_file["file_name"]):
+            continue
+        save_name = (
+            regex.pattern.sub(regex.replace, dir_file["file_name"])
+            if regex.replace != ""
+            else dir_file["file_name"]
+        )
+        if save_name == dir_file["file_name"]:
+            continue
+        if save_name in dir_index:
+            rename_plan.conflicts.append((savepath, dir_file["file_name"], save_name))
+            continue
+        # 之后的文件不能再重命名为同一个名字
+        dir_index.add(save_name)
+        rename_plan.renames.append((savepath, dir_file["fid"], dir_file["file_name"], save_name))
+
+
+# 重命名是否只预演
+def is_rename_dry_run():
+    return QUARK_RENAME_DRY_RUN or bool(CONFIG_DATA.get("rename_dry_run"))
+
+
+# 判断任务期限
+def check_date(task):
+    return (
+                   not task.get("enddate")
+                   or (
+                           datetime.now().date()
+                           <= datetime.strptime(task["enddate"], "%Y-%m-%d").date()
+                   )
+           ) and (
+                   not task.get("runweek")
+                   # 星期一为0，星期日为6
+                   or (datetime.today().weekday() + 1 in task.get("runweek"))
+           )
+
+
+# 任务快照的键：分享链接、保存路径或匹配规则变化时视为新任务
+def snapshot_key(account_key, task):
+    task_key = json.dumps(
+        [
+            task["shareurl"],
+            task["savepath"],
+            task.get("pattern", ""),
+            task.get("replace", ""),
+            task.get("update_subdir", ""),
+            task.get("ignore_extension", False),
+        ],
+        ensure_ascii=False,
+    )
+    return f"{account_key}:{hashlib.md5(task_key.encode('utf-8')).hexdigest()}"
+
+
+# 分享列表签名：总数 + 最近更新的若干文件的 fid / 更新时间
+def share_signature(response):
+    if response.get("code") != 0 or not response["data"]["list"]:
+        return None
+    return {
+        "total": response["metadata"]["_total"],
+        "head": [
+            [item["fid"], item.get("updated_at"), item.get("include_items")]
+            for item in response["data"]["list"]
+        ],
+    }
+
+
+# 分享接口的错误是否表示分享已不可用（区别于 stoken 过期、限流等临时错误）
+def is_share_gone(code, message):
+    if code in SHARE_GONE_CODES:
+        return True
+    return any(word in str(message or "") for word in SHARE_GONE_WORDS)
+
+
+# 打印任务信息
+def print_task_info(index, task):
+    print()
+    print(f"#{index + 1}------------------")
+    print(f"任务名称: {task['taskname']}")
+    print(f"分享链接: {task['shareurl']}")
+    print(f"目标目录: {task['savepath']}")
+    print(f"正则匹配: {task['pattern']}")
+    print(f"正则替换: {task['replace']}")
+    if task.get("enddate"):
+        print(f"任务截止: {task['enddate']}")
+    if task.get("emby_id"):
+        print(f"刷媒体库: {task['emby_id']}")
+    if task.get("ignore_extension"):
+        print(f"忽略后缀: {task['ignore_extension']}")
+    if task.get("update_subdir"):
+        print(f"更子目录: {task['update_subdir']}")
+    print()
+
+
 # 发送通知消息
 def send_ql_notify(title, body):
     try:
@@ -70,11 +415,78 @@ def send_ql_notify(title, body):
 # 添加消息
 def add_notify(text):
     global NOTIFYS
-    NOTIFYS.append(text)
+    # 多账号并行时先记入当前账号的通知，结束后按账号顺序汇总
+    output = _account_output.get()
+    (NOTIFYS if output is None else output[1]).append(text)
     print("📢", text)
     return text
 
 
+# 多账号并行时，各账号的输出和通知先写入自己的缓冲区：(输出缓冲区, 通知列表)
+# 使用上下文变量，账号内提交到线程池的子任务复制上下文后也写入同一缓冲区
+_account_output = contextvars.ContextVar("account_output", default=None)
+
+
+class AccountStdout:
+    """按上下文分流的 stdout：设置了缓冲区的上下文写入缓冲区，其余照常输出"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        output = _account_output.get()
+        return (self.stream if output is None else output[0]).write(text)
+
+    def flush(self):
+        if _account_output.get() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+# 并行对每个账号执行 func(account)，按账号顺序输出日志、汇总通知
+# 第一个账号的输出直接写入 stdout，其余账号先写入缓冲区，前面的账号结束后依次输出
+def run_accounts(func, accounts, max_workers=None):
+    max_workers = min(max_workers or ACCOUNT_WORKERS, len(accounts))
+    if max_workers <= 1:
+        return [func(account) for account in accounts]
+
+    def run(account):
+        buffered = account is not accounts[0]
+        buffer, notifys = io.StringIO(), []
+        token = _account_output.set((buffer, notifys)) if buffered else None
+        error = None
+        try:
+            result = func(account)
+        except Exception as e:
+            result = None
+            error = e
+            traceback.print_exc(file=buffer if buffered else sys.stdout)
+        finally:
+            if token:
+                _account_output.reset(token)
+        return result, buffer.getvalue(), notifys, error
+
+    results = []
+    stdout = sys.stdout
+    sys.stdout = AccountStdout(stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map 按账号顺序返回，每个账号结束即输出，不必等全部账号完成
+            for account, (result, output, notifys, error) in zip(
+                    accounts, executor.map(run, accounts)
+            ):
+                print(output, end="")
+                NOTIFYS.extend(notifys)
+                if error:
+                    add_notify(f"❌ 第{account.index}个账号执行失败：{error}")
+                results.append(result)
+    finally:
+        sys.stdout = stdout
+    return results
+
+
 # 下载配置
 def download_file(url, save_path):
     response = requests.get(url)
@@ -107,11 +519,32 @@ class Quark:
         self.nickname = ""
         self.st = self.match_st_form_cookie(cookie)
         self.savepath_fid = {"/": "0"}
+        # 账号标识，用于区分持久化缓存
+        self.account_key = self.match_account_key(self.cookie)
+        # 持久化的目录fid缓存，跨运行复用
+        self.fid_cache = get_cache("savepath_fid", FID_CACHE_TTL)
+        # 每个任务上次完整比对时的分享签名
+        self.share_snapshot = get_cache("share_snapshot", SNAPSHOT_TTL)
+        # 分享的 stoken 或失效信息，按 pwd_id 缓存
+        self.stoken_cache = get_cache("share_stoken", STOKEN_CACHE_TTL)
+        # 本次运行从缓存取出的 stoken {(pwd_id, stoken)}，接口报错时可能已过期
+        self.cached_stokens = set()
+        # 已重新获取的 stoken {(pwd_id, 旧 stoken): 新 stoken 或 None}
+        self.stoken_renewals = {}
+        self.stoken_lock = threading.Lock()
+        # 账号内共享的连接池会话
+        self.http = QuarkHttp(account=self.account_key)
+        # 账号内共享的任务轮询器
+        self.task_poller = TaskPoller(self._task_page)
 
     def match_st_form_cookie(self, cookie):
         match = re.search(r"=(st[a-zA-Z0-9]+);", cookie)
         return match.group(1) if match else False
 
+    def match_account_key(self, cookie):
+        match = re.search(r"__uid=([^;]+)", cookie)
+        return match.group(1) if match else hashlib.md5(cookie.encode("utf-8")).hexdigest()
+
     def common_headers(self):
         headers = {
             "cookie": self.cookie,
@@ -121,6 +554,12 @@ class Quark:
             headers["x-clouddrive-st"] = self.st
         return headers
 
+    def _request(self, method, url, **kwargs):
+        return self.http.request_json(method, url, **kwargs)
+
+    def close(self):
+        self.http.close()
+
     def init(self):
         account_info = self.get_account_info()
         if account_info:
@@ -137,9 +576,9 @@ class Quark:
             "cookie": self.cookie,
             "content-type": "application/json",
         }
-        response = requests.request(
+        response = self._request(
             "GET", url, headers=headers, params=querystring
-        ).json()
+        )
         if response.get("data"):
             return response["data"]
         else:
@@ -152,9 +591,9 @@ class Quark:
             "cookie": self.cookie,
             "content-type": "application/json",
         }
-        response = requests.request(
+        response = self._request(
             "GET", url, headers=headers, params=querystring
-        ).json()
+        )
         if response.get("data"):
             return response["data"]
         else:
@@ -170,9 +609,9 @@ class Quark:
             "cookie": self.cookie,
             "content-type": "application/json",
         }
-        response = requests.request(
+        response = self._request(
             "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
+        )
         if response.get("data"):
             return True, response["data"]["sign_daily_reward"]
         else:
@@ -192,98 +631,185 @@ class Quark:
         else:
             return None
 
+    # 保存本次运行新增或失效的目录fid、分享快照、stoken
+    def save_cache(self):
+        self.fid_cache.save()
+        self.share_snapshot.save()
+        if STOKEN_PERSIST:
+            self.stoken_cache.save()
+
+    def get_cached_stoken(self, pwd_id):
+        if cached := self.stoken_cache.get(pwd_id):
+            return tuple(cached)
+        return None
+
+    # 缓存 get_stoken 的结果，限流、服务端异常等临时错误不缓存
+    def cache_stoken(self, pwd_id, response):
+        if response.get("data"):
+            result = True, response["data"]["stoken"]
+            self.stoken_cache.set(pwd_id, list(result))
+        else:
+            result = False, response["message"]
+            status = response.get("status") or 0
+            if status != 429 and status < 500:
+                self.stoken_cache.set(pwd_id, list(result), STOKEN_BAN_TTL)
+        return result
+
+    # 分享接口报错（stoken 过期、分享失效等）时清除缓存，下次重新获取
+    def invalidate_stoken(self, pwd_id, response):
+        if response.get("code") != 0:
+            self.stoken_cache.delete(pwd_id)
+
     # 可验证资源是否失效
     def get_stoken(self, pwd_id):
+        if cached := self.get_cached_stoken(pwd_id):
+            if cached[0]:
+                self.cached_stokens.add((pwd_id, cached[1]))
+            return cached
+        return self.fetch_stoken(pwd_id)
+
+    def fetch_stoken(self, pwd_id):
         # url = "https://drive-m.quark.cn/1/clouddrive/share/sharepage/token"
         url = "https://drive-h.quark.cn/1/clouddrive/share/sharepage/token"
         querystring = {"pr": "ucpro", "fr": "h5"}
         # payload = {"pwd_id": pwd_id, "passcode": ""}
         payload = {"pwd_id": pwd_id, "passcode": "", "support_visit_limit_private_share": True}
         headers = self.common_headers()
-        response = requests.request(
+        response = self._request(
             "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
-        if response.get("data"):
-            return True, response["data"]["stoken"]
-        else:
-            return False, response["message"]
+        )
+        return self.cache_stoken(pwd_id, response)
+
+    # 缓存的 stoken 报错时重新获取，同一 stoken 只获取一次，返回新的 stoken（无需更新时为 None）
+    def renew_stoken(self, pwd_id, stoken):
+        key = (pwd_id, stoken)
+        with self.stoken_lock:
+            if key not in self.stoken_renewals:
+                self.stoken_renewals[key] = None
+                if key in self.cached_stokens:
+                    self.stoken_cache.delete(pwd_id)
+                    is_sharing, new_stoken = self.fetch_stoken(pwd_id)
+                    if is_sharing and new_stoken != stoken:
+                        print(f"分享 {pwd_id} 缓存的stoken已失效，重新获取")
+                        self.stoken_renewals[key] = new_stoken
+            return self.stoken_renewals[key]
+
+    # 带 stoken 的分享接口：缓存的 stoken 失效时用新 stoken 重试一次，仍报错则清除缓存
+    def _share_request(self, pwd_id, stoken, send):
+        stoken = self.stoken_renewals.get((pwd_id, stoken)) or stoken
+        response = send(stoken)
+        status = response.get("status") or 0
+        if response.get("code") != 0 and status != 429 and status < 500:
+            if new_stoken := self.renew_stoken(pwd_id, stoken):
+                response = send(new_stoken)
+        self.invalidate_stoken(pwd_id, response)
+        return response
+
+    def _detail_page(
+            self,
+            pwd_id,
+            stoken,
+            pdir_fid,
+            page,
+            size=50,
+            sort="file_type:asc,updated_at:desc",
+    ):
+        # url = "https://drive-m.quark.cn/1/clouddrive/share/sharepage/detail"
+        url = "https://drive-h.quark.cn/1/clouddrive/share/sharepage/detail"
+        querystring = {
+            "pr": "ucpro",
+            "fr": "pc",
+            "uc_param_str": "",
+            "pwd_id": pwd_id,
+            "stoken": stoken,
+            "pdir_fid": pdir_fid,
+            "force": "0",
+            "_page": page,
+            "_size": str(size),
+            "_fetch_banner": "0",
+            "_fetch_share": "0",
+            "_fetch_total": "1",
+            "_sort": sort,
+        }
+        headers = self.common_headers()
+        return self._share_request(
+            pwd_id,
+            stoken,
+            lambda stoken: self._request(
+                "GET", url, headers=headers, params={**querystring, "stoken": stoken}
+            ),
+        )
 
     # 校验资源
     def get_detail(self, pwd_id, stoken, pdir_fid):
-        file_list = []
-        page = 1
-        while True:
-            # url = "https://drive-m.quark.cn/1/clouddrive/share/sharepage/detail"
-            url = "https://drive-h.quark.cn/1/clouddrive/share/sharepage/detail"
-            querystring = {
-                "pr": "ucpro",
-                "fr": "pc",
-                "uc_param_str": "",
-                "pwd_id": pwd_id,
-                "stoken": stoken,
-                "pdir_fid": pdir_fid,
-                "force": "0",
-                "_page": page,
-                "_size": "50",
-                "_fetch_banner": "0",
-                "_fetch_share": "0",
-                "_fetch_total": "1",
-                "_sort": "file_type:asc,updated_at:desc",
-            }
-            print(querystring)
-            headers = self.common_headers()
-            response = requests.request(
-                "GET", url, headers=headers, params=querystring
-            ).json()
-            if response["data"]["list"]:
-                file_list += response["data"]["list"]
-                page += 1
-            else:
-                break
-            if len(file_list) >= response["metadata"]["_total"]:
-                break
-        return file_list
+        return fetch_pages(partial(self._detail_page, pwd_id, stoken, pdir_fid))
+
+    # 逐页返回分享文件，后续页边比对边并发预取，内存中只保留预取的几页
+    def iter_detail(self, pwd_id, stoken, pdir_fid):
+        return iter_pages(
+            partial(self._detail_page, pwd_id, stoken, pdir_fid), max_workers=QUARK_PAGE_FANOUT
+        )
+
+    # 探测分享首页（按更新时间倒序，只取少量条目），返回分享签名
+    def probe_share(self, pwd_id, stoken, pdir_fid):
+        response = self._detail_page(
+            pwd_id, stoken, pdir_fid, 1, SNAPSHOT_PROBE_SIZE, "updated_at:desc"
+        )
+        signature = share_signature(response)
+        # 仅有一个文件夹时，更新多发生在文件夹内，一并探测
+        if signature and signature["total"] == 1 and response["data"]["list"][0]["dir"]:
+            inner = self._detail_page(
+                pwd_id,
+                stoken,
+                response["data"]["list"][0]["fid"],
+                1,
+                SNAPSHOT_PROBE_SIZE,
+                "updated_at:desc",
+            )
+            signature["inner"] = share_signature(inner)
+        return signature
+
+    def _detail_v2_page(self, pwd_id, stoken, pdir_fid, page, size=50):
+        url = "https://drive-m.quark.cn/1/clouddrive/share/sharepage/detail"
+        # url = "https://drive-h.quark.cn/1/clouddrive/share/sharepage/detail"
+        querystring = {
+            "pr": "ucpro",
+            "fr": "pc",
+            "uc_param_str": "",
+            "ver": "2",
+            "pwd_id": pwd_id,
+            "stoken": stoken,
+            "pdir_fid": pdir_fid,
+            "force": "0",
+            "_page": page,
+            "_size": str(size),
+            "_fetch_banner": "0",
+            "_fetch_share": "0",
+            "_fetch_total": "1",
+            "_sort": "file_type:asc,updated_at:desc",
+        }
+        headers = self.common_headers()
+        return self._share_request(
+            pwd_id,
+            stoken,
+            lambda stoken: self._request(
+                "GET", url, headers=headers, params={**querystring, "stoken": stoken}
+            ),
+        )
 
     # 检测资源，对内使用
     def get_detail_v2(self, pwd_id, stoken, pdir_fid):
-        file_list = []
-        page = 1
-        while True:
-            url = "https://drive-m.quark.cn/1/clouddrive/share/sharepage/detail"
-            # url = "https://drive-h.quark.cn/1/clouddrive/share/sharepage/detail"
-            querystring = {
-                "pr": "ucpro",
-                "fr": "pc",
-                "uc_param_str": "",
-                "ver": "2",
-                "pwd_id": pwd_id,
-                "stoken": stoken,
-                "pdir_fid": pdir_fid,
-                "force": "0",
-                "_page": page,
-                "_size": "50",
-                "_fetch_banner": "0",
-                "_fetch_share": "0",
-                "_fetch_total": "1",
-                "_sort": "file_type:asc,updated_at:desc",
-            }
-
-            headers = self.common_headers()
-            response = requests.request(
-                "GET", url, headers=headers, params=querystring
-            ).json()
-            print(response)
-            if response["code"] != 0:
-                break
-
-            if response["data"]["list"]:
-                file_list += response["data"]["list"]
-                page += 1
-            else:
-                break
-            if len(file_list) >= response["metadata"]["_total"]:
-                break
-        return file_list
+        return fetch_pages(partial(self._detail_v2_page, pwd_id, stoken, pdir_fid), stop_on_error=True)
+
+    # 探测资源是否有效：只请求第 1 页的 1 个条目，分享非空即有效，分享已失效为无效；
+    # 其他错误无法判断，抛出 QuarkRequestError
+    def probe_detail_v2(self, pwd_id, stoken, pdir_fid):
+        response = self._detail_v2_page(pwd_id, stoken, pdir_fid, 1, 1)
+        if response.get("code") == 0:
+            return bool((response.get("data") or {}).get("list"))
+        if is_share_gone(response.get("code"), response.get("message")):
+            return False
+        raise QuarkRequestError(f"探测分享 {pwd_id} 失败：{response.get('message')}")
 
     def get_fids(self, file_paths):
         fids = []
@@ -292,9 +818,9 @@ class Quark:
             querystring = {"pr": "ucpro", "fr": "pc"}
             payload = {"file_path": file_paths[:50], "namespace": "0"}
             headers = self.common_headers()
-            response = requests.request(
+            response = self._request(
                 "POST", url, json=payload, headers=headers, params=querystring
-            ).json()
+            )
             if response["code"] == 0:
                 fids += response["data"]
                 file_paths = file_paths[50:]
@@ -306,39 +832,33 @@ class Quark:
         # print(fids)
         return fids
 
+    def _dir_page(self, pdir_fid, page):
+        url = "https://drive-m.quark.cn/1/clouddrive/file/sort"
+        querystring = {
+            "pr": "ucpro",
+            "fr": "pc",
+            "uc_param_str": "",
+            "pdir_fid": pdir_fid,
+            "_page": page,
+            "_size": "50",
+            "_fetch_total": "1",
+            "_fetch_sub_dirs": "0",
+            "_sort": "file_type:asc,updated_at:desc",
+        }
+        headers = self.common_headers()
+        return self._request(
+            "GET", url, headers=headers, params=querystring
+        )
+
     def ls_dir(self, pdir_fid):
-        file_list = []
-        page = 1
-        while True:
-            url = "https://drive-m.quark.cn/1/clouddrive/file/sort"
-            querystring = {
-                "pr": "ucpro",
-                "fr": "pc",
-                "uc_param_str": "",
-                "pdir_fid": pdir_fid,
-                "_page": page,
-                "_size": "50",
-                "_fetch_total": "1",
-                "_fetch_sub_dirs": "0",
-                "_sort": "file_type:asc,updated_at:desc",
-            }
-            headers = self.common_headers()
-            response = requests.request(
-                "GET", url, headers=headers, params=querystring
-            ).json()
-            if response["data"]["list"]:
-                file_list += response["data"]["list"]
-                page += 1
-            else:
-                break
-            if len(file_list) >= response["metadata"]["_total"]:
-                break
-        return file_list
+        return fetch_pages(partial(self._dir_page, pdir_fid))
+
+    # 逐页返回目录文件，可提前结束（用于只需前若干条的场景，如 /api/quark/ls_dir?limit=）
+    def iter_dir(self, pdir_fid):
+        return iter_pages(partial(self._dir_page, pdir_fid))
 
     def ls_share(self):
-        file_list = []
-        page = 1
-        while True:
+        def fetch_page(page):
             url = "https://drive-pc.quark.cn/1/clouddrive/share/mypage/detail"
             querystring = {
                 "pr": "ucpro",
@@ -351,17 +871,11 @@ class Quark:
                 "_fetch_notify_follow": "1",
             }
             headers = self.common_headers()
-            response = requests.request(
+            return self._request(
                 "GET", url, headers=headers, params=querystring
-            ).json()
-            if response["data"]["list"]:
-                file_list += response["data"]["list"]
-                page += 1
-            else:
-                break
-            if len(file_list) >= response["metadata"]["_total"]:
-                break
-        return file_list
+            )
+
+        return fetch_pages(fetch_page)
 
     def ls_share_page(self, page=1, size=10):
        url = "https://drive-pc.quark.cn/1/clouddrive/share/mypage/detail"
@@ -376,9 +890,9 @@ class Quark:
            "_fetch_notify_follow": "1",
        }
        headers = self.common_headers()
-       response = requests.request(
+       response = self._request(
            "GET", url, headers=headers, params=querystring
-       ).json()
+       )
        if response["data"]["list"]:
            file_list = response["data"]["list"]
        return file_list
@@ -404,10 +918,13 @@ class Quark:
             "scene": "link",
         }
         headers = self.common_headers()
-        response = requests.request(
-            "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
-        return response
+        return self._share_request(
+            pwd_id,
+            stoken,
+            lambda stoken: self._request(
+                "POST", url, json={**payload, "stoken": stoken}, headers=headers, params=querystring
+            ),
+        )
 
     def mkdir(self, dir_path):
         url = "https://drive-m.quark.cn/1/clouddrive/file"
@@ -419,9 +936,9 @@ class Quark:
             "dir_init_lock": False,
         }
         headers = self.common_headers()
-        response = requests.request(
+        response = self._request(
             "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
+        )
         return response
 
     def rename(self, fid, file_name):
@@ -429,9 +946,9 @@ class Quark:
         querystring = {"pr": "ucpro", "fr": "pc", "uc_param_str": ""}
         payload = {"fid": fid, "file_name": file_name}
         headers = self.common_headers()
-        response = requests.request(
+        response = self._request(
             "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
+        )
         return response
 
     def delete(self, filelist):
@@ -439,12 +956,15 @@ class Quark:
         querystring = {"pr": "ucpro", "fr": "pc", "uc_param_str": ""}
         payload = {"action_type": 2, "filelist": filelist, "exclude_fids": []}
         headers = self.common_headers()
-        response = requests.request(
+        response = self._request(
             "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
+        )
         return response
 
     def recycle_list(self, page=1, size=30):
+        return self._recycle_page(page, size)["data"]["list"]
+
+    def _recycle_page(self, page, size):
         url = "https://drive-m.quark.cn/1/clouddrive/file/recycle/list"
         querystring = {
             "_page": page,
@@ -454,10 +974,9 @@ class Quark:
             "uc_param_str": "",
         }
         headers = self.common_headers()
-        response = requests.request(
+        return self._request(
             "GET", url, headers=headers, params=querystring
-        ).json()
-        return response["data"]["list"]
+        )
 
     def share_dir(self, fid_list, title):
         url = "https://drive-pc.quark.cn/1/clouddrive/share"
@@ -469,13 +988,15 @@ class Quark:
             "expired_type": 1
         }
         headers = self.common_headers()
-        response = requests.request(
+        response = self._request(
             "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
+        )
         print(response)
-        time.sleep(1)
         share_task = self.query_task(response['data']['task_id'])
         print(share_task)
+        if share_task["code"] != 0:
+            print(f"创建分享失败：{share_task['message']}")
+            return False
         share = self.share_password(share_task['data']['share_id'])
         return share
 
@@ -487,11 +1008,122 @@ class Quark:
             "record_list": record_list,
         }
         headers = self.common_headers()
-        response = requests.request(
+        response = self._request(
             "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
+        )
         return response
 
+    # 删除文件并从回收站彻底删除，返回彻底删除的记录数
+    def delete_permanently(self, fids):
+        delete_return = self.delete(fids)
+        if delete_return.get("code") != 0:
+            print(f"删除文件失败：{delete_return.get('message')}")
+            return 0
+        # 删除是异步任务，完成后文件才进入回收站
+        self.query_task(delete_return["data"]["task_id"])
+        # 回收站按删除时间倒序，只翻到找齐全部记录为止；服务端可能限制单页条数，
+        # 按空页或 _total 判断是否翻完，不按单页条数
+        pending = set(fids)
+        record_ids = []
+        page = 1
+        read_count = 0
+        while pending:
+            response = self._recycle_page(page, RECYCLE_PAGE_SIZE)
+            recycle_list = response["data"]["list"]
+            for item in recycle_list:
+                if item["fid"] in pending:
+                    pending.discard(item["fid"])
+                    record_ids.append(item["record_id"])
+            read_count += len(recycle_list)
+            if not recycle_list or read_count >= response["metadata"]["_total"]:
+                break
+            page += 1
+        if pending:
+            print(f"回收站中未找到 {len(pending)} 个已删除文件")
+        # 分批彻底删除，统一等待全部任务结束
+        futures = []
+        for start in range(0, len(record_ids), RECYCLE_BATCH_SIZE):
+            remove_return = self.recycle_remove(record_ids[start:start + RECYCLE_BATCH_SIZE])
+            if remove_return.get("code") != 0:
+                print(f"彻底删除失败：{remove_return.get('message')}")
+            elif task_id := (remove_return.get("data") or {}).get("task_id"):
+                futures.append(self.task_poller.submit(task_id))
+        for future in futures:
+            future.result()
+        return len(record_ids)
+
+    def cache_savepath_fid(self, savepath, fid):
+        self.savepath_fid[savepath] = fid
+        self.fid_cache.set(f"{self.account_key}:{savepath}", fid)
+
+    def get_cached_savepath_fid(self, savepath):
+        fid = self.savepath_fid.get(savepath)
+        if not fid:
+            fid = self.fid_cache.get(f"{self.account_key}:{savepath}")
+            if fid:
+                self.savepath_fid[savepath] = fid
+        return fid
+
+    # 目录fid失效（目录被删除、转存失败等）时清除缓存，下次重新获取
+    def invalidate_savepath_fid(self, savepath):
+        if savepath == "/":
+            return
+        self.savepath_fid.pop(savepath, None)
+        self.fid_cache.delete(f"{self.account_key}:{savepath}")
+
+    # 文件夹重命名后，缓存的该文件夹及其子文件夹的fid改用新路径
+    def rename_savepath_fid(self, savepath, fid, file_name, save_name):
+        old_path = re.sub(r"/{2,}", "/", f"{savepath}/{file_name}")
+        if self.get_cached_savepath_fid(old_path) != fid:
+            return
+        new_path = re.sub(r"/{2,}", "/", f"{savepath}/{save_name}")
+        for path, path_fid in list(self.savepath_fid.items()):
+            if path == old_path or path.startswith(f"{old_path}/"):
+                self.invalidate_savepath_fid(path)
+                self.cache_savepath_fid(new_path + path[len(old_path):], path_fid)
+
+    def resolve_savepath_fid(self, savepath):
+        if fid := self.get_cached_savepath_fid(savepath):
+            return fid
+        if get_fids := self.get_fids([savepath]):
+            self.cache_savepath_fid(savepath, get_fids[0]["fid"])
+            return get_fids[0]["fid"]
+        return None
+
+    # 新建目录并缓存fid，失败返回None
+    def mkdir_savepath(self, savepath):
+        mkdir_return = self.mkdir(savepath)
+        if mkdir_return.get("code") == 0:
+            print(f"创建文件夹：{savepath}")
+            self.cache_savepath_fid(savepath, mkdir_return["data"]["fid"])
+            return mkdir_return["data"]["fid"]
+        print(f"创建文件夹：{savepath} 失败, {mkdir_return.get('message')}")
+        return None
+
+    # 列出目标目录，缓存的fid不可用时重新获取fid后再试一次，目录已被删除时重新创建
+    def ls_savepath(self, savepath):
+        to_pdir_fid = self.resolve_savepath_fid(savepath)
+        if not to_pdir_fid:
+            return None, []
+        dir_file_list = self.ls_savepath_dir(to_pdir_fid)
+        if dir_file_list is None:
+            print(f"目录 {savepath} 的缓存fid已失效，重新获取")
+            self.invalidate_savepath_fid(savepath)
+            to_pdir_fid = self.resolve_savepath_fid(savepath) or self.mkdir_savepath(savepath)
+            if not to_pdir_fid:
+                return None, []
+            dir_file_list = self.ls_savepath_dir(to_pdir_fid)
+            if dir_file_list is None:
+                return None, []
+        return to_pdir_fid, dir_file_list
+
+    # 列出目录，首页 code != 0（目录已被删除、fid 不属于当前账号等）时返回 None
+    def ls_savepath_dir(self, pdir_fid):
+        first = self._dir_page(pdir_fid, 1)
+        if first.get("code") != 0:
+            return None
+        return fetch_pages(lambda page: first if page == 1 else self._dir_page(pdir_fid, page))
+
     def update_savepath_fid(self, tasklist):
         dir_paths = [
             re.sub(r"/{2,}", "/", f"/{item['savepath']}")
@@ -504,6 +1136,14 @@ class Quark:
         ]
         if not dir_paths:
             return False
+        # 只解析持久化缓存中没有的目录
+        dir_paths = [
+            dir_path
+            for dir_path in set(dir_paths)
+            if not self.get_cached_savepath_fid(dir_path)
+        ]
+        if not dir_paths:
+            return True
         dir_paths_exist_arr = self.get_fids(dir_paths)
         dir_paths_exist = [item["file_path"] for item in dir_paths_exist_arr]
         # 比较创建不存在的
@@ -520,8 +1160,9 @@ class Quark:
                 print(f"创建文件夹：{dir_path} 失败, {mkdir_return['message']}")
         # 储存目标目录的fid
         for dir_path in dir_paths_exist_arr:
-            self.savepath_fid[dir_path["file_path"]] = dir_path["fid"]
-        # print(dir_paths_exist_arr)
+            self.cache_savepath_fid(dir_path["file_path"], dir_path["fid"])
+        self.fid_cache.save()
+        return True
 
     def do_save_check(self, shareurl, savepath):
         try:
@@ -538,25 +1179,19 @@ class Quark:
                 get_fids[0]["fid"] if get_fids else self.mkdir(savepath)["data"]["fid"]
             )
 
-            # 删除同名文件
+            # 删除 60 秒内创建的同名文件（created_at 为毫秒时间戳）
             dir_file_list = self.ls_dir(to_pdir_fid)
+            file_names = set(file_name_list)
+            now_ms = datetime.now().timestamp() * 1000
             del_list = [
                 item["fid"]
                 for item in dir_file_list
-                if (item["file_name"] in file_name_list)
-                   and ((datetime.now().timestamp() - item["created_at"]) < 60)
+                if item["file_name"] in file_names
+                   and now_ms - item["created_at"] < 60 * 1000
             ]
             print(f"删除文件列表：{del_list}")
             if del_list:
-                self.delete(del_list)
-                recycle_list = self.recycle_list()
-                record_id_list = [
-                    item["record_id"]
-                    for item in recycle_list
-                    if item["fid"] in del_list
-                ]
-                self.recycle_remove(record_id_list)
-            time.sleep(2)
+                self.delete_permanently(del_list)
             save_file = self.save_file(
                 fid_list, fid_token_list, to_pdir_fid, pwd_id, stoken
             )
@@ -567,7 +1202,8 @@ class Quark:
             elif save_file["code"] == 0:
             # elif save_file["code"] == 0 :
 
-                time.sleep(2)
+                # 等待转存任务完成后再读取目录
+                self.query_task(save_file["data"]["task_id"])
                 my_file_list = self.ls_dir(to_pdir_fid)
                 print(f"目录文件列表：{my_file_list}")
                 save_file["save_fids"] = []
@@ -581,187 +1217,240 @@ class Quark:
             else:
                 return False
         except Exception as e:
-            if os.environ.get("DEBUG") == True:
-                print(f"转存测试失败: {str(e)}")
+            # DEBUG 为字符串环境变量，原先与 True 比较永远不成立，异常被静默吞掉
+            print(f"转存测试失败: {str(e)}")
+            if os.environ.get("DEBUG", "").lower() == "true":
+                traceback.print_exc()
 
     def do_save_task(self, task):
+        plan = SavePlan()
+        task_plan = self.plan_save_task(plan, task)
+        self.execute_save_plan(plan)
+        return self.report_save_task(task, task_plan)
+
+    # 获取stoken，同时可验证资源是否失效；同一分享只请求一次
+    def plan_stoken(self, plan, pwd_id):
+        if pwd_id not in plan.stokens:
+            plan.stokens[pwd_id] = self.get_stoken(pwd_id)
+        return plan.stokens[pwd_id]
+
+    def plan_signature(self, plan, pwd_id, stoken, pdir_fid):
+        if (pwd_id, pdir_fid) not in plan.signatures:
+            plan.signatures[(pwd_id, pdir_fid)] = self.probe_share(pwd_id, stoken, pdir_fid)
+        return plan.signatures[(pwd_id, pdir_fid)]
+
+    def plan_detail(self, plan, pwd_id, stoken, pdir_fid):
+        # 没有其他任务共用的分享无需缓存，流式返回
+        if plan.share_tasks.get(pwd_id, 0) <= 1:
+            return self.iter_detail(pwd_id, stoken, pdir_fid)
+        if (pwd_id, pdir_fid) not in plan.listings:
+            plan.listings[(pwd_id, pdir_fid)] = self.get_detail(pwd_id, stoken, pdir_fid)
+        return plan.listings[(pwd_id, pdir_fid)]
+
+    def plan_dir_index(self, plan, savepath):
+        if savepath not in plan.dir_indexes:
+            to_pdir_fid, dir_file_list = self.ls_savepath(savepath)
+            plan.dir_indexes[savepath] = (to_pdir_fid, DirIndex(dir_file_list))
+        return plan.dir_indexes[savepath]
+
+    # 计划阶段：比对分享与目标目录，记录需转存的文件，不发起转存
+    def plan_save_task(self, plan, task):
         # 判断资源失效记录
         if task.get("shareurl_ban"):
             print(f"《{task['taskname']}》：{task['shareurl_ban']}")
-            return
+            return None
 
         # 链接转换所需参数
         pwd_id, pdir_fid = self.get_id_from_url(task["shareurl"])
         # print("match: ", pwd_id, pdir_fid)
 
-        # 获取stoken，同时可验证资源是否失效
-        is_sharing, stoken = self.get_stoken(pwd_id)
+        is_sharing, stoken = self.plan_stoken(plan, pwd_id)
         if not is_sharing:
             add_notify(f"❌《{task['taskname']}》：{stoken}\n")
             task["shareurl_ban"] = stoken
-            return
+            return None
         # print("stoken: ", stoken)
 
-        updated_tree = self.dir_check_and_save(task, pwd_id, stoken, pdir_fid)
-        if updated_tree.size(1) > 0:
-            add_notify(f"✅《{task['taskname']}》添加追更：\n{updated_tree}")
-            return True
-        else:
-            print(f"任务结束：没有新的转存任务")
-            return False
-
-    def dir_check_and_save(self, task, pwd_id, stoken, pdir_fid="", subdir_path=""):
-        tree = Tree()
-        tree.create_node(task["savepath"], pdir_fid)
-        # 获取分享文件列表
-        share_file_list = self.get_detail(pwd_id, stoken, pdir_fid)
-        # print("share_file_list: ", share_file_list)
-
-        if not share_file_list:
-            if subdir_path == "":
-                task["shareurl_ban"] = "分享为空，文件已被分享者删除"
-                add_notify(f"《{task['taskname']}》：{task['shareurl_ban']}")
-            return tree
-        elif (
-                len(share_file_list) == 1
-                and share_file_list[0]["dir"]
-                and subdir_path == ""
-        ):  # 仅有一个文件夹
+        # 探测分享首页，与上次快照一致则跳过完整比对
+        key = snapshot_key(self.account_key, task)
+        signature = (
+            self.plan_signature(plan, pwd_id, stoken, pdir_fid) if SHARE_SNAPSHOT else None
+        )
+        if signature and signature == self.share_snapshot.get(key):
+            print(f"任务结束：分享无变化，跳过比对")
+            return None
+        # 快照在汇总阶段确认全部层级转存成功后再记录
+        task_plan = TaskPlan(task, pdir_fid, key, signature)
+        try:
+            self.plan_dir_save(plan, task_plan, pwd_id, stoken, pdir_fid)
+        except Exception:
+            self.share_snapshot.delete(key)
+            raise
+        plan.tasks.append(task_plan)
+        return task_plan
+
+    # 获取一个文件夹的分享文件列表，分享根目录仅有一个文件夹时读取其中的列表
+    # 流式列表只先取出前两个条目，其余条目在比对时边拉取边处理；列表为空时返回 []
+    def plan_share_listing(self, plan, pwd_id, stoken, pdir_fid, is_root):
+        share_files = iter(self.plan_detail(plan, pwd_id, stoken, pdir_fid))
+        head = list(islice(share_files, 2))
+        if is_root and len(head) == 1 and head[0]["dir"]:
             print("🧠 该分享是一个文件夹，读取文件夹内列表")
-            share_file_list = self.get_detail(pwd_id, stoken, share_file_list[0]["fid"])
-
-        # 获取目标目录文件列表
-        savepath = re.sub(r"/{2,}", "/", f"/{task['savepath']}{subdir_path}")
-        if not self.savepath_fid.get(savepath):
-            if get_fids := self.get_fids([savepath]):
-                self.savepath_fid[savepath] = get_fids[0]["fid"]
-            else:
-                print(f"❌ 目录 {savepath} fid获取失败，跳过转存")
-                return tree
-        to_pdir_fid = self.savepath_fid[savepath]
-        dir_file_list = self.ls_dir(to_pdir_fid)
-        # print("dir_file_list: ", dir_file_list)
-
-        # 需保存的文件清单
-        need_save_list = []
-        # 添加符合的
-        for share_file in share_file_list:
-            if share_file["dir"] and task.get("update_subdir", False):
-                pattern, replace = task["update_subdir"], ""
-            else:
-                pattern, replace = magic_regex_func(task["pattern"], task["replace"])
-            # 正则文件名匹配
-            if re.search(pattern, share_file["file_name"]):
-                # 替换后的文件名
-                save_name = (
-                    re.sub(pattern, replace, share_file["file_name"])
-                    if replace != ""
-                    else share_file["file_name"]
-                )
-                # 忽略后缀
-                if task.get("ignore_extension") and not share_file["dir"]:
-                    compare_func = lambda a, b1, b2: (
-                            os.path.splitext(a)[0] == os.path.splitext(b1)[0]
-                            or os.path.splitext(a)[0] == os.path.splitext(b2)[0]
+            share_files = iter(self.plan_detail(plan, pwd_id, stoken, head[0]["fid"]))
+            head = list(islice(share_files, 1))
+        return chain(head, share_files) if head else []
+
+    # 按层遍历需递归检查的子文件夹：同一层的分享列表和目标目录列表并发获取，再依次比对
+    def plan_dir_save(self, plan, task_plan, pwd_id, stoken, pdir_fid):
+        task = task_plan.task
+        # 当前层：[(分享文件夹fid, 子目录路径, 子文件夹链 ((fid, 文件夹名), ...))]
+        level = [(pdir_fid, "", ())]
+        with ThreadPoolExecutor(max_workers=SUBDIR_WORKERS) as executor:
+            while level:
+                listings = []
+                for fid, subdir_path, _ in level:
+                    savepath = re.sub(r"/{2,}", "/", f"/{task['savepath']}{subdir_path}")
+                    share_future = executor.submit(
+                        bind_context(self.plan_share_listing),
+                        plan, pwd_id, stoken, fid, subdir_path == "",
                     )
-                else:
-                    compare_func = lambda a, b1, b2: (a == b1 or a == b2)
-                # 判断目标目录文件是否存在
-                file_exists = any(
-                    compare_func(
-                        dir_file["file_name"], share_file["file_name"], save_name
+                    dir_future = executor.submit(bind_context(self.plan_dir_index), plan, savepath)
+                    listings.append((savepath, share_future, dir_future))
+                next_level = []
+                for (_, subdir_path, dir_chain), (savepath, share_future, dir_future) in zip(level, listings):
+                    share_file_list = share_future.result()
+                    to_pdir_fid, dir_index = dir_future.result()
+                    if not share_file_list:
+                        if subdir_path == "":
+                            task["shareurl_ban"] = "分享为空，文件已被分享者删除"
+                            add_notify(f"《{task['taskname']}》：{task['shareurl_ban']}")
+                        continue
+                    if not to_pdir_fid:
+                        print(f"❌ 目录 {savepath} fid获取失败，跳过转存")
+                        task_plan.skipped = True
+                        continue
+                    next_level += self.plan_dir_files(
+                        plan, task_plan, share_file_list, savepath, to_pdir_fid, dir_index,
+                        pwd_id, stoken, subdir_path, dir_chain,
                     )
-                    for dir_file in dir_file_list
+                level = next_level
+
+    # 比对一个文件夹，记录需转存的文件，返回需递归检查的下一层子文件夹
+    def plan_dir_files(
+            self, plan, task_plan, share_file_list, savepath, to_pdir_fid, dir_index,
+            pwd_id, stoken, subdir_path, dir_chain,
+    ):
+        # 需保存的文件清单，以及已存在需递归检查的子文件夹
+        need_save_list, subdir_list = match_share_files(task_plan.task, share_file_list, dir_index)
+        planned_names = plan.planned_names.setdefault(savepath, set())
+        next_level = []
+        for share_file in subdir_list:
+            # 由之前的任务计划转存的文件夹，会整个转存，无需检查
+            if share_file["file_name"] in planned_names:
+                continue
+            print(f"检查子文件夹：{savepath}/{share_file['file_name']}")
+            # 目标子文件夹的fid已在本层列表中，直接缓存
+            if fid := dir_index.dirs.get(share_file["file_name"]):
+                self.cache_savepath_fid(
+                    re.sub(r"/{2,}", "/", f"{savepath}/{share_file['file_name']}"), fid
+                )
+            next_level.append(
+                (
+                    share_file["fid"],
+                    f"{subdir_path}/{share_file['file_name']}",
+                    dir_chain + ((share_file["fid"], share_file["file_name"]),),
                 )
-                if not file_exists:
-                    share_file["save_name"] = save_name
-                    need_save_list.append(share_file)
-                elif share_file["dir"]:
-                    # 存在并是一个文件夹
-                    if task.get("update_subdir", False):
-                        if re.search(task["update_subdir"], share_file["file_name"]):
-                            print(f"检查子文件夹：{savepath}/{share_file['file_name']}")
-                            subdir_tree = self.dir_check_and_save(
-                                task,
-                                pwd_id,
-                                stoken,
-                                share_file["fid"],
-                                f"{subdir_path}/{share_file['file_name']}",
-                            )
-                            if subdir_tree.size(1) > 0:
-                                # 合并子目录树
-                                tree.create_node(
-                                    "📁" + share_file["file_name"],
-                                    share_file["fid"],
-                                    parent=pdir_fid,
-                                )
-                                tree.merge(share_file["fid"], subdir_tree, deep=False)
-
-        fid_list = [item["fid"] for item in need_save_list]
-        fid_token_list = [item["share_fid_token"] for item in need_save_list]
-        save_name_list = [item["save_name"] for item in need_save_list]
-        if fid_list:
-            save_file_return = self.save_file(
-                fid_list, fid_token_list, to_pdir_fid, pwd_id, stoken
             )
-            err_msg = None
+
+        if need_save_list:
+            batch = plan.get_batch(pwd_id, stoken, to_pdir_fid, savepath)
+            for item in need_save_list:
+                # 后续任务按已转存处理，与逐个任务执行时的结果一致
+                dir_index.add(item["save_name"])
+                planned_names.add(item["save_name"])
+                task_plan.add(batch, dir_chain, item)
+        return next_level
+
+    # 执行阶段：每个批次一次 save_file，再统一等待全部转存任务结束
+    def execute_save_plan(self, plan):
+        pending = []
+        for batch in plan.batches.values():
+            if not batch.items:
+                continue
+            items = list(batch.items.values())
+            try:
+                save_file_return = self.save_file(
+                    [item["fid"] for item in items],
+                    [item["share_fid_token"] for item in items],
+                    batch.to_pdir_fid,
+                    batch.pwd_id,
+                    batch.stoken,
+                )
+            except Exception as e:
+                batch.err_msg = str(e)
+                continue
             if save_file_return["code"] == 0:
                 task_id = save_file_return["data"]["task_id"]
-                query_task_return = self.query_task(task_id)
-                if query_task_return["code"] == 0:
-                    save_name_list.sort()
-                    # 建立目录树
-                    for item in need_save_list:
-                        icon = (
-                            "📁"
-                            if item["dir"] == True
-                            else "🎞️" if item["obj_category"] == "video" else ""
-                        )
-                        tree.create_node(
-                            f"{icon}{item['save_name']}", item["fid"], parent=pdir_fid
-                        )
-                else:
-                    err_msg = query_task_return["message"]
+                pending.append((batch, self.task_poller.submit(task_id)))
             else:
-                err_msg = save_file_return["message"]
-            if err_msg:
-                add_notify(f"❌《{task['taskname']}》转存失败：{err_msg}\n")
-        return tree
+                batch.err_msg = save_file_return["message"]
+        for batch, future in pending:
+            try:
+                query_task_return = future.result()
+            except Exception as e:
+                batch.err_msg = str(e)
+                continue
+            if query_task_return["code"] != 0:
+                batch.err_msg = query_task_return["message"]
+        for batch in plan.batches.values():
+            if batch.err_msg:
+                # 目标目录可能已被删除，清除缓存的fid
+                self.invalidate_savepath_fid(batch.savepath)
+
+    # 汇总阶段：建立目录树并推送结果
+    def report_save_task(self, task, task_plan):
+        if task_plan is None:
+            return None if task.get("shareurl_ban") else False
+        for err_msg in task_plan.errors:
+            add_notify(f"❌《{task['taskname']}》转存失败：{err_msg}\n")
+        self.commit_snapshot(task_plan)
+        updated_tree = task_plan.build_tree()
+        if updated_tree.size(1) > 0:
+            add_notify(f"✅《{task['taskname']}》添加追更：\n{updated_tree}")
+            return True
+        else:
+            print(f"《{task['taskname']}》任务结束：没有新的转存任务")
+            return False
+
+    # 全部层级比对并转存成功才记录快照，否则清除，下次重新完整比对
+    def commit_snapshot(self, task_plan):
+        if not task_plan.snapshot_key:
+            return
+        if task_plan.errors or task_plan.skipped or not task_plan.signature:
+            self.share_snapshot.delete(task_plan.snapshot_key)
+        else:
+            self.share_snapshot.set(task_plan.snapshot_key, task_plan.signature)
 
+    # 查询一次任务状态
+    def _task_page(self, task_id, retry_index):
+        url = "https://drive-m.quark.cn/1/clouddrive/task"
+        querystring = {
+            "pr": "ucpro",
+            "fr": "pc",
+            "uc_param_str": "",
+            "task_id": task_id,
+            "retry_index": retry_index,
+            "__dt": int(random.uniform(1, 5) * 60 * 1000),
+            "__t": datetime.now().timestamp(),
+        }
+        headers = self.common_headers()
+        return self._request(
+            "GET", url, headers=headers, params=querystring
+        )
 
+    # 等待任务结束，由账号内共享的轮询器统一查询
     def query_task(self, task_id):
-        retry_index = 0
-        while True:
-            url = "https://drive-m.quark.cn/1/clouddrive/task"
-            querystring = {
-                "pr": "ucpro",
-                "fr": "pc",
-                "uc_param_str": "",
-                "task_id": task_id,
-                "retry_index": retry_index,
-                "__dt": int(random.uniform(1, 5) * 60 * 1000),
-                "__t": datetime.now().timestamp(),
-            }
-            headers = self.common_headers()
-            response = requests.request(
-                "GET", url, headers=headers, params=querystring
-            ).json()
-            if response["data"]["status"] != 0:
-                if retry_index > 0:
-                    print()
-                break
-            else:
-                if retry_index == 0:
-                    print(
-                        f"正在等待[{response['data']['task_title']}]执行结果",
-                        end="",
-                        flush=True,
-                    )
-                else:
-                    print(".", end="", flush=True)
-                retry_index += 1
-                time.sleep(0.500)
-        return response
+        return self.task_poller.wait(task_id)
 
     def share_password(self, share_id):
         url = "https://drive-m.quark.cn/1/clouddrive/share/password"
@@ -774,9 +1463,9 @@ class Quark:
         payload = {
             "share_id": share_id,
         }
-        response = requests.request(
+        response = self._request(
             "POST", url, json=payload, headers=headers, params=querystring
-        ).json()
+        )
         print(response)
         if response["code"] == 0:
             print(f"获取分享密码：{response['data']}")
@@ -785,40 +1474,88 @@ class Quark:
             return False
         return response['data']
 
-    def do_rename_task(self, task, subdir_path=""):
+    def do_rename_task(self, task, dry_run=False, listings=None):
+        """
+        按任务规则重命名保存目录（含子文件夹）中的文件
+
+        :param dry_run: 只打印重命名计划，不执行
+        :param listings: {目录路径: 文件列表}，提供时按此计算计划而不请求目录列表，
+                         与 dry_run 同时使用时不发起任何请求
+        :return: 是否有文件被重命名
+        """
+        rename_plan = self.plan_rename_task(task, listings)
+        for savepath, file_name, save_name in rename_plan.conflicts:
+            print(f"⚠️ 重命名：{file_name} → {save_name} 跳过，{savepath} 中已有同名文件")
+        if dry_run:
+            for savepath, _, file_name, save_name in rename_plan.renames:
+                print(f"[预演] 重命名：{savepath} {file_name} → {save_name}")
+            return False
+        return self.execute_rename_plan(rename_plan) > 0
+
+    # 按层列出保存目录及全部子文件夹，计算重命名计划
+    def plan_rename_task(self, task, listings=None):
+        rename_plan = RenamePlan()
         if not task["pattern"] or not task["replace"]:
+            return rename_plan
+        level = [re.sub(r"/{2,}", "/", f"/{task['savepath']}")]
+        with ThreadPoolExecutor(max_workers=SUBDIR_WORKERS) as executor:
+            while level:
+                if listings is None:
+                    dir_lists = [
+                        dir_file_list
+                        for _, dir_file_list in executor.map(bind_context(self.ls_savepath), level)
+                    ]
+                else:
+                    dir_lists = [listings.get(savepath, []) for savepath in level]
+                next_level = []
+                for savepath, dir_file_list in zip(level, dir_lists):
+                    plan_dir_renames(rename_plan, task, savepath, dir_file_list)
+                    for dir_file in dir_file_list:
+                        if not dir_file["dir"]:
+                            continue
+                        subdir = re.sub(r"/{2,}", "/", f"{savepath}/{dir_file['file_name']}")
+                        if listings is None:
+                            # 子文件夹的fid已在本层列表中，直接缓存
+                            self.cache_savepath_fid(subdir, dir_file["fid"])
+                        next_level.append(subdir)
+                level = next_level
+        return rename_plan
+
+    # 并发执行重命名计划，按完成顺序打印进度，返回成功的数量
+    def execute_rename_plan(self, rename_plan):
+        total = len(rename_plan.renames)
+        if not total:
             return 0
-        savepath = re.sub(r"/{2,}", "/", f"/{task['savepath']}{subdir_path}")
-        if not self.savepath_fid.get(savepath):
-            self.savepath_fid[savepath] = self.get_fids([savepath])[0]["fid"]
-        dir_file_list = self.ls_dir(self.savepath_fid[savepath])
-        dir_file_name_list = [item["file_name"] for item in dir_file_list]
-        is_rename_count = 0
-        for dir_file in dir_file_list:
-            if dir_file["dir"]:
-                is_rename_count += self.do_rename_task(
-                    task, f"{subdir_path}/{dir_file['file_name']}"
-                )
-            pattern, replace = magic_regex_func(task["pattern"], task["replace"])
-            if re.search(pattern, dir_file["file_name"]):
-                save_name = (
-                    re.sub(pattern, replace, dir_file["file_name"])
-                    if replace != ""
-                    else dir_file["file_name"]
-                )
-                if save_name != dir_file["file_name"] and (
-                        save_name not in dir_file_name_list
-                ):
-                    rename_return = self.rename(dir_file["fid"], save_name)
-                    if rename_return["code"] == 0:
-                        print(f"重命名：{dir_file['file_name']} → {save_name}")
-                        is_rename_count += 1
-                    else:
-                        print(
-                            f"重命名：{dir_file['file_name']} → {save_name} 失败，{rename_return['message']}"
-                        )
-        return is_rename_count > 0
 
+        def rename(fid, save_name):
+            try:
+                return self.rename(fid, save_name)
+            except Exception as e:
+                return {"code": -1, "message": str(e)}
+
+        renamed = 0
+        with ThreadPoolExecutor(max_workers=RENAME_WORKERS) as executor:
+            futures = {
+                executor.submit(bind_context(rename), fid, save_name): (
+                    savepath,
+                    fid,
+                    file_name,
+                    save_name,
+                )
+                for savepath, fid, file_name, save_name in rename_plan.renames
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                savepath, fid, file_name, save_name = futures[future]
+                rename_return = future.result()
+                if rename_return["code"] == 0:
+                    print(f"[{done}/{total}] 重命名：{file_name} → {save_name}")
+                    self.rename_savepath_fid(savepath, fid, file_name, save_name)
+                    renamed += 1
+                else:
+                    print(
+                        f"[{done}/{total}] 重命名：{file_name} → {save_name} 失败，{rename_return['message']}"
+                    )
+        return renamed
 
 
 class Emby:
@@ -896,6 +1633,18 @@ class Emby:
         return False
 
 
+# 刷新媒体库
+def refresh_emby(emby, task, is_updated):
+    if emby.is_active and is_updated and task.get("emby_id") != "0":
+        if task.get("emby_id"):
+            emby.refresh(task["emby_id"])
+        else:
+            match_emby_id = emby.search(task["taskname"])
+            if match_emby_id:
+                task["emby_id"] = match_emby_id
+                emby.refresh(match_emby_id)
+
+
 def verify_account(account):
     # 验证账号
     account_info = account.init()
@@ -942,50 +1691,126 @@ def do_save(account, tasklist=[]):
         CONFIG_DATA.get("emby", {}).get("apikey", ""),
     )
     print(f"转存账号: {account.nickname}")
+    # 预编译任务正则，无效的任务直接跳过
+    invalid_index = load_task_regex(tasklist)
     # 获取全部保存目录fid
     account.update_savepath_fid(tasklist)
 
-    def check_date(task):
-        return (
-                       not task.get("enddate")
-                       or (
-                               datetime.now().date()
-                               <= datetime.strptime(task["enddate"], "%Y-%m-%d").date()
-                       )
-               ) and (
-                       not task.get("runweek")
-                       # 星期一为0，星期日为6
-                       or (datetime.today().weekday() + 1 in task.get("runweek"))
-               )
+    # 计划阶段：同一分享只获取一次 stoken 和文件列表
+    plan = SavePlan()
+    # 判断任务期限
+    run_tasks = [
+        (index, task)
+        for index, task in enumerate(tasklist)
+        if check_date(task) and index not in invalid_index
+    ]
+    # 统计各分享被几个任务使用，共用的分享列表才需缓存
+    for index, task in run_tasks:
+        if share_id := account.get_id_from_url(task["shareurl"]):
+            pwd_id = share_id[0]
+            plan.share_tasks[pwd_id] = plan.share_tasks.get(pwd_id, 0) + 1
+    task_plans = []
+    for index, task in run_tasks:
+        print_task_info(index, task)
+        # 单个任务出错（接口异常、熔断等）不影响其他任务
+        try:
+            with task_scope(task["taskname"]):
+                task_plans.append((task, account.plan_save_task(plan, task)))
+        except Exception as e:
+            add_notify(f"❌《{task['taskname']}》执行失败：{e}\n")
+    # 执行阶段：同一分享、同一目标目录的文件合并转存
+    account.execute_save_plan(plan)
+    # 汇总结果，重命名并刷新媒体库
+    print()
+    for task, task_plan in task_plans:
+        try:
+            with task_scope(task["taskname"]):
+                is_new = account.report_save_task(task, task_plan)
+                is_rename = account.do_rename_task(task, dry_run=is_rename_dry_run())
+            refresh_emby(emby, task, is_new or is_rename)
+        except Exception as e:
+            add_notify(f"❌《{task['taskname']}》执行失败：{e}\n")
+    # 保存本次运行新增或失效的缓存
+    account.save_cache()
 
-    # 执行任务
-    for index, task in enumerate(tasklist):
-        # 判断任务期限
-        if check_date(task):
-            print()
-            print(f"#{index + 1}------------------")
-            print(f"任务名称: {task['taskname']}")
-            print(f"分享链接: {task['shareurl']}")
-            print(f"目标目录: {task['savepath']}")
-            print(f"正则匹配: {task['pattern']}")
-            print(f"正则替换: {task['replace']}")
-            if task.get("enddate"):
-                print(f"任务截止: {task['enddate']}")
-            if task.get("emby_id"):
-                print(f"刷媒体库: {task['emby_id']}")
-            if task.get("ignore_extension"):
-                print(f"忽略后缀: {task['ignore_extension']}")
-            if task.get("update_subdir"):
-                print(f"更子目录: {task['update_subdir']}")
+
+def main():
+    start_time = datetime.now()
+    print(f"===============程序开始===============")
+    print(f"⏰ 执行时间: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    print()
+    # 读取启动参数
+    config_path = sys.argv[1] if len(sys.argv) > 1 else "quark_config.json"
+    task_index = sys.argv[2] if len(sys.argv) > 2 else ""
+    # 读取配置，CONFIG_DATA 被其他模块按名称导入，只更新不重新赋值
+    if not os.path.exists(config_path):
+        if os.environ.get("QUARK_COOKIE"):
+            print(f"⚙️ 读取到 QUARK_COOKIE 环境变量，仅签到领空间。如需执行转存，请配置 {config_path} 文件")
+            cookie_val = os.environ.get("QUARK_COOKIE")
+            cookie_form_file = False
+        else:
+            print(f"⚙️ 配置文件 {config_path} 不存在❌，正远程从下载配置模版")
+            config_url = f"{GH_PROXY}https://raw.githubusercontent.com/Cp0204/quark_auto_save/main/quark_config.json"
+            if download_file(config_url, config_path):
+                print("⚙️ 配置模版下载成功✅，请到程序目录中手动配置")
+            return
+    else:
+        print(f"⚙️ 正从 {config_path} 文件中读取配置")
+        with open(config_path, "r", encoding="utf-8") as file:
+            CONFIG_DATA.update(json.load(file))
+        cookie_val = CONFIG_DATA.get("cookie")
+        if not CONFIG_DATA.get("magic_regex"):
+            CONFIG_DATA["magic_regex"] = MAGIC_REGEX
+        cookie_form_file = True
+    # 获取cookie
+    cookies = get_cookies(cookie_val)
+    if not cookies:
+        print("❌ cookie 未配置")
+        return
+    accounts = [Quark(cookie, index) for index, cookie in enumerate(cookies)]
+    # 任务列表，指定任务序号时只执行该任务
+    tasklist = CONFIG_DATA.get("tasklist", [])
+    if task_index.isdigit():
+        tasklist = [tasklist[int(task_index)]]
+
+    # 各账号并行签到，第一个账号签到后执行转存任务
+    def run_account(account):
+        print(f"===============第{account.index}个账号===============")
+        do_sign(account)
+        if account is accounts[0] and account.is_active and cookie_form_file:
+            print(f"===============转存任务===============")
+            if QUARK_ASYNC or CONFIG_DATA.get("async"):
+                # 异步客户端，多个任务并发执行（并发数见 QUARK_CONCURRENCY 或配置 concurrency）
+                from quark_async import run_save_async
+
+                run_save_async(account.cookie, tasklist, index=account.index - 1)
+            else:
+                do_save(account, tasklist)
             print()
-            is_new = account.do_save_task(task)
-            is_rename = account.do_rename_task(task)
-            # 刷新媒体库
-            if emby.is_active and (is_new or is_rename) and task.get("emby_id") != "0":
-                if task.get("emby_id"):
-                    emby.refresh(task["emby_id"])
-                else:
-                    match_emby_id = emby.search(task["taskname"])
-                    if match_emby_id:
-                        task["emby_id"] = match_emby_id
-                        emby.refresh(match_emby_id)
+        account.close()
+
+    run_accounts(run_account, accounts)
+    # 通知
+    if NOTIFYS:
+        notify_body = "\n".join(NOTIFYS)
+        print(f"===============推送通知===============")
+        send_ql_notify("【夸克自动追更】", notify_body)
+        print()
+    if cookie_form_file:
+        # 更新配置（任务的失效记录、emby_id 等）
+        with open(config_path, "w", encoding="utf-8") as file:
+            json.dump(CONFIG_DATA, file, ensure_ascii=False, sort_keys=False, indent=2)
+    # 请求统计
+    report_metrics()
+    print(f"===============程序结束===============")
+    duration = datetime.now() - start_time
+    print(f"😃 运行时长: {round(duration.total_seconds(), 2)}s")
+    print()
+
+
+if __name__ == "__main__":
+    # 按模块名导入后再执行，quark_async 等模块导入的 quark_auto_save 与此为同一模块，
+    # 共用 CONFIG_DATA、NOTIFYS 等全局变量
+    import quark_auto_save
+
+    quark_auto_save.main()
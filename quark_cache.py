@@ -0,0 +1,107 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地持久化缓存
+功能：以 JSON 文件保存跨运行复用的数据（如目录 fid），支持过期时间
+"""
+import json
+import os
+import threading
+import time
+
+# 缓存文件目录
+QUARK_CACHE_DIR = os.environ.get("QUARK_CACHE_DIR", "./cache")
+
+# 已打开的缓存实例：{名称: JsonFileCache}，同一进程内共享，避免多实例互相覆盖文件
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class JsonFileCache:
+    """
+    JSON 文件缓存
+
+    数据格式：{key: {"value": 值, "expire": 过期时间戳或 null}}
+    修改只在内存中生效，调用 save() 后才写入磁盘（先写临时文件再替换，避免写坏）。
+    """
+
+    def __init__(self, name, default_ttl=None, cache_dir=None):
+        """
+        :param name: 缓存名称，对应文件 {cache_dir}/{name}.json
+        :param default_ttl: 默认过期秒数，None 表示不过期
+        :param cache_dir: 缓存目录，默认 QUARK_CACHE_DIR
+        """
+        self.path = os.path.join(cache_dir or QUARK_CACHE_DIR, f"{name}.json")
+        self.default_ttl = default_ttl
+        self.data = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """从磁盘读取缓存，文件不存在或损坏时从空缓存开始"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except Exception as e:
+            print(f"⚠️ 读取缓存文件失败，已忽略: {self.path} {e}")
+            self.data = {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            if item["expire"] is not None and item["expire"] < time.time():
+                del self.data[key]
+                self.dirty = True
+                return default
+            return item["value"]
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: 过期秒数，默认使用 default_ttl
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self.data[key] = {
+                "value": value,
+                "expire": time.time() + ttl if ttl else None,
+            }
+            self.dirty = True
+
+    def delete(self, key):
+        with self._lock:
+            if self.data.pop(key, None) is not None:
+                self.dirty = True
+
+    def save(self):
+        """有修改时写入磁盘，同时清理已过期的条目"""
+        with self._lock:
+            if not self.dirty:
+                return
+            now = time.time()
+            self.data = {
+                key: item
+                for key, item in self.data.items()
+                if item["expire"] is None or item["expire"] >= now
+            }
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self.dirty = False
+            except Exception as e:
+                print(f"⚠️ 写入缓存文件失败: {self.path} {e}")
+
+
+def get_cache(name, default_ttl=None):
+    """获取进程内共享的缓存实例"""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = JsonFileCache(name, default_ttl)
+        return _caches[name]
@@ -0,0 +1,560 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+夸克网盘 HTTP 会话层
+功能：为每个账号维护按域名划分的连接池，复用 TCP+TLS 连接（keep-alive）；
+     按接口类别（分享、文件、任务）令牌桶限速，进程内所有账号共用；
+     临时错误按幂等性重试（带抖动的指数退避），接口连续失败时熔断快速失败；
+     每个请求结束后记录到请求统计（quark_metrics）；
+     分页列表按 _total 并发拉取，或逐页流式返回
+"""
+import asyncio
+import contextvars
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from quark_metrics import record_request
+
+# 连接池配置（可通过环境变量覆盖）
+QUARK_POOL_SIZE = int(os.environ.get("QUARK_POOL_SIZE", "10"))  # 每个域名的最大连接数
+QUARK_KEEP_ALIVE = os.environ.get("QUARK_KEEP_ALIVE", "true").lower() != "false"  # 是否保持长连接
+QUARK_CONNECT_TIMEOUT = float(os.environ.get("QUARK_CONNECT_TIMEOUT", "5"))  # 建连超时（秒）
+QUARK_READ_TIMEOUT = float(os.environ.get("QUARK_READ_TIMEOUT", "30"))  # 读取超时（秒）
+QUARK_PAGE_FANOUT = int(os.environ.get("QUARK_PAGE_FANOUT", "4"))  # 分页列表并发拉取的页数
+# 接口地址覆盖，如 http://127.0.0.1:8800（本地模拟服务），为空时请求夸克官方域名
+QUARK_BASE_URL = os.environ.get("QUARK_BASE_URL", "")
+
+# 限速配置：每秒请求数，0 表示不限速
+QUARK_RATE_LIMITS = {
+    "share": float(os.environ.get("QUARK_RATE_SHARE", "5")),  # 分享接口（stoken、分享列表、转存）
+    "file": float(os.environ.get("QUARK_RATE_FILE", "10")),  # 文件接口（列目录、新建、重命名、删除）
+    "task": float(os.environ.get("QUARK_RATE_TASK", "5")),  # 任务结果查询
+}
+QUARK_RATE_BURST = int(os.environ.get("QUARK_RATE_BURST", "5"))  # 允许的突发请求数
+QUARK_RATE_MIN_FACTOR = 0.1  # 被限流后速率最多降到配置值的比例
+
+# 重试与熔断配置
+QUARK_RETRIES = int(os.environ.get("QUARK_RETRIES", "3"))  # 临时错误的最大重试次数
+QUARK_RETRY_BACKOFF = float(os.environ.get("QUARK_RETRY_BACKOFF", "0.5"))  # 首次重试的基准等待（秒）
+QUARK_BREAKER_THRESHOLD = int(os.environ.get("QUARK_BREAKER_THRESHOLD", "5"))  # 连续失败多少次后熔断
+QUARK_BREAKER_COOLDOWN = float(os.environ.get("QUARK_BREAKER_COOLDOWN", "30"))  # 熔断后多久放行一次试探（秒）
+
+# 虽是 POST 但只读取数据的接口，可安全重试
+IDEMPOTENT_POST_PATHS = (
+    "/share/sharepage/token",
+    "/share/password",
+    "/file/info/path_list",
+)
+
+
+def resolve_url(url):
+    """设置了 QUARK_BASE_URL 时，把夸克各域名的请求改发到该地址，路径与参数不变"""
+    if not QUARK_BASE_URL:
+        return url
+    parts = urlsplit(url)
+    return QUARK_BASE_URL.rstrip("/") + parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+def endpoint_family(url):
+    """接口类别：share / file / task，其余接口（账号信息、签到等）不限速"""
+    path = urlsplit(url).path
+    if "/share/" in path:
+        return "share"
+    if path.endswith("/clouddrive/task"):
+        return "task"
+    if "/clouddrive/file" in path:
+        return "file"
+    return None
+
+
+def is_throttled(status_code, response):
+    """接口是否提示请求过于频繁"""
+    if status_code == 429:
+        return True
+    if not isinstance(response, dict):
+        return False
+    return response.get("status") == 429 or "频繁" in str(response.get("message") or "")
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    令牌按 rate 匀速补充，最多积累 burst 个；令牌不足时预支，
+    调用方按返回的等待时间休眠，因此并发请求会依次排队。
+    被限流时速率减半，之后每次成功按配置值的 5% 逐步恢复。
+    """
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """取一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.max_rate * QUARK_RATE_MIN_FACTOR, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class RateLimiter:
+    """按接口类别划分的令牌桶限速器"""
+
+    def __init__(self, rates=None, burst=None):
+        rates = QUARK_RATE_LIMITS if rates is None else rates
+        burst = burst or QUARK_RATE_BURST
+        # {接口类别: TokenBucket}
+        self.buckets = {
+            family: TokenBucket(rate, burst) for family, rate in rates.items() if rate > 0
+        }
+
+    def get_bucket(self, url):
+        return self.buckets.get(endpoint_family(url))
+
+    def acquire(self, url):
+        """请求前调用，超出速率时阻塞等待"""
+        if bucket := self.get_bucket(url):
+            if wait := bucket.reserve():
+                time.sleep(wait)
+
+    async def async_acquire(self, url):
+        """acquire 的异步版本"""
+        if bucket := self.get_bucket(url):
+            if wait := bucket.reserve():
+                await asyncio.sleep(wait)
+
+    def feedback(self, url, status_code, response):
+        """请求后调用，根据是否被限流调整速率"""
+        if bucket := self.get_bucket(url):
+            if is_throttled(status_code, response):
+                print(f"⚠️ 请求过于频繁，降低{endpoint_family(url)}接口速率至 {bucket.rate / 2:.2f} 次/秒")
+                bucket.throttled()
+            else:
+                bucket.succeeded()
+
+
+class QuarkRequestError(Exception):
+    """请求在重试后仍失败（超时、连接错误、5xx、非 json 响应）"""
+
+
+class CircuitOpenError(QuarkRequestError):
+    """接口处于熔断状态，未发送请求"""
+
+
+def is_idempotent(method, url):
+    """请求可否安全重试：GET 与只读的 POST 接口"""
+    if method.upper() == "GET":
+        return True
+    return urlsplit(url).path.endswith(IDEMPOTENT_POST_PATHS)
+
+
+def retry_delay(attempt):
+    """第 attempt 次（从 0 开始）重试前的等待秒数：指数退避，加 ±50% 随机抖动"""
+    return QUARK_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+def endpoint_key(url):
+    return urlsplit(url).netloc + urlsplit(url).path
+
+
+class CircuitBreaker:
+    """
+    单个接口的熔断器
+
+    连续失败 threshold 次后熔断，cooldown 秒内的请求直接失败；
+    冷却结束后放行一个试探请求，成功则恢复，失败则继续熔断。
+    """
+
+    def __init__(self, endpoint, threshold=None, cooldown=None):
+        self.endpoint = endpoint
+        self.threshold = threshold or QUARK_BREAKER_THRESHOLD
+        self.cooldown = cooldown or QUARK_BREAKER_COOLDOWN
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise CircuitOpenError(f"接口 {self.endpoint} 连续失败，已暂停请求")
+            # 放行一个试探请求，其余请求继续等待下一个冷却周期
+            self.opened_at = time.monotonic()
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"⚠️ 接口 {self.endpoint} 连续失败 {self.failures} 次，暂停请求 {self.cooldown:g} 秒")
+                self.opened_at = time.monotonic()
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url):
+    """获取进程内共享的接口熔断器"""
+    endpoint = endpoint_key(url)
+    with _circuit_breakers_lock:
+        if endpoint not in _circuit_breakers:
+            _circuit_breakers[endpoint] = CircuitBreaker(endpoint)
+        return _circuit_breakers[endpoint]
+
+
+class RequestStats:
+    """
+    一次请求（含全部重试）的统计，with 块结束时记录到请求统计
+
+    记录最后一次尝试的状态码、接口 code 和响应字节数，耗时包括限速等待和重试间隔。
+    """
+
+    def __init__(self, method, url, account=""):
+        self.method = method.upper()
+        self.endpoint = endpoint_key(url)
+        self.account = account
+        self.attempt = 0
+        self.status = "error"
+        self.code = None
+        self.bytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_request(
+            self.method,
+            self.endpoint,
+            self.status,
+            self.code,
+            time.perf_counter() - self.start,
+            self.bytes,
+            self.attempt,
+            self.account,
+        )
+        return False
+
+    def before_request(self, breaker, attempt):
+        """开始第 attempt 次尝试，接口熔断时抛出 CircuitOpenError"""
+        self.attempt = attempt
+        self.status, self.code, self.bytes = "error", None, 0
+        try:
+            breaker.before_request()
+        except CircuitOpenError:
+            self.status = "circuit_open"
+            raise
+
+    def response(self, status_code, content):
+        self.status = status_code
+        self.bytes = len(content)
+
+    def data(self, data):
+        self.code = data.get("code") if isinstance(data, dict) else None
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """获取进程内共享的限速器"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+class QuarkHttp:
+    """
+    按域名划分的连接池会话
+
+    每个域名（drive-m / drive-h / drive-pc / pan.quark.cn）对应一个 requests.Session，
+    同一账号的所有请求共享这些会话，避免每次请求都重新握手；
+    请求前经过进程内共享的限速器，请求统计记在 account 名下。
+    """
+
+    def __init__(
+            self,
+            pool_size=None,
+            keep_alive=None,
+            connect_timeout=None,
+            read_timeout=None,
+            limiter=None,
+            account="",
+    ):
+        self.pool_size = pool_size or QUARK_POOL_SIZE
+        self.keep_alive = QUARK_KEEP_ALIVE if keep_alive is None else keep_alive
+        self.timeout = (
+            connect_timeout or QUARK_CONNECT_TIMEOUT,
+            read_timeout or QUARK_READ_TIMEOUT,
+        )
+        self.limiter = limiter or get_rate_limiter()
+        self.account = account
+        # {域名: requests.Session}
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        """创建带连接池的会话"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=0,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Connection"] = "keep-alive" if self.keep_alive else "close"
+        return session
+
+    def get_session(self, url):
+        """获取 url 所属域名的会话，不存在则创建"""
+        host = urlsplit(url).netloc
+        session = self.sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self.sessions.get(host)
+                if session is None:
+                    session = self._create_session()
+                    self.sessions[host] = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        """
+        发送请求（未指定 timeout 时使用默认的建连/读取超时）
+
+        :return: requests.Response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        url = resolve_url(url)
+        self.limiter.acquire(url)
+        return self.get_session(url).request(method, url, **kwargs)
+
+    def request_json(self, method, url, **kwargs):
+        """
+        发送请求并解析 json
+
+        超时、连接错误、5xx、非 json 响应及限流视为临时错误：幂等请求按退避重试，
+        非幂等请求只在确定未发出（建连失败）时重试。重试后仍失败抛出 QuarkRequestError，
+        接口熔断时直接抛出 CircuitOpenError。
+        """
+        url = resolve_url(url)
+        breaker = get_circuit_breaker(url)
+        idempotent = is_idempotent(method, url)
+        with RequestStats(method, url, self.account) as stats:
+            attempt = 0
+            while True:
+                stats.before_request(breaker, attempt)
+                data = None
+                try:
+                    response = self.request(method, url, **kwargs)
+                    stats.response(response.status_code, response.content)
+                    if response.status_code >= 500:
+                        raise QuarkRequestError(f"HTTP {response.status_code}")
+                    try:
+                        data = response.json()
+                    except ValueError:
+                        raise QuarkRequestError(f"HTTP {response.status_code} 响应不是 json")
+                    stats.data(data)
+                    self.limiter.feedback(url, response.status_code, data)
+                    if not is_throttled(response.status_code, data):
+                        breaker.succeeded()
+                        return data
+                    error, retryable = QuarkRequestError(data.get("message") or "请求过于频繁"), idempotent
+                except QuarkRequestError as e:
+                    breaker.failed()
+                    error, retryable = e, idempotent
+                except requests.ConnectTimeout as e:
+                    breaker.failed()
+                    error, retryable = e, True
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    breaker.failed()
+                    error, retryable = e, idempotent
+                if not retryable or attempt >= QUARK_RETRIES:
+                    # 非幂等请求收到了接口返回时照常交给调用方处理
+                    if data is not None:
+                        return data
+                    raise QuarkRequestError(f"{method} {endpoint_key(url)} 请求失败：{error}") from error
+                delay = retry_delay(attempt)
+                print(f"⚠️ {endpoint_key(url)} 请求失败（{error}），{delay:.1f} 秒后第{attempt + 1}次重试")
+                time.sleep(delay)
+                attempt += 1
+
+    def close(self):
+        """关闭全部会话，释放连接"""
+        with self._lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+
+def bind_context(func):
+    """包装 func，使其在线程池中执行时沿用当前上下文（如请求统计中的任务名、账号的输出缓冲区）"""
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(func, *args)
+
+
+def _page_list(response, stop_on_error):
+    """取出单页列表，stop_on_error 时接口报错视为列表结束"""
+    if stop_on_error and response.get("code") != 0:
+        return []
+    return response["data"]["list"]
+
+
+def _page_count(response, page_size):
+    """根据首页返回的 _total 和每页条数计算总页数"""
+    return math.ceil(response["metadata"]["_total"] / page_size)
+
+
+def fetch_pages(fetch_page, max_workers=None, stop_on_error=False):
+    """
+    分页列表拉取引擎
+
+    先请求第 1 页拿到 metadata._total，其余页并发拉取（并发数受 max_workers 限制），
+    最后按页码顺序合并；遇到空页（或 stop_on_error 时的报错页）即截断。
+    服务端可能限制单页条数，页数按首页实际返回的条数计算；合并后仍少于 _total 时
+    （各页条数不一致）逐页补齐。
+
+    :param fetch_page: fetch_page(page) -> 接口返回的 json
+    :param max_workers: 最大并发页数，默认 QUARK_PAGE_FANOUT
+    :param stop_on_error: 接口返回 code != 0 时结束而不是抛出异常
+    :return: 全部条目列表
+    """
+    first = fetch_page(1)
+    file_list = list(_page_list(first, stop_on_error))
+    if not file_list:
+        return file_list
+    total = first["metadata"]["_total"]
+    page_count = _page_count(first, len(file_list))
+    if page_count > 1:
+        max_workers = min(max_workers or QUARK_PAGE_FANOUT, page_count - 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map 按页码顺序返回结果
+            for response in executor.map(bind_context(fetch_page), range(2, page_count + 1)):
+                page_list = _page_list(response, stop_on_error)
+                if not page_list:
+                    return file_list
+                file_list += page_list
+    page = page_count + 1
+    while len(file_list) < total:
+        page_list = _page_list(fetch_page(page), stop_on_error)
+        if not page_list:
+            break
+        file_list += page_list
+        page += 1
+    return file_list
+
+
+async def async_fetch_pages(fetch_page, max_workers=None, stop_on_error=False):
+    """fetch_pages 的异步版本，fetch_page 为协程函数"""
+    first = await fetch_page(1)
+    file_list = list(_page_list(first, stop_on_error))
+    if not file_list:
+        return file_list
+    total = first["metadata"]["_total"]
+    page_count = _page_count(first, len(file_list))
+    if page_count > 1:
+        semaphore = asyncio.Semaphore(max_workers or QUARK_PAGE_FANOUT)
+
+        async def fetch_page_limited(page):
+            async with semaphore:
+                return await fetch_page(page)
+
+        responses = await asyncio.gather(
+            *(fetch_page_limited(page) for page in range(2, page_count + 1))
+        )
+        for response in responses:
+            page_list = _page_list(response, stop_on_error)
+            if not page_list:
+                return file_list
+            file_list += page_list
+    page = page_count + 1
+    while len(file_list) < total:
+        page_list = _page_list(await fetch_page(page), stop_on_error)
+        if not page_list:
+            break
+        file_list += page_list
+        page += 1
+    return file_list
+
+
+def iter_pages(fetch_page, stop_on_error=False, max_workers=1):
+    """
+    逐页流式返回列表条目（生成器）
+
+    max_workers 为 1 时只在调用方继续迭代时才请求下一页，调用方可随时停止以节省请求；
+    大于 1 时按首页条数预取之后的至多 max_workers 页，内存中只保留这几页，
+    调用方比对当前页时后续页已在并发拉取。
+    转存比对、重命名需要完整的目标目录文件名来判断重名，仍使用 fetch_pages 并发拉取。
+    """
+    first = fetch_page(1)
+    page_list = _page_list(first, stop_on_error)
+    if not page_list:
+        return
+    yield from page_list
+    count = len(page_list)
+    total = first["metadata"]["_total"]
+    if max_workers <= 1:
+        page = 2
+        while count < total:
+            page_list = _page_list(fetch_page(page), stop_on_error)
+            if not page_list:
+                return
+            yield from page_list
+            count += len(page_list)
+            page += 1
+        return
+    page_count = _page_count(first, count)
+    page = 2
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while count < total:
+                # 按首页条数估算的页数预取；超出估算（各页条数不一致）时逐页补齐
+                while len(pending) < max_workers and (page <= page_count or not pending):
+                    pending.append(executor.submit(bind_context(fetch_page), page))
+                    page += 1
+                page_list = _page_list(pending.popleft().result(), stop_on_error)
+                if not page_list:
+                    return
+                yield from page_list
+                count += len(page_list)
+        finally:
+            # 调用方提前停止时取消尚未开始的预取
+            for future in pending:
+                future.cancel()
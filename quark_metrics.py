@@ -0,0 +1,269 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+夸克请求统计
+功能：每个发往夸克接口的请求（含重试）结束后记录接口、状态、耗时、字节数、重试次数，
+     以及所属账号和任务；运行结束后可输出汇总表或 Prometheus 文本格式的计数器和直方图。
+     也可通过 add_request_hook 注册自定义钩子接收每条记录
+"""
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+from collections import defaultdict
+
+# 运行结束时是否打印请求统计表
+QUARK_METRICS = os.environ.get("QUARK_METRICS", "false").lower() == "true"
+# Prometheus 文本格式的输出文件（如 node_exporter textfile 目录下的 .prom 文件），为空不输出
+QUARK_METRICS_FILE = os.environ.get("QUARK_METRICS_FILE", "")
+
+# 耗时直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# 当前请求所属的任务名，随线程池和 asyncio 任务的上下文传递
+_current_task = contextvars.ContextVar("quark_task", default="")
+
+
+@contextlib.contextmanager
+def task_scope(taskname):
+    """在 with 块内发出的请求记为属于任务 taskname"""
+    token = _current_task.set(taskname)
+    try:
+        yield
+    finally:
+        _current_task.reset(token)
+
+
+def current_task():
+    return _current_task.get()
+
+
+class RequestRecord:
+    """一次请求（含全部重试）的记录"""
+
+    __slots__ = (
+        "method",
+        "endpoint",
+        "status",
+        "code",
+        "latency",
+        "bytes",
+        "retries",
+        "account",
+        "task",
+    )
+
+    def __init__(self, method, endpoint, status, code, latency, nbytes, retries, account, task):
+        """
+        :param endpoint: 域名+路径
+        :param status: HTTP 状态码；未收到响应为 "error"，熔断未发送为 "circuit_open"
+        :param code: 接口返回的 code，无 json 时为 None
+        :param latency: 总耗时（秒），包括限速等待和重试间隔
+        :param nbytes: 最后一次响应的字节数
+        :param retries: 重试次数
+        """
+        self.method = method
+        self.endpoint = endpoint
+        self.status = status
+        self.code = code
+        self.latency = latency
+        self.bytes = nbytes
+        self.retries = retries
+        self.account = account
+        self.task = task
+
+    @property
+    def ok(self):
+        # 账号接口成功时 code 为 "OK"，其余接口为 0
+        return self.status == 200 and self.code in (0, "OK")
+
+
+class EndpointStats:
+    """按维度累计的请求统计，耗时只按 LATENCY_BUCKETS 分桶计数，占用内存不随请求数增长"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        # 各桶（含超出最大桶上限的一个）的请求数
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, record):
+        self.count += 1
+        self.errors += not record.ok
+        self.retries += record.retries
+        self.bytes += record.bytes
+        self.latency += record.latency
+        self.max_latency = max(self.max_latency, record.latency)
+        self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, record.latency)] += 1
+
+    def percentile(self, percent):
+        """按分桶估算分位数：返回所在桶的上限（不超过最大耗时）"""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max_latency)
+        return self.max_latency
+
+
+class RequestMetrics:
+    """
+    进程内的请求统计
+
+    汇总表按接口、按账号+任务两个维度统计；Prometheus 输出按接口和状态分组的
+    请求数、重试数、字节数计数器，以及按接口分组的耗时直方图。
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # {endpoint: EndpointStats}
+            self.endpoints = defaultdict(EndpointStats)
+            # {(account, task): EndpointStats}
+            self.tasks = defaultdict(EndpointStats)
+            # {(method, endpoint, status, code): [请求数, 重试数, 字节数]}
+            self.counters = defaultdict(lambda: [0, 0, 0])
+            # {endpoint: [各桶计数..., 总耗时, 请求数]}
+            self.histograms = defaultdict(lambda: [0] * len(self.buckets) + [0.0, 0])
+
+    def record(self, record):
+        with self._lock:
+            self.endpoints[record.endpoint].add(record)
+            self.tasks[(record.account, record.task)].add(record)
+            counter = self.counters[(record.method, record.endpoint, record.status, record.code)]
+            counter[0] += 1
+            counter[1] += record.retries
+            counter[2] += record.bytes
+            histogram = self.histograms[record.endpoint]
+            for index, bound in enumerate(self.buckets):
+                if record.latency <= bound:
+                    histogram[index] += 1
+            histogram[-2] += record.latency
+            histogram[-1] += 1
+
+    def format_summary(self):
+        """请求统计表（文本）"""
+        with self._lock:
+            endpoints = sorted(self.endpoints.items(), key=lambda item: -item[1].latency)
+            tasks = sorted(self.tasks.items(), key=lambda item: -item[1].latency)
+        if not endpoints:
+            return "没有夸克接口请求"
+        lines = [
+            f"{'接口':<56}{'请求':>7}{'失败':>6}{'重试':>6}{'KB':>9}{'总耗时(s)':>11}{'平均(ms)':>10}{'P95(ms)':>9}"
+        ]
+        for endpoint, stats in endpoints:
+            lines.append(
+                f"{endpoint[-56:]:<56}{stats.count:>7}{stats.errors:>6}{stats.retries:>6}"
+                f"{stats.bytes / 1024:>9.1f}{stats.latency:>11.2f}"
+                f"{stats.latency / stats.count * 1000:>10.0f}{stats.percentile(95) * 1000:>9.0f}"
+            )
+        lines.append("")
+        lines.append(f"{'账号':<20}{'任务':<28}{'请求':>7}{'失败':>6}{'重试':>6}{'总耗时(s)':>11}")
+        for (account, task), stats in tasks:
+            lines.append(
+                f"{account[:20]:<20}{(task or '-')[:28]:<28}{stats.count:>7}{stats.errors:>6}"
+                f"{stats.retries:>6}{stats.latency:>11.2f}"
+            )
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """Prometheus 文本格式"""
+        with self._lock:
+            counters = sorted(self.counters.items(), key=lambda item: str(item[0]))
+            histograms = sorted(self.histograms.items())
+        lines = []
+        for name, index, help_text in (
+            ("quark_requests_total", 0, "Quark API requests"),
+            ("quark_request_retries_total", 1, "Quark API request retries"),
+            ("quark_response_bytes_total", 2, "Quark API response bytes"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (method, endpoint, status, code), values in counters:
+                labels = _labels(method=method, endpoint=endpoint, status=status, code=code)
+                lines.append(f"{name}{{{labels}}} {values[index]}")
+        name = "quark_request_duration_seconds"
+        lines.append(f"# HELP {name} Quark API request latency including retries")
+        lines.append(f"# TYPE {name} histogram")
+        for endpoint, histogram in histograms:
+            for bound, count in zip(self.buckets, histogram):
+                lines.append(f"{name}_bucket{{{_labels(endpoint=endpoint, le=f'{bound:g}')}}} {count}")
+            lines.append(f"{name}_bucket{{{_labels(endpoint=endpoint, le='+Inf')}}} {histogram[-1]}")
+            lines.append(f"{name}_sum{{{_labels(endpoint=endpoint)}}} {histogram[-2]:.6f}")
+            lines.append(f"{name}_count{{{_labels(endpoint=endpoint)}}} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """写入 Prometheus 文本文件（先写临时文件再替换，避免采集到写了一半的文件）"""
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 写入请求统计文件失败: {path} {e}")
+
+
+def _labels(**labels):
+    """生成标签文本，按 Prometheus 规则转义反斜杠、引号和换行"""
+    escaped = {
+        key: "" if value is None else str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for key, value in labels.items()
+    }
+    return ",".join(f'{key}="{value}"' for key, value in escaped.items())
+
+
+_metrics = RequestMetrics()
+# 自定义钩子：hook(RequestRecord)
+_hooks = []
+
+
+def get_metrics():
+    """获取进程内共享的请求统计"""
+    return _metrics
+
+
+def add_request_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_request_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def record_request(method, endpoint, status, code, latency, nbytes, retries, account=""):
+    """记录一次请求，任务名取自当前上下文；钩子出错不影响请求本身"""
+    record = RequestRecord(
+        method, endpoint, status, code, latency, nbytes, retries, account or "", current_task()
+    )
+    _metrics.record(record)
+    for hook in list(_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            print(f"⚠️ 请求统计钩子出错: {e}")
+
+
+def report_metrics():
+    """按配置打印统计表、写入 Prometheus 文件，之后清空统计，常驻进程中每次运行单独统计"""
+    if QUARK_METRICS:
+        print(f"===============请求统计===============")
+        print(get_metrics().format_summary())
+        print()
+    if QUARK_METRICS_FILE:
+        get_metrics().write_prometheus(QUARK_METRICS_FILE)
+    get_metrics().reset()
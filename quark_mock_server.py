@@ -0,0 +1,616 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+夸克网盘接口本地模拟服务
+功能：在本地模拟脚本用到的夸克接口（分享 stoken / 列表 / 转存、网盘目录、任务查询、
+     创建分享、回收站等），支持配置延迟、分页、错误注入和限流，用于离线测试与性能测试
+
+用法：
+    python quark_mock_server.py --port 8800 --latency 0.05 --shares 10 --files 120
+    QUARK_BASE_URL=http://127.0.0.1:8800 python quark_auto_save.py quark_config.json
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# 模拟的错误码
+CODE_OK = 0
+CODE_SHARE_NOT_FOUND = 41006  # 分享不存在或已失效
+CODE_STOKEN_INVALID = 41012  # stoken 无效
+CODE_NOT_FOUND = 41050  # 文件或任务不存在
+CODE_THROTTLED = 42900  # 请求过于频繁
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class MockTokenBucket:
+    """服务端限流：每秒 rate 个请求，超出时返回 429"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class MockQuarkState:
+    """模拟的网盘数据：分享、个人网盘文件、任务、回收站"""
+
+    def __init__(self, task_polls=1):
+        # 任务需要被查询几次才完成
+        self.task_polls = task_polls
+        self.ids = itertools.count(1)
+        self._lock = threading.RLock()
+        # {pwd_id: {"stoken", "ban", "files": {pdir_fid: [分享文件]}}}
+        self.shares = {}
+        # {fid: 网盘文件}，根目录 fid 为 "0"
+        self.files = {"0": {"fid": "0", "file_name": "", "pdir_fid": None, "dir": True}}
+        # {pdir_fid: {fid: 网盘文件}}，按目录索引，大目录下列目录、转存不必遍历全部文件
+        self.dir_files = {"0": {}}
+        # {分享文件 fid: (分享, 分享文件)}
+        self.share_index = {}
+        # {task_id: {"polls", "title", "result"}}
+        self.tasks = {}
+        # [回收站记录]
+        self.recycle = []
+        # {share_id: 分享信息}
+        self.my_shares = {}
+
+    def new_id(self, prefix):
+        return f"{prefix}{next(self.ids):08d}"
+
+    # ---------- 分享 ----------
+
+    def add_share(self, pwd_id, file_names, dir_name=None, ban=None):
+        """
+        添加一个分享
+
+        :param file_names: 文件名列表
+        :param dir_name: 指定时文件放在分享内的同名文件夹中（分享仅有一个文件夹的情形）
+        :param ban: 分享失效信息，指定时获取 stoken 失败
+        """
+        with self._lock:
+            share = {"stoken": self.new_id("st"), "ban": ban, "files": {"0": []}}
+            pdir_fid = "0"
+            if dir_name:
+                folder = self.share_file(dir_name, is_dir=True)
+                share["files"]["0"].append(folder)
+                pdir_fid = folder["fid"]
+                share["files"][pdir_fid] = []
+            for file_name in file_names:
+                share["files"][pdir_fid].append(self.share_file(file_name))
+            self.shares[pwd_id] = share
+            self.index_share(share)
+            return share
+
+    def add_share_dir(self, pwd_id, dir_name, file_names, pdir_fid="0"):
+        """在已有分享中添加文件夹（用于构造多层目录），返回文件夹 fid"""
+        with self._lock:
+            share = self.shares[pwd_id]
+            folder = self.share_file(dir_name, is_dir=True)
+            share["files"].setdefault(pdir_fid, []).append(folder)
+            share["files"][folder["fid"]] = [self.share_file(name) for name in file_names]
+            self.index_share(share)
+            return folder["fid"]
+
+    def add_share_files(self, pwd_id, file_names, pdir_fid="0"):
+        """向已有分享追加文件（模拟追更）"""
+        with self._lock:
+            share = self.shares[pwd_id]
+            for file_name in file_names:
+                share["files"].setdefault(pdir_fid, []).append(self.share_file(file_name))
+            self.index_share(share)
+
+    def share_file(self, file_name, is_dir=False):
+        fid = self.new_id("sf")
+        return {
+            "fid": fid,
+            "file_name": file_name,
+            "dir": is_dir,
+            "file_type": 0 if is_dir else 1,
+            "obj_category": "" if is_dir else "video",
+            "size": 0 if is_dir else 1024 * 1024 * 1024,
+            "share_fid_token": f"tk{fid}",
+            "include_items": 0,
+            "created_at": now_ms(),
+            "updated_at": now_ms() + next(self.ids),
+        }
+
+    def index_share(self, share):
+        """更新分享文件索引和文件夹的 include_items"""
+        for file_list in share["files"].values():
+            for item in file_list:
+                self.share_index[item["fid"]] = (share, item)
+                if item["dir"]:
+                    item["include_items"] = len(share["files"].get(item["fid"], []))
+
+    def find_share_file(self, fid):
+        return self.share_index.get(fid, (None, None))
+
+    # ---------- 个人网盘 ----------
+
+    def children(self, pdir_fid):
+        return list(self.dir_files.get(pdir_fid, {}).values())
+
+    def path_of(self, fid):
+        names = []
+        while fid and fid != "0":
+            item = self.files[fid]
+            names.append(item["file_name"])
+            fid = item["pdir_fid"]
+        return "/" + "/".join(reversed(names))
+
+    def find_path(self, file_path):
+        fid = "0"
+        for name in filter(None, file_path.split("/")):
+            match = [item for item in self.children(fid) if item["file_name"] == name]
+            if not match:
+                return None
+            fid = match[0]["fid"]
+        return fid
+
+    def add_file(self, pdir_fid, file_name, is_dir=False, source=None):
+        fid = self.new_id("fd")
+        item = {
+            "fid": fid,
+            "file_name": file_name,
+            "pdir_fid": pdir_fid,
+            "dir": is_dir,
+            "file_type": 0 if is_dir else 1,
+            "obj_category": "" if is_dir else "video",
+            "size": source["size"] if source else 0,
+            "created_at": now_ms(),
+            "updated_at": now_ms(),
+        }
+        self.files[fid] = item
+        self.dir_files[pdir_fid][fid] = item
+        if is_dir:
+            self.dir_files[fid] = {}
+        return item
+
+    def mkdir(self, dir_path):
+        with self._lock:
+            fid = "0"
+            for name in filter(None, dir_path.split("/")):
+                match = [item for item in self.children(fid) if item["file_name"] == name]
+                fid = match[0]["fid"] if match else self.add_file(fid, name, True)["fid"]
+            return fid
+
+    def copy_share_file(self, share, item, to_pdir_fid):
+        new_item = self.add_file(to_pdir_fid, item["file_name"], item["dir"], item)
+        if item["dir"]:
+            for child in share["files"].get(item["fid"], []):
+                self.copy_share_file(share, child, new_item["fid"])
+        return new_item
+
+    def delete(self, fids):
+        with self._lock:
+            for fid in fids:
+                item = self.files.pop(fid, None)
+                if item:
+                    self.dir_files[item["pdir_fid"]].pop(fid, None)
+                    self.recycle.append(
+                        {
+                            "record_id": self.new_id("rc"),
+                            "fid": fid,
+                            "file_name": item["file_name"],
+                            "deleted_at": now_ms(),
+                        }
+                    )
+
+    # ---------- 任务 ----------
+
+    def add_task(self, title, result):
+        with self._lock:
+            task_id = self.new_id("tk")
+            self.tasks[task_id] = {"polls": 0, "title": title, "result": result}
+            return task_id
+
+
+def page_of(items, params, max_page_size):
+    page = int(params.get("_page", 1))
+    size = min(int(params.get("_size", 50)), max_page_size)
+    page_list = items[(page - 1) * size: page * size]
+    return {
+        "status": 200,
+        "code": CODE_OK,
+        "message": "ok",
+        "data": {"list": page_list},
+        "metadata": {"_total": len(items), "_page": page, "_size": size, "_count": len(page_list)},
+    }
+
+
+def sort_items(items, sort):
+    """按 _sort 参数排序，如 file_type:asc,updated_at:desc"""
+    for field in reversed([part for part in (sort or "").split(",") if ":" in part]):
+        key, order = field.split(":", 1)
+        items = sorted(items, key=lambda item: item.get(key, 0), reverse=order == "desc")
+    return items
+
+
+def error(code, message, status=400):
+    return {"status": status, "code": code, "message": message}
+
+
+class MockQuarkHandler(BaseHTTPRequestHandler):
+    server_version = "QuarkMock/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def handle_request(self, method):
+        server = self.server
+        parts = urlsplit(self.path)
+        path = parts.path
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        server.count(path)
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        # 限流
+        if server.limiter and not server.limiter.allow():
+            server.count("throttled")
+            return self.send_json(error(CODE_THROTTLED, "请求过于频繁，请稍后再试", 429), 429)
+        # 注入错误：指定接口的后续若干次请求，或按比例随机返回网关错误
+        if server.take_failure(path) or (server.error_rate and random.random() < server.error_rate):
+            server.count("errors")
+            return self.send_html(502, "<html><body>502 Bad Gateway</body></html>")
+
+        handler = ROUTES.get((method, path))
+        if handler is None:
+            return self.send_json(error(CODE_NOT_FOUND, f"未模拟的接口 {method} {path}", 404), 404)
+        with server.state._lock:
+            response = handler(server, params, body)
+        self.send_json(response)
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_html(self, status, html):
+        payload = html.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+# ---------- 接口实现：handler(server, params, body) -> json ----------
+
+
+def account_info(server, params, body):
+    return {"success": True, "code": "OK", "data": {"nickname": "mock_user"}}
+
+
+def growth_info(server, params, body):
+    return {
+        "status": 200,
+        "code": CODE_OK,
+        "data": {
+            "cap_sign": {
+                "sign_daily": False,
+                "sign_daily_reward": 20 * 1024 * 1024,
+                "sign_progress": 1,
+                "sign_target": 7,
+            }
+        },
+    }
+
+
+def growth_sign(server, params, body):
+    return {"status": 200, "code": CODE_OK, "data": {"sign_daily_reward": 20 * 1024 * 1024}}
+
+
+def share_token(server, params, body):
+    share = server.state.shares.get(body.get("pwd_id"))
+    if not share:
+        return error(CODE_SHARE_NOT_FOUND, "分享不存在", 404)
+    if share["ban"]:
+        return error(CODE_SHARE_NOT_FOUND, share["ban"])
+    return {"status": 200, "code": CODE_OK, "data": {"stoken": share["stoken"], "title": body["pwd_id"]}}
+
+
+def share_detail(server, params, body):
+    share = server.state.shares.get(params.get("pwd_id"))
+    if not share or share["ban"]:
+        return error(CODE_SHARE_NOT_FOUND, "分享不存在或已失效", 404)
+    if params.get("stoken") != share["stoken"]:
+        return error(CODE_STOKEN_INVALID, "分享的stoken过期")
+    items = share["files"].get(str(params.get("pdir_fid", "0")), [])
+    return page_of(sort_items(items, params.get("_sort")), params, server.max_page_size)
+
+
+def share_save(server, params, body):
+    state = server.state
+    share = state.shares.get(body.get("pwd_id"))
+    if not share or share["ban"]:
+        return error(CODE_SHARE_NOT_FOUND, "分享不存在或已失效", 404)
+    if body.get("stoken") != share["stoken"]:
+        return error(CODE_STOKEN_INVALID, "分享的stoken过期")
+    if body.get("to_pdir_fid") not in state.files:
+        return error(CODE_NOT_FOUND, "目标文件夹不存在", 404)
+    top_fids = []
+    for fid in body.get("fid_list", []):
+        _, item = state.find_share_file(fid)
+        if item:
+            top_fids.append(state.copy_share_file(share, item, body["to_pdir_fid"])["fid"])
+    task_id = state.add_task("分享-转存", {"save_as": {"save_as_top_fids": top_fids}})
+    return {"status": 200, "code": CODE_OK, "data": {"task_id": task_id}}
+
+
+def query_task(server, params, body):
+    task = server.state.tasks.get(params.get("task_id"))
+    if not task:
+        return error(CODE_NOT_FOUND, "任务不存在", 404)
+    task["polls"] += 1
+    data = {"task_id": params["task_id"], "task_title": task["title"], "status": 0}
+    if task["polls"] >= server.state.task_polls:
+        data.update(task["result"], status=2)
+    return {"status": 200, "code": CODE_OK, "message": "ok", "data": data}
+
+
+def path_list(server, params, body):
+    data = []
+    for file_path in body.get("file_path", []):
+        fid = server.state.find_path(file_path)
+        if fid:
+            data.append({"file_path": file_path, "fid": fid})
+    return {"status": 200, "code": CODE_OK, "data": data}
+
+
+def file_sort(server, params, body):
+    pdir_fid = str(params.get("pdir_fid", "0"))
+    if pdir_fid not in server.state.files:
+        # 已删除或不属于当前账号的目录：报错的同时仍返回空列表，不能据此判断目录为空
+        return dict(error(CODE_NOT_FOUND, "文件夹不存在", 404), data={"list": []}, metadata={"_total": 0})
+    items = server.state.children(pdir_fid)
+    return page_of(sort_items(items, params.get("_sort")), params, server.max_page_size)
+
+
+def make_dir(server, params, body):
+    fid = server.state.mkdir(body.get("dir_path") or body.get("file_name"))
+    return {"status": 200, "code": CODE_OK, "data": {"finish": True, "fid": fid}}
+
+
+def rename(server, params, body):
+    item = server.state.files.get(body.get("fid"))
+    if not item:
+        return error(CODE_NOT_FOUND, "文件不存在", 404)
+    if any(
+            other["file_name"] == body["file_name"] and other["fid"] != item["fid"]
+            for other in server.state.children(item["pdir_fid"])
+    ):
+        return error(23008, "文件名冲突")
+    item["file_name"] = body["file_name"]
+    item["updated_at"] = now_ms()
+    return {"status": 200, "code": CODE_OK, "data": {}}
+
+
+def delete(server, params, body):
+    server.state.delete(body.get("filelist", []))
+    task_id = server.state.add_task("删除文件", {})
+    return {"status": 200, "code": CODE_OK, "data": {"task_id": task_id, "finish": False}}
+
+
+def recycle_list(server, params, body):
+    items = sorted(server.state.recycle, key=lambda item: item["deleted_at"], reverse=True)
+    return page_of(items, params, server.max_page_size)
+
+
+def recycle_remove(server, params, body):
+    record_ids = set(body.get("record_list", []))
+    server.state.recycle = [
+        item for item in server.state.recycle if item["record_id"] not in record_ids
+    ]
+    task_id = server.state.add_task("彻底删除", {})
+    return {"status": 200, "code": CODE_OK, "data": {"task_id": task_id}}
+
+
+def create_share(server, params, body):
+    state = server.state
+    share_id = state.new_id("sh")
+    pwd_id = state.new_id("pw")
+    # 创建的分享同时可被访问（转存、检测有效性）
+    share = {"stoken": state.new_id("st"), "ban": None, "files": {"0": []}}
+    for fid in body.get("fid_list", []):
+        item = state.files.get(fid)
+        if item:
+            share["files"]["0"].append(state.share_file(item["file_name"], item["dir"]))
+    state.shares[pwd_id] = share
+    state.my_shares[share_id] = {
+        "share_id": share_id,
+        "pwd_id": pwd_id,
+        "title": body.get("title", ""),
+        "share_url": f"https://pan.quark.cn/s/{pwd_id}",
+        "created_at": now_ms(),
+    }
+    task_id = state.add_task("创建分享", {"share_id": share_id})
+    return {"status": 200, "code": CODE_OK, "data": {"task_id": task_id}}
+
+
+def share_password(server, params, body):
+    share = server.state.my_shares.get(body.get("share_id"))
+    if not share:
+        return error(CODE_NOT_FOUND, "分享不存在", 404)
+    return {"status": 200, "code": CODE_OK, "data": dict(share, passcode="")}
+
+
+def my_shares(server, params, body):
+    items = sorted(server.state.my_shares.values(), key=lambda item: item["created_at"], reverse=True)
+    return page_of(items, params, server.max_page_size)
+
+
+ROUTES = {
+    ("GET", "/account/info"): account_info,
+    ("GET", "/1/clouddrive/capacity/growth/info"): growth_info,
+    ("POST", "/1/clouddrive/capacity/growth/sign"): growth_sign,
+    ("POST", "/1/clouddrive/share/sharepage/token"): share_token,
+    ("GET", "/1/clouddrive/share/sharepage/detail"): share_detail,
+    ("POST", "/1/clouddrive/share/sharepage/save"): share_save,
+    ("GET", "/1/clouddrive/task"): query_task,
+    ("POST", "/1/clouddrive/file/info/path_list"): path_list,
+    ("GET", "/1/clouddrive/file/sort"): file_sort,
+    ("POST", "/1/clouddrive/file"): make_dir,
+    ("POST", "/1/clouddrive/file/rename"): rename,
+    ("POST", "/1/clouddrive/file/delete"): delete,
+    ("GET", "/1/clouddrive/file/recycle/list"): recycle_list,
+    ("POST", "/1/clouddrive/file/recycle/remove"): recycle_remove,
+    ("POST", "/1/clouddrive/share"): create_share,
+    ("POST", "/1/clouddrive/share/password"): share_password,
+    ("GET", "/1/clouddrive/share/mypage/detail"): my_shares,
+}
+
+
+class MockQuarkServer(ThreadingHTTPServer):
+    """
+    夸克接口模拟服务
+
+    :param latency: 每个请求的固定延迟（秒）
+    :param jitter: 额外的随机延迟上限（秒）
+    :param error_rate: 随机返回 502 网关错误的比例
+    :param rate_limit: 每秒允许的请求数，超出返回 429，0 表示不限流
+    :param max_page_size: 分页接口单页最多返回的条数
+    :param task_polls: 任务需要被查询几次才完成
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            host="127.0.0.1",
+            port=0,
+            latency=0.0,
+            jitter=0.0,
+            error_rate=0.0,
+            rate_limit=0,
+            max_page_size=100,
+            task_polls=1,
+            verbose=False,
+    ):
+        super().__init__((host, port), MockQuarkHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.limiter = MockTokenBucket(rate_limit) if rate_limit else None
+        self.max_page_size = max_page_size
+        self.verbose = verbose
+        self.state = MockQuarkState(task_polls)
+        # {接口路径: 请求次数}
+        self.stats = {}
+        # {接口路径: 剩余的注入失败次数}
+        self.failures = {}
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, key):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {}
+
+    def fail_next(self, path, times=1):
+        """让指定接口接下来的 times 次请求返回 502"""
+        with self._stats_lock:
+            self.failures[path] = self.failures.get(path, 0) + times
+
+    def take_failure(self, path):
+        with self._stats_lock:
+            if self.failures.get(path):
+                self.failures[path] -= 1
+                return True
+            return False
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def seed_shares(state, shares, files, prefix="mock"):
+    """生成 shares 个分享，每个分享 files 集，分享 ID 为 {prefix}0、{prefix}1 ..."""
+    for index in range(shares):
+        state.add_share(
+            f"{prefix}{index}",
+            [f"Show{index}.S01E{episode:02d}.1080p.mp4" for episode in range(1, files + 1)],
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="夸克网盘接口本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8800, help="监听端口")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外的随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 502 的比例")
+    parser.add_argument("--rate-limit", type=float, default=0, help="每秒允许的请求数，0 表示不限流")
+    parser.add_argument("--page-size", type=int, default=100, help="分页接口单页最多返回的条数")
+    parser.add_argument("--task-polls", type=int, default=1, help="任务需要被查询几次才完成")
+    parser.add_argument("--shares", type=int, default=3, help="预置的分享数量")
+    parser.add_argument("--files", type=int, default=120, help="每个分享的文件数量")
+    parser.add_argument("--verbose", action="store_true", help="输出每个请求的日志")
+    args = parser.parse_args()
+
+    server = MockQuarkServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        max_page_size=args.page_size,
+        task_polls=args.task_polls,
+        verbose=args.verbose,
+    )
+    seed_shares(server.state, args.shares, args.files)
+    print(f"🧪 夸克模拟服务已启动: {server.url}")
+    print(f"   预置分享: " + ", ".join(f"https://pan.quark.cn/s/{pwd_id}" for pwd_id in server.state.shares))
+    print(f"   使用方法: QUARK_BASE_URL={server.url} python quark_auto_save.py quark_config.json")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats, ensure_ascii=False, indent=2))
+        server.server_close()
@@ -0,0 +1,226 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+夸克网盘任务轮询
+功能：转存、分享等接口返回 task_id 后需轮询任务结果；由一个轮询循环统一查询同一账号下
+     所有未完成的任务，轮询间隔按指数退避递增，超过期限后放弃等待
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from quark_metrics import task_scope
+
+# 轮询配置（可通过环境变量覆盖）
+QUARK_POLL_INTERVAL = float(os.environ.get("QUARK_POLL_INTERVAL", "0.5"))  # 首次重试间隔（秒）
+QUARK_POLL_BACKOFF = float(os.environ.get("QUARK_POLL_BACKOFF", "1.5"))  # 每次重试间隔的增长倍数
+QUARK_POLL_MAX_INTERVAL = float(os.environ.get("QUARK_POLL_MAX_INTERVAL", "5"))  # 最大重试间隔（秒）
+QUARK_POLL_TIMEOUT = float(os.environ.get("QUARK_POLL_TIMEOUT", "300"))  # 单个任务的最长等待时间（秒）
+
+
+def task_done(response):
+    """任务已结束（成功或失败）：接口报错，或任务状态不再是进行中"""
+    if response.get("code") != 0:
+        return True
+    return response["data"]["status"] != 0
+
+
+def task_timeout(task_id, timeout):
+    """等待超时时返回的结果，与接口报错的格式一致"""
+    return {
+        "status": 408,
+        "code": -1,
+        "message": f"等待任务执行结果超时（{timeout:g}秒）",
+        "data": {"task_id": task_id, "status": 0},
+    }
+
+
+class PendingTask:
+    """一个等待结果的任务及其退避状态"""
+
+    def __init__(self, task_id, future, interval, timeout):
+        now = time.monotonic()
+        self.task_id = task_id
+        self.future = future
+        self.retry_index = 0
+        self.interval = interval
+        self.next_poll = now
+        self.deadline = now + timeout
+        self.last_error = None
+
+    def backoff(self, factor, max_interval):
+        """安排下一次查询，返回 False 表示已超过期限"""
+        now = time.monotonic()
+        if now >= self.deadline:
+            return False
+        self.retry_index += 1
+        self.next_poll = min(now + self.interval, self.deadline)
+        self.interval = min(self.interval * factor, max_interval)
+        return True
+
+
+class TaskPoller:
+    """
+    任务轮询器（线程版）
+
+    fetch_task(task_id, retry_index) 查询一次任务状态并返回接口 json。
+    submit() 返回 concurrent.futures.Future，多个线程可同时等待不同的任务，
+    只有一个后台线程负责查询，没有待查询任务时线程自动退出。
+    """
+
+    def __init__(self, fetch_task, interval=None, backoff=None, max_interval=None, timeout=None):
+        self.fetch_task = fetch_task
+        self.interval = interval or QUARK_POLL_INTERVAL
+        self.backoff = backoff or QUARK_POLL_BACKOFF
+        self.max_interval = max_interval or QUARK_POLL_MAX_INTERVAL
+        self.timeout = timeout or QUARK_POLL_TIMEOUT
+        # {task_id: PendingTask}
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def submit(self, task_id):
+        """加入轮询，返回 Future，结果为任务查询接口的最终返回"""
+        with self._lock:
+            if task_id in self.pending:
+                return self.pending[task_id].future
+            future = Future()
+            self.pending[task_id] = PendingTask(
+                task_id, future, self.interval, self.timeout
+            )
+            if self._thread is None:
+                # 轮询线程沿用提交者的上下文，输出与请求统计归入同一账号
+                context = contextvars.copy_context()
+                self._thread = threading.Thread(target=context.run, args=(self._run,), daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return future
+
+    def wait(self, task_id):
+        """等待任务结束并返回结果"""
+        return self.submit(task_id).result()
+
+    def _run(self):
+        # 轮询线程由账号内的多个任务共用，查询请求不计入首个提交者的任务
+        with task_scope(""):
+            while True:
+                with self._lock:
+                    if not self.pending:
+                        self._thread = None
+                        return
+                    now = time.monotonic()
+                    due = [item for item in self.pending.values() if item.next_poll <= now]
+                    next_poll = min(item.next_poll for item in self.pending.values())
+                if not due:
+                    self._wakeup.wait(next_poll - now)
+                    self._wakeup.clear()
+                    continue
+                for item in due:
+                    self._poll(item)
+
+    def _poll(self, item):
+        try:
+            response = self.fetch_task(item.task_id, item.retry_index)
+        except Exception as e:
+            # 网络异常时按退避间隔重试，直到超过期限
+            item.last_error = e
+        else:
+            item.last_error = None
+            if task_done(response):
+                self._finish(item, response)
+                return
+            if item.retry_index == 0:
+                print(f"正在等待[{response['data'].get('task_title', item.task_id)}]执行结果")
+        if not item.backoff(self.backoff, self.max_interval):
+            if item.last_error is not None:
+                self._finish(item, error=item.last_error)
+            else:
+                self._finish(item, task_timeout(item.task_id, self.timeout))
+
+    def _finish(self, item, response=None, error=None):
+        with self._lock:
+            self.pending.pop(item.task_id, None)
+        if error is not None:
+            item.future.set_exception(error)
+        else:
+            item.future.set_result(response)
+
+
+class AsyncTaskPoller:
+    """
+    任务轮询器（asyncio 版）
+
+    fetch_task(task_id, retry_index) 为协程函数，其余行为与 TaskPoller 相同，
+    轮询循环作为事件循环中的一个任务运行。
+    """
+
+    def __init__(self, fetch_task, interval=None, backoff=None, max_interval=None, timeout=None):
+        self.fetch_task = fetch_task
+        self.interval = interval or QUARK_POLL_INTERVAL
+        self.backoff = backoff or QUARK_POLL_BACKOFF
+        self.max_interval = max_interval or QUARK_POLL_MAX_INTERVAL
+        self.timeout = timeout or QUARK_POLL_TIMEOUT
+        # {task_id: PendingTask}
+        self.pending = {}
+        self._wakeup = None
+        self._runner = None
+
+    async def wait(self, task_id):
+        """等待任务结束并返回结果"""
+        if task_id not in self.pending:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[task_id] = PendingTask(
+                task_id, future, self.interval, self.timeout
+            )
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return await asyncio.shield(self.pending[task_id].future)
+
+    async def _run(self):
+        # 轮询循环由多个任务共用，查询请求不计入创建循环的首个等待者的任务
+        with task_scope(""):
+            while self.pending:
+                now = time.monotonic()
+                due = [item for item in self.pending.values() if item.next_poll <= now]
+                if not due:
+                    next_poll = min(item.next_poll for item in self.pending.values())
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), next_poll - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await asyncio.gather(*(self._poll(item) for item in due))
+
+    async def _poll(self, item):
+        try:
+            response = await self.fetch_task(item.task_id, item.retry_index)
+        except Exception as e:
+            item.last_error = e
+        else:
+            item.last_error = None
+            if task_done(response):
+                self._finish(item, response)
+                return
+            if item.retry_index == 0:
+                print(f"正在等待[{response['data'].get('task_title', item.task_id)}]执行结果")
+        if not item.backoff(self.backoff, self.max_interval):
+            if item.last_error is not None:
+                self._finish(item, error=item.last_error)
+            else:
+                self._finish(item, task_timeout(item.task_id, self.timeout))
+
+    def _finish(self, item, response=None, error=None):
+        self.pending.pop(item.task_id, None)
+        if item.future.done():
+            return
+        if error is not None:
+            item.future.set_exception(error)
+        else:
+            item.future.set_result(response)
@@ -20,7 +20,9 @@ from drama_classifier import DramaClassifier, classify_drama
 from llm_sdk import create_client
 from model.cloud_resource import CloudResource
 from model.tmdb import Tmdb
-from quark_auto_save import Quark, download_file
+from quark_auto_save import Quark, download_file, is_share_gone
+from quark_http import QuarkRequestError
+from tmdb_cache import get_tmdb_cache
 from telegram_sdk.tg import TgClient
 
 # TMDB API配置
@@ -28,6 +30,7 @@ TMDB_API_KEY = os.environ.get("TMDB_API_KEY", "")  # 需要在环境变量中设
 # TMDB_BASE_URL = "https://api.themoviedb.org/3"
 TMDB_BASE_URL = "http://api.tmdb.org/3"
 TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
+TMDB_LANGUAGE = "zh-CN"
 
 
 class TmdbService:
@@ -37,6 +40,41 @@ class TmdbService:
         self.api_key = api_key or TMDB_API_KEY
         if not self.api_key:
             print("⚠️ 警告: TMDB_API_KEY 未设置，TMDB功能将不可用")
+        # 搜索结果缓存，未启用时为None
+        self.cache = get_tmdb_cache()
+        # 实际发出的API请求数（命中缓存的不计），批量查询时据此决定是否需要等待
+        self.request_count = 0
+
+    def _search(self, media_type, query, language=TMDB_LANGUAGE):
+        """
+        调用TMDB搜索接口，优先使用缓存
+        :param media_type: 搜索类型（movie/tv/multi）
+        :param query: 搜索关键词
+        :param language: 语言
+        :return: 接口返回的results列表，请求失败返回None（不缓存）
+        """
+        if self.cache:
+            results = self.cache.get(query, media_type, language)
+            if results is not None:
+                return results
+
+        url = f"{TMDB_BASE_URL}/search/{media_type}"
+        params = {
+            "api_key": self.api_key,
+            "query": query,
+            "language": language,
+            "page": 1,
+        }
+        self.request_count += 1
+        response = requests.get(url, params=params, timeout=10)
+        if response.status_code != 200:
+            print(f"❌ TMDB API请求失败: {response.status_code}")
+            return None
+
+        results = response.json().get("results") or []
+        if self.cache:
+            self.cache.set(query, media_type, language, results)
+        return results
 
     def search_drama(self, drama_name, category="电影"):
         """
@@ -50,72 +88,17 @@ class TmdbService:
             return None
 
         try:
-            # 根据 category 参数决定查询顺序
-            if category == "电影":
-                # 先尝试搜索电影
-                movie_url = f"{TMDB_BASE_URL}/search/movie"
-                movie_params = {
-                    "api_key": self.api_key,
-                    "query": drama_name,
-                    "language": "zh-CN"
-                }
-                movie_response = requests.get(movie_url, params=movie_params, timeout=10)
-
-                if movie_response.status_code == 200:
-                    movie_data = movie_response.json()
-                    if movie_data.get("results") and len(movie_data["results"]) > 0:
-                        result = movie_data["results"][0]
+            # 根据 category 参数决定查询顺序，没找到再查另一种
+            media_types = ["movie", "tv"] if category == "电影" else ["tv", "movie"]
+            for media_type in media_types:
+                results = self._search(media_type, drama_name)
+                if results:
+                    result = results[0]
+                    if media_type == "movie":
                         print(f"✅ 在TMDB找到电影: {result.get('title')}")
-                        return self._format_tmdb_data(result, "movie")
-
-                # 如果电影没找到，尝试搜索电视剧
-                tv_url = f"{TMDB_BASE_URL}/search/tv"
-                tv_params = {
-                    "api_key": self.api_key,
-                    "query": drama_name,
-                    "language": "zh-CN"
-                }
-                tv_response = requests.get(tv_url, params=tv_params, timeout=10)
-
-                if tv_response.status_code == 200:
-                    tv_data = tv_response.json()
-                    if tv_data.get("results") and len(tv_data["results"]) > 0:
-                        result = tv_data["results"][0]
-                        print(f"✅ 在TMDB找到电视剧: {result.get('name')}")
-                        return self._format_tmdb_data(result, "tv")
-
-            else:  # category == "剧集"
-                # 先尝试搜索电视剧
-                tv_url = f"{TMDB_BASE_URL}/search/tv"
-                tv_params = {
-                    "api_key": self.api_key,
-                    "query": drama_name,
-                    "language": "zh-CN"
-                }
-                tv_response = requests.get(tv_url, params=tv_params, timeout=10)
-
-                if tv_response.status_code == 200:
-                    tv_data = tv_response.json()
-                    if tv_data.get("results") and len(tv_data["results"]) > 0:
-                        result = tv_data["results"][0]
+                    else:
                         print(f"✅ 在TMDB找到电视剧: {result.get('name')}")
-                        return self._format_tmdb_data(result, "tv")
-
-                # 如果电视剧没找到，尝试搜索电影
-                movie_url = f"{TMDB_BASE_URL}/search/movie"
-                movie_params = {
-                    "api_key": self.api_key,
-                    "query": drama_name,
-                    "language": "zh-CN"
-                }
-                movie_response = requests.get(movie_url, params=movie_params, timeout=10)
-
-                if movie_response.status_code == 200:
-                    movie_data = movie_response.json()
-                    if movie_data.get("results") and len(movie_data["results"]) > 0:
-                        result = movie_data["results"][0]
-                        print(f"✅ 在TMDB找到电影: {result.get('title')}")
-                        return self._format_tmdb_data(result, "movie")
+                    return self._format_tmdb_data(result, media_type)
 
             print(f"📢 未在TMDB找到《{drama_name}》相关信息")
             return None
@@ -184,20 +167,9 @@ class TmdbService:
 
         try:
             # 使用multi搜索接口，可以同时搜索电影、电视剧等多种媒体
-            url = f"{TMDB_BASE_URL}/search/multi"
-            params = {
-                "api_key": self.api_key,
-                "query": query,
-                "language": "zh-CN",
-                "page": 1,
-            }
-
-            response = requests.get(url, params=params, timeout=10)
-
-            if response.status_code == 200:
-                data = response.json()
-                results = data.get("results", [])
+            results = self._search("multi", query)
 
+            if results is not None:
                 # 过滤出电影和电视剧，排除其他类型（如人物）
                 filtered_results = []
                 for result in results[:max_results]:
@@ -226,7 +198,6 @@ class TmdbService:
                 print(f"✅ TMDB搜索成功: 找到 {len(filtered_results)} 个结果")
                 return filtered_results
             else:
-                print(f"❌ TMDB API请求失败: {response.status_code}")
                 return []
 
         except Exception as e:
@@ -411,25 +382,44 @@ class ResourceManager:
 
         return result
 
+    # 探测分享链接是否有效（只请求分享首页的 1 个条目，不读写数据库，可在线程池中并发调用）
+    def probe_share_link(self, share_link):
+        """
+        探测分享链接是否有效
+        :param share_link: 分享链接
+        :return: 分享非空返回True，分享为空或已失效返回False
+        :raises QuarkRequestError: 限流等无法判断是否有效的错误，不应据此标记失效
+        """
+        pwd_id, pdir_fid = self.quark.get_id_from_url(share_link)
+        is_sharing, stoken = self.quark.get_stoken(pwd_id)
+        if not is_sharing:
+            if is_share_gone(None, stoken):
+                return False
+            raise QuarkRequestError(f"获取分享 {pwd_id} 的stoken失败：{stoken}")
+        return self.quark.probe_detail_v2(pwd_id, stoken, pdir_fid)
+
     # 检查分享链接是否有效
-    def check_share_link(self, share_link):
+    def check_share_link(self, share_link, resource=None):
         """
-        检查分享链接是否有效
+        检查分享链接是否有效，失效时标记资源为已失效
         :param share_link: 分享链接
-        :return: 如果有效则返回分享信息，否则返回None
+        :param resource: 链接对应的资源，调用方已查出时传入，省去按链接查询数据库
+        :return: 有效返回True，否则返回False
         """
-        resource = db_session.query(CloudResource).filter(
-            CloudResource.link == share_link
-        ).first()
+        if resource is None:
+            resource = db_session.query(CloudResource).filter(
+                CloudResource.link == share_link
+            ).first()
         if not resource:
             print("❌ 分享链接不存在")
             return False
 
-        pwd_id, pdir_fid = self.quark.get_id_from_url(share_link)
-        is_sharing, stoken = self.quark.get_stoken(pwd_id)
-        share_file_list = self.quark.get_detail_v2(pwd_id, stoken, pdir_fid)
-        print("share_file_list====: ", share_file_list)
-        if not share_file_list:
+        try:
+            is_valid = self.probe_share_link(share_link)
+        except QuarkRequestError as e:
+            print(f"⚠️ 检查分享链接失败: {e}")
+            return False
+        if not is_valid:
             resource.is_expired = 1
             db_session.commit()
             print("❌ 分享链接无效或已失效")
@@ -437,6 +427,20 @@ class ResourceManager:
         print("✅ 分享链接有效")
         return True
 
+    def expire_resources(self, resource_ids):
+        """
+        批量标记资源为已失效（一条 UPDATE 语句）
+        :param resource_ids: 资源ID列表
+        :return: 更新的行数
+        """
+        if not resource_ids:
+            return 0
+        count = db_session.query(CloudResource).filter(
+            CloudResource.id.in_(resource_ids)
+        ).update({CloudResource.is_expired: 1}, synchronize_session=False)
+        db_session.commit()
+        return count
+
     async def shareToTgBot(self, id):
         """
         分享资源到Telegram机器人（使用队列管理器）
@@ -457,7 +461,7 @@ class ResourceManager:
             print(f"❌ 资源已过期: {resource.drama_name}")
             return False
 
-        if not self.check_share_link(resource.link):
+        if not self.check_share_link(resource.link, resource):
             print(f"❌ 资源已失效: {resource.drama_name}")
             return False
 
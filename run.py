@@ -23,6 +23,7 @@ import sys
 import asyncio
 import threading
 from datetime import datetime
+from itertools import islice
 
 
 from drama_classifier import extract_drama_name, classify_drama
@@ -492,8 +493,11 @@ def quark_ls_dir():
     if not is_login():
         return jsonify({"error": "未登录"}), 401
 
+    quark = None
     try:
         pdir_fid = request.args.get("pdir_fid", "0")
+        # 可选：最多返回的条数，达到后不再请求后续分页
+        limit = request.args.get("limit", 0, type=int)
 
         # 获取cookie
         cookie = os.environ.get("QUARK_COOKIE", "")
@@ -511,7 +515,10 @@ def quark_ls_dir():
             return jsonify({"error": "夸克账号验证失败"}), 400
 
         # 获取文件列表
-        files = quark.ls_dir(pdir_fid)
+        if limit > 0:
+            files = list(islice(quark.iter_dir(pdir_fid), limit))
+        else:
+            files = quark.ls_dir(pdir_fid)
 
         if files is None:
             return jsonify({"error": "获取文件列表失败"}), 500
@@ -523,6 +530,10 @@ def quark_ls_dir():
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
+    finally:
+        # 释放连接池
+        if quark:
+            quark.close()
 
 
 # 分享并保存资源到数据库
@@ -531,6 +542,7 @@ def quark_share_and_save():
     if not is_login():
         return jsonify({"error": "未登录"}), 401
 
+    quark = None
     try:
         data = request.json
         fid = data.get("fid")
@@ -649,6 +661,10 @@ def quark_share_and_save():
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
+    finally:
+        # 释放连接池
+        if quark:
+            quark.close()
 
 
 # 搜索TMDB
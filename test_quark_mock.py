@@ -0,0 +1,303 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转存流程回归测试 - 在本地模拟服务（quark_mock_server.py）上检查
+  1. 缓存的 stoken 过期后重新获取并重试，探测和转存照常成功
+  2. 服务端单页条数少于请求的 _size 时，分页列表仍完整
+  3. 目标目录被删除或获取失败而跳过的转存，不记录分享快照，下次仍会转存
+  4. 异步版并发执行多个转存到同一目录的任务时，每个文件只转存一次
+  5. 服务端单页条数少于请求的 _size 时，彻底删除仍能翻完回收站
+  6. 只有分享本身失效的错误才判定链接失效，stoken 过期、限流等临时错误不算
+  7. 配置 rename_dry_run 时只预演重命名；文件夹重命名后缓存的子文件夹fid改用新路径
+  8. 分享列表流式比对：提前停止时不再拉取后续页，大分享逐页比对后完整转存
+  9. 多账号并行时第一个账号的输出实时写出，其余账号按顺序输出，出错时日志不丢失
+
+用法：
+    python test_quark_mock.py
+"""
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import types
+from itertools import islice
+
+# 缓存写入临时目录，须在导入 quark_cache 之前设置
+os.environ["QUARK_CACHE_DIR"] = tempfile.mkdtemp(prefix="quark_mock_")
+
+import quark_async
+import quark_auto_save
+import quark_http
+from quark_auto_save import Quark
+from quark_mock_server import MockQuarkServer
+
+
+@contextlib.contextmanager
+def mock_server(**kwargs):
+    """启动模拟服务，并让夸克请求发往模拟服务"""
+    server = MockQuarkServer(**kwargs).start()
+    base_url = quark_http.QUARK_BASE_URL
+    quark_http.QUARK_BASE_URL = server.url
+    try:
+        yield server
+    finally:
+        quark_http.QUARK_BASE_URL = base_url
+        server.stop()
+
+
+def make_task(pwd_id, savepath):
+    return {
+        "taskname": savepath,
+        "shareurl": f"https://pan.quark.cn/s/{pwd_id}",
+        "savepath": savepath,
+        "pattern": ".*",
+        "replace": "",
+    }
+
+
+def run_save(cookie, task):
+    """执行一次转存，返回输出"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        account = Quark(cookie, 0)
+        account.init()
+        try:
+            quark_auto_save.do_save(account, [task])
+        finally:
+            account.close()
+    return output.getvalue()
+
+
+def run_save_async(cookie, tasklist, concurrency):
+    """用异步客户端并发执行一次转存，返回输出"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        quark_async.run_save_async(cookie, tasklist, concurrency)
+    return output.getvalue()
+
+
+def saved_names(server, savepath):
+    fid = server.state.find_path(savepath)
+    return sorted(item["file_name"] for item in server.state.children(fid)) if fid else []
+
+
+def test_stoken_refresh():
+    with mock_server() as server:
+        server.state.add_share("stoken", ["Show.S01E01.mp4"])
+        task = make_task("stoken", "/stoken")
+        run_save("__uid=stoken;", task)
+
+        # 分享者的 stoken 更新后，缓存里的 stoken 失效
+        server.state.shares["stoken"]["stoken"] += "x"
+        server.state.add_share_files("stoken", ["Show.S01E02.mp4"])
+        output = run_save("__uid=stoken;", task)
+        assert "执行失败" not in output, output
+        assert saved_names(server, "/stoken") == ["Show.S01E01.mp4", "Show.S01E02.mp4"]
+
+        server.state.shares["stoken"]["stoken"] += "x"
+        account = Quark("__uid=stoken;", 0)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                is_sharing, stoken = account.get_stoken("stoken")
+                assert is_sharing
+                assert account.probe_detail_v2("stoken", stoken, 0) is True
+        finally:
+            account.close()
+
+
+def test_page_cap():
+    with mock_server(max_page_size=20) as server:
+        names = [f"Show.S01E{i:03d}.mp4" for i in range(1, 121)]
+        server.state.add_share("pages", names)
+        account = Quark("__uid=pages;", 0)
+        try:
+            is_sharing, stoken = account.get_stoken("pages")
+            assert len(account.get_detail("pages", stoken, 0)) == 120
+            assert len(account.get_detail_v2("pages", stoken, 0)) == 120
+        finally:
+            account.close()
+
+        async def get_detail_async():
+            account = quark_async.AsyncQuark("__uid=pages;", 0)
+            try:
+                is_sharing, stoken = await account.get_stoken("pages")
+                return await account.get_detail("pages", stoken, 0)
+            finally:
+                await account.close()
+
+        assert len(asyncio.run(get_detail_async())) == 120
+
+
+def test_snapshot_skip():
+    with mock_server() as server:
+        server.state.add_share("snapshot", ["Show.S01E01.mp4"])
+        task = make_task("snapshot", "/snapshot")
+        run_save("__uid=snapshot;", task)
+
+        # 目标目录被删除：缓存的 fid 失效，本次重新创建并转存
+        server.state.delete([server.state.find_path("/snapshot")])
+        server.state.add_share_files("snapshot", ["Show.S01E02.mp4"])
+        run_save("__uid=snapshot;", task)
+        assert saved_names(server, "/snapshot") == ["Show.S01E01.mp4", "Show.S01E02.mp4"]
+
+        # 目标目录获取失败而跳过：不记录快照，下次重新比对并转存
+        server.state.add_share_files("snapshot", ["Show.S01E03.mp4"])
+        ls_savepath = Quark.ls_savepath
+        Quark.ls_savepath = lambda self, savepath: (None, [])
+        try:
+            output = run_save("__uid=snapshot;", task)
+        finally:
+            Quark.ls_savepath = ls_savepath
+        assert "跳过转存" in output, output
+        output = run_save("__uid=snapshot;", task)
+        assert "分享无变化" not in output, output
+        assert saved_names(server, "/snapshot") == [
+            "Show.S01E01.mp4",
+            "Show.S01E02.mp4",
+            "Show.S01E03.mp4",
+        ]
+
+
+def test_async_shared_savepath():
+    with mock_server() as server:
+        server.state.add_share("shared", ["Show.S01E01.mp4", "Show.S01E02.mp4"])
+        task = make_task("shared", "/shared")
+        tasklist = [task, dict(task, taskname="/shared mp4", pattern=r"\.mp4$")]
+        output = run_save_async("__uid=shared;", tasklist, 2)
+        assert "执行失败" not in output, output
+        assert saved_names(server, "/shared") == ["Show.S01E01.mp4", "Show.S01E02.mp4"]
+
+
+def test_recycle_page_cap():
+    with mock_server(max_page_size=20) as server:
+        fid = server.state.mkdir("/recycle")
+        fids = [server.state.add_file(fid, f"Show.S01E{i:02d}.mp4")["fid"] for i in range(1, 46)]
+        account = Quark("__uid=recycle;", 0)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                assert account.delete_permanently(fids) == 45, output.getvalue()
+        finally:
+            account.close()
+        assert server.state.recycle == []
+
+
+def test_share_gone_messages():
+    for code, message in (
+            (41006, "分享不存在或已失效"),
+            (None, "分享地址已失效"),
+            (None, "好友已取消了分享"),
+            (None, "文件已被分享者删除"),
+            (None, "文件涉及违规内容"),
+            (None, "分享者用户封禁链接查看受限"),
+    ):
+        assert quark_auto_save.is_share_gone(code, message), message
+    for code, message in (
+            (41012, "分享的stoken过期"),
+            (None, "stoken已失效"),
+            (None, "token已失效，请重新获取"),
+            (None, "登录已失效"),
+            (None, "请求过于频繁，请稍后再试"),
+            (None, "HTTP 502"),
+            (None, None),
+    ):
+        assert not quark_auto_save.is_share_gone(code, message), message
+
+
+def test_rename():
+    with mock_server() as server:
+        server.state.add_share("rename", ["a_old.mp4"])
+        fid = server.state.mkdir("/rename")
+        server.state.add_file(fid, "b_old.mp4")
+        task = dict(make_task("rename", "/rename"), pattern=r"^(.*)_old\.mp4$", replace=r"\1.mp4")
+        quark_auto_save.CONFIG_DATA["rename_dry_run"] = True
+        try:
+            output = run_save("__uid=rename;", task)
+        finally:
+            quark_auto_save.CONFIG_DATA.pop("rename_dry_run")
+        assert "[预演] 重命名：/rename b_old.mp4 → b.mp4" in output, output
+        assert saved_names(server, "/rename") == ["a_old.mp4", "b_old.mp4"]
+        run_save("__uid=rename;", task)
+        assert saved_names(server, "/rename") == ["a.mp4", "b.mp4"]
+
+        sub_fid = server.state.mkdir("/rename/old/sub")
+        folder_task = dict(make_task("rename", "/rename"), pattern="^old$", replace="new")
+        account = Quark("__uid=rename;", 0)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert account.do_rename_task(folder_task)
+            assert account.get_cached_savepath_fid("/rename/old/sub") is None
+            assert account.get_cached_savepath_fid("/rename/new/sub") == sub_fid
+        finally:
+            account.close()
+
+
+def test_stream_listing():
+    fetched = []
+
+    def fetch_page(page):
+        fetched.append(page)
+        # 第 3 页条数少于首页，按首页估算的页数之后逐页补齐
+        size = 5 if page == 3 else 20
+        items = [f"{page}-{i}" for i in range(size)] if page <= 11 else []
+        return {"code": 0, "data": {"list": items}, "metadata": {"_total": 205}}
+
+    assert list(islice(quark_http.iter_pages(fetch_page, max_workers=2), 25)) == (
+            [f"1-{i}" for i in range(20)] + [f"2-{i}" for i in range(5)]
+    )
+    assert max(fetched) <= 4, fetched
+    fetched.clear()
+    items = list(quark_http.iter_pages(fetch_page, max_workers=3))
+    assert len(items) == 205 and items[-1] == "11-19", len(items)
+    assert sorted(fetched) == list(range(1, 12)), fetched
+
+    with mock_server(max_page_size=20) as server:
+        names = [f"Show.S01E{i:03d}.mp4" for i in range(1, 121)]
+        server.state.add_share("stream", names, dir_name="Show")
+        output = run_save("__uid=stream;", make_task("stream", "/stream"))
+        assert "执行失败" not in output, output
+        assert saved_names(server, "/stream") == names
+
+
+def test_account_output():
+    first_printed = threading.Event()
+
+    def run_account(account):
+        print(f"账号{account.index}开始")
+        if account.index == 1:
+            first_printed.set()
+            quark_auto_save.add_notify("账号1通知")
+            return account.index
+        # 第一个账号的输出未缓冲，其他账号执行中即可看到
+        assert first_printed.wait(5)
+        assert "账号1开始" in output.getvalue()
+        if account.index == 3:
+            raise RuntimeError("账号3出错")
+        return account.index
+
+    accounts = [types.SimpleNamespace(index=index) for index in (1, 2, 3)]
+    notifys = list(quark_auto_save.NOTIFYS)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        results = quark_auto_save.run_accounts(run_account, accounts, max_workers=3)
+    quark_auto_save.NOTIFYS[:] = notifys
+    lines = output.getvalue().splitlines()
+    assert results == [1, 2, None], results
+    assert lines.index("账号1开始") < lines.index("账号2开始") < lines.index("账号3开始"), lines
+    assert "RuntimeError: 账号3出错" in output.getvalue(), lines
+
+
+if __name__ == "__main__":
+    for test in (
+            test_stoken_refresh,
+            test_page_cap,
+            test_snapshot_skip,
+            test_async_shared_savepath,
+            test_recycle_page_cap,
+            test_share_gone_messages,
+            test_rename,
+            test_stream_listing,
+            test_account_output,
+    ):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,133 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TMDB 搜索结果缓存
+功能：以 SQLite 文件保存 TMDB 搜索接口的结果，按 (搜索词, 媒体类型, 语言) 区分，
+     支持过期时间；没有结果的搜索也缓存（时间较短），重启后仍可复用
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import quark_cache
+
+# 是否启用 TMDB 缓存
+TMDB_CACHE = os.environ.get("TMDB_CACHE", "true").lower() == "true"
+# 缓存文件路径，默认 {QUARK_CACHE_DIR}/tmdb.db
+TMDB_CACHE_PATH = os.environ.get("TMDB_CACHE_PATH", "")
+# 有结果的缓存保存时间（秒）
+TMDB_CACHE_TTL = int(os.environ.get("TMDB_CACHE_TTL", str(7 * 24 * 3600)))
+# 没有结果的缓存保存时间（秒），新上映的影视可能稍后才能搜到
+TMDB_CACHE_NEGATIVE_TTL = int(os.environ.get("TMDB_CACHE_NEGATIVE_TTL", str(24 * 3600)))
+
+# 进程内共享的 TmdbCache，打开失败时为 False
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """搜索词去掉首尾和重复的空白并转为小写（TMDB 搜索不区分大小写）"""
+    return " ".join(str(query).split()).lower()
+
+
+class TmdbCache:
+    """
+    TMDB 搜索结果缓存
+
+    表 tmdb_search：(query, media_type, language) 为主键，results 为接口返回的 results 列表（JSON），
+    expire 为过期时间戳。过期的条目读取时视为不存在，写入新结果时覆盖，purge() 统一清理。
+    """
+
+    def __init__(self, path, ttl=None, negative_ttl=None):
+        """
+        :param path: SQLite 文件路径
+        :param ttl: 有结果的缓存秒数，默认 TMDB_CACHE_TTL
+        :param negative_ttl: 没有结果的缓存秒数，默认 TMDB_CACHE_NEGATIVE_TTL
+        """
+        self.path = path
+        self.ttl = TMDB_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = TMDB_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 同一连接在多个线程中使用，由 _lock 保证串行
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            # WAL 模式下 Web 服务和定时任务等多个进程可同时读写
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tmdb_search (
+                    query TEXT NOT NULL,
+                    media_type TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    results TEXT NOT NULL,
+                    expire REAL NOT NULL,
+                    create_time REAL NOT NULL,
+                    PRIMARY KEY (query, media_type, language)
+                )
+                """
+            )
+            self.conn.commit()
+
+    def get(self, query, media_type, language):
+        """
+        :return: 缓存的 results 列表（没有结果时为空列表），未缓存或已过期返回 None
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT results FROM tmdb_search WHERE query = ? AND media_type = ? AND language = ? AND expire >= ?",
+                (normalize_query(query), media_type, language, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, query, media_type, language, results):
+        """保存搜索结果，results 为空时按 negative_ttl 缓存"""
+        now = time.time()
+        ttl = self.ttl if results else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tmdb_search (query, media_type, language, results, expire, create_time) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    normalize_query(query),
+                    media_type,
+                    language,
+                    json.dumps(results or [], ensure_ascii=False),
+                    now + ttl,
+                    now,
+                ),
+            )
+            self.conn.commit()
+
+    def purge(self):
+        """删除已过期的条目，返回删除数"""
+        with self._lock:
+            count = self.conn.execute("DELETE FROM tmdb_search WHERE expire < ?", (time.time(),)).rowcount
+            self.conn.commit()
+        return count
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def get_tmdb_cache():
+    """获取进程内共享的 TMDB 缓存，未启用或打开失败时返回 None"""
+    global _cache
+    if not TMDB_CACHE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = TMDB_CACHE_PATH or os.path.join(quark_cache.QUARK_CACHE_DIR, "tmdb.db")
+            try:
+                _cache = TmdbCache(path)
+                _cache.purge()
+            except Exception as e:
+                print(f"⚠️ 打开 TMDB 缓存失败，不使用缓存: {path} {e}")
+                # 不再重复尝试
+                _cache = False
+        return _cache or None